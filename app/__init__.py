@@ -30,29 +30,51 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Снимок пользователя из кэша (без SELECT на каждый запрос), см. app/user_cache.py
+        from app.user_cache import user_cache
+        return user_cache.load(int(user_id))
 
     # Context processor для счетчиков в навбаре
     @app.context_processor
     def inject_counters():
-        from app.models import News, Idea
+        from app.counters import navbar_counters
         from app.utils import mask_email, mask_phone, mask_site, format_price
         from app.mssql import mssql
+        from app.result_cache import result_cache
+        from app.metrics import metrics
         return {
-            'news_count': News.query.filter_by(is_published=True).count(),
-            'ideas_count': Idea.query.filter_by(status='approved').count(),
+            # Ленивые значения из кэша - COUNT выполняется только если шаблон их выводит
+            'news_count': navbar_counters.lazy('news'),
+            'ideas_count': navbar_counters.lazy('ideas'),
             'mask_email': mask_email,
             'mask_phone': mask_phone,
             'mask_site': mask_site,
             'format_price': format_price,
-            'mssql_stats': mssql.query_stats
+            'mssql_stats': metrics.summary(),
+            'mssql_pool_stats': mssql.get_pool_stats(),
+            'result_cache_stats': result_cache.get_stats()
         }
 
+    # Server-Timing: фазы запроса (MSSQL, база приложения, шаблоны) в заголовке ответа
+    from app import server_timing
+    server_timing.init_app(app)
+
     from app.routes import main, auth, payment
     app.register_blueprint(main.bp)
     app.register_blueprint(auth.bp)
     app.register_blueprint(payment.bp)
 
+    # MSSQL недоступен / таймаут: страница 503 с Retry-After вместо трассировки
+    from app.mssql import MSSQLError
+
+    @app.errorhandler(MSSQLError)
+    def mssql_unavailable(error):
+        from flask import render_template
+        retry_after = error.retry_after or 30
+        response = app.make_response((render_template('error_503.html', retry_after=retry_after), 503))
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
     # Роут для favicon в корне сайта
     @app.route('/favicon.ico')
     def favicon():
@@ -67,6 +89,7 @@ def create_app():
         response.headers['Content-Type'] = response.headers.get('Content-Type', 'text/html; charset=utf-8')
         if 'charset' not in response.headers.get('Content-Type', ''):
             response.headers['Content-Type'] += '; charset=utf-8'
+        server_timing.apply(response)
         return response
 
     return app
@@ -0,0 +1,145 @@
+"""
+Кэши в памяти процесса (общие для всех потоков waitress)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей
+
+    Args:
+        maxsize: максимальный суммарный вес записей (по умолчанию вес записи = 1,
+                 т.е. это количество записей). При переполнении вытесняются
+                 давно не использованные записи
+        ttl: время жизни записи в секундах
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, weight, value), от старых к новым
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats['misses'] += 1
+                return default
+            expires_at, weight, value = item
+            if expires_at < time.time():
+                self._remove(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key, value, ttl=None, weight=1):
+        if weight > self.maxsize:
+            # Запись больше всего кэша - не кэшируем, чтобы не вытеснить все остальное
+            return
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, weight, value)
+            self._weight += weight
+            while self._weight > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({'size': len(self._data), 'weight': self._weight, 'maxsize': self.maxsize})
+        return stats
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def _remove(self, key):
+        """Удалить запись (под блокировкой)"""
+        _, weight, _ = self._data.pop(key)
+        self._weight -= weight
+
+
+class WatermarkTracker:
+    """Отметки MAX(id) таблиц с ограничением частоты проверки
+
+    Кэши сравнивают сохраненную отметку с текущей: если в таблице появились
+    новые записи, закэшированные результаты считаются устаревшими.
+    Отметку таблицы одновременно обновляет только один поток: остальные в это
+    время получают последнюю известную отметку (или ждут первую).
+
+    Args:
+        interval: как часто (сек) реально запрашивать MAX(id) у сервера
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._marks = {}  # table -> (checked_at, value)
+        self._pending = {}  # table -> Event идущего обновления
+        self._lock = threading.Lock()
+
+    def get(self, table, fetch, blocking=True):
+        """Текущая отметка таблицы; fetch() вызывается не чаще interval секунд
+
+        Args:
+            blocking: False - не вызывать fetch: вернуть отметку, проверенную
+                      в пределах interval, иначе None
+        """
+        now = time.time()
+        with self._lock:
+            checked = self._marks.get(table)
+            if checked and now - checked[0] < self.interval:
+                return checked[1]
+            if not blocking:
+                return None
+            pending = self._pending.get(table)
+            if pending is None:
+                pending = self._pending[table] = threading.Event()
+                owner = True
+            elif checked:
+                # Отметку уже обновляет другой поток - не ждем его
+                return checked[1]
+            else:
+                owner = False
+
+        if not owner:
+            pending.wait()
+            with self._lock:
+                checked = self._marks.get(table)
+            return checked[1] if checked else None
+
+        value = None
+        try:
+            value = fetch()
+        finally:
+            with self._lock:
+                if value is not None:
+                    self._marks[table] = (now, value)
+                self._pending.pop(table, None)
+            pending.set()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._marks.clear()
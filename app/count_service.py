@@ -0,0 +1,126 @@
+"""
+Сервис подсчета общего количества записей (total для пагинации)
+
+SELECT COUNT(*) по 18.7 млн строк zakupki часто дороже самой страницы,
+поэтому количество:
+- кэшируется по нормализованной сигнатуре фильтра и сбрасывается, когда меняется MAX(id);
+- для страниц без фильтров берется из каталога (sys.partitions) - приблизительно, но мгновенно;
+- для фильтров считается только до порога ("более 10 000").
+"""
+import os
+from datetime import date, datetime
+
+from app.cache import TTLCache, WatermarkTracker
+
+
+def normalize_filter_value(value):
+    """Привести параметр фильтра к виду, пригодному для ключа кэша"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        # LIKE в MSSQL регистронезависим (CI collation) - 'Бумага' и 'бумага' дают одно количество
+        return value.strip().lower()
+    return value
+
+
+def filter_signature(table, where_clauses, params):
+    """Нормализованная сигнатура фильтра: таблица + условия + значения параметров"""
+    clauses = tuple(' '.join(clause.split()) for clause in where_clauses)
+    values = tuple(normalize_filter_value(p) for p in params)
+    return (table, clauses, values)
+
+
+class CountService:
+    """Кэшированный подсчет количества записей
+
+    Args:
+        ttl: время жизни закэшированного количества (сек)
+        cap: порог для подсчета с фильтрами - дальше "более cap" (0 - считать точно)
+        approximate: брать количество без фильтров из каталога sys.partitions
+        watermark_interval: как часто проверять MAX(id) таблицы (сек)
+        watermarks: общий WatermarkTracker (если не задан - создается свой)
+    """
+
+    def __init__(self, ttl=300.0, cap=10000, approximate=True, watermark_interval=5.0, maxsize=2048,
+                 watermarks=None):
+        self.cap = cap
+        self.approximate = approximate
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.watermarks = watermarks or WatermarkTracker(watermark_interval)
+
+    @classmethod
+    def from_env(cls, watermarks=None):
+        return cls(
+            ttl=float(os.getenv('MSSQL_COUNT_CACHE_TTL', '300')),
+            cap=int(os.getenv('MSSQL_COUNT_CAP', '10000')),
+            approximate=os.getenv('MSSQL_COUNT_APPROXIMATE', '1') == '1',
+            watermark_interval=float(os.getenv('MSSQL_COUNT_WATERMARK_INTERVAL', '5')),
+            watermarks=watermarks,
+        )
+
+    def count(self, cursor, table, alias, where_clauses, params):
+        """Получить количество записей таблицы по фильтру
+
+        Args:
+            cursor: курсор pymssql (as_dict=True) на уже открытом подключении
+            table: имя таблицы (zakupki, db_companies)
+            alias: псевдоним таблицы в условиях (z, c)
+            where_clauses: список SQL условий
+            params: параметры условий
+
+        Returns:
+            dict: {'total': int, 'approximate': bool, 'capped': bool}
+        """
+        key = filter_signature(table, where_clauses, params)
+        watermark = self.get_watermark(cursor, table)
+
+        cached = self._cache.get(key)
+        if cached is not None and cached['watermark'] == watermark:
+            return cached['result']
+
+        where_sql = ""
+        if where_clauses:
+            where_sql = "WHERE " + " AND ".join(where_clauses)
+
+        if not where_clauses and self.approximate:
+            # Количество строк из метаданных - без чтения таблицы
+            cursor.execute("""
+                SELECT SUM(p.rows) as total
+                FROM sys.partitions p
+                WHERE p.object_id = OBJECT_ID(%s) AND p.index_id IN (0, 1)
+            """, (table,))
+            row = cursor.fetchone()
+            result = {'total': int(row['total'] or 0), 'approximate': True, 'capped': False}
+        elif where_clauses and self.cap:
+            # Считаем не дальше cap + 1 строки: этого достаточно, чтобы показать "более cap"
+            cursor.execute(f"""
+                SELECT COUNT(*) as total FROM (
+                    SELECT TOP (%s) 1 as x FROM {table} {alias} {where_sql}
+                ) t
+            """, tuple([self.cap + 1] + list(params)))
+            total = cursor.fetchone()['total']
+            if total > self.cap:
+                result = {'total': self.cap, 'approximate': False, 'capped': True}
+            else:
+                result = {'total': total, 'approximate': False, 'capped': False}
+        else:
+            cursor.execute(f"SELECT COUNT(*) as total FROM {table} {alias} {where_sql}", tuple(params))
+            result = {'total': cursor.fetchone()['total'], 'approximate': False, 'capped': False}
+
+        self._cache.set(key, {'watermark': watermark, 'result': result})
+        return result
+
+    def get_watermark(self, cursor, table):
+        """MAX(id) таблицы - дешевый поиск по кластерному индексу, проверяется не чаще watermark_interval"""
+        def fetch():
+            cursor.execute(f"SELECT MAX(id) as max_id FROM {table}")
+            return cursor.fetchone()['max_id']
+
+        return self.watermarks.get(table, fetch)
+
+    def invalidate(self):
+        """Сбросить все закэшированные количества (например, после изменений через SQL консоль)"""
+        self._cache.clear()
+        self.watermarks.clear()
@@ -0,0 +1,112 @@
+"""
+Счетчики навбара (опубликованные новости, одобренные идеи)
+
+Раньше inject_counters выполнял два COUNT к базе приложения при каждом
+рендере шаблона - в том числе на страницах входа и ошибок. Теперь значения
+хранятся в памяти процесса: сбрасываются маршрутами, которые меняют новости
+и идеи (invalidate), и дополнительно устаревают по TTL. В шаблон передаются
+ленивые значения - запрос выполняется только если шаблон их выводит.
+"""
+import os
+import threading
+import time
+
+from app.models import News, Idea
+
+
+class NavbarCounters:
+    """Кэш счетчиков с ленивым вычислением
+
+    Args:
+        loaders: {имя: функция без аргументов -> int}
+        ttl: время жизни значения (сек) на случай изменений в обход invalidate
+    """
+
+    def __init__(self, loaders, ttl=60.0):
+        self.loaders = loaders
+        self.ttl = ttl
+        self._values = {}  # имя -> (expires_at, значение)
+        self._versions = {}  # имя -> номер версии, растет при invalidate
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @classmethod
+    def from_env(cls, loaders):
+        return cls(loaders, ttl=float(os.getenv('NAVBAR_COUNTERS_TTL', '60')))
+
+    def get(self, name):
+        with self._lock:
+            item = self._values.get(name)
+            if item is not None and item[0] > time.time():
+                self.stats['hits'] += 1
+                return item[1]
+            self.stats['misses'] += 1
+            version = self._versions.get(name, 0)
+
+        value = self.loaders[name]()
+
+        with self._lock:
+            # Если пока считали, значение сбросили - не кэшируем возможно устаревший результат
+            if self._versions.get(name, 0) == version:
+                self._values[name] = (time.time() + self.ttl, value)
+        return value
+
+    def lazy(self, name):
+        """Значение для шаблона: считается при первом выводе"""
+        return LazyCounter(lambda: self.get(name))
+
+    def invalidate(self, *names):
+        """Сбросить счетчики (все, если имена не заданы) после изменения данных"""
+        with self._lock:
+            for name in names or list(self.loaders):
+                self._values.pop(name, None)
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+
+class LazyCounter:
+    """Число, которое вычисляется при первом обращении (вывод, сравнение, арифметика)"""
+
+    def __init__(self, compute):
+        self._compute = compute
+        self._value = None
+        self._computed = False
+
+    @property
+    def value(self):
+        if not self._computed:
+            self._value = self._compute()
+            self._computed = True
+        return self._value
+
+    def __str__(self):
+        return str(self.value)
+
+    def __html__(self):
+        return str(self.value)
+
+    def __int__(self):
+        return int(self.value)
+
+    def __bool__(self):
+        return bool(self.value)
+
+    def __eq__(self, other):
+        return self.value == other
+
+    def __lt__(self, other):
+        return self.value < other
+
+    def __gt__(self, other):
+        return self.value > other
+
+    def __add__(self, other):
+        return self.value + other
+
+    def __hash__(self):
+        return hash(self.value)
+
+
+navbar_counters = NavbarCounters.from_env({
+    'news': lambda: News.query.filter_by(is_published=True).count(),
+    'ideas': lambda: Idea.query.filter_by(status='approved').count(),
+})
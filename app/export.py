@@ -0,0 +1,267 @@
+"""
+Экспорт выборок MSSQL в файлы
+
+Строки читаются порциями (mssql.iter_zakupki / iter_companies), в памяти одновременно
+находится только одна порция, ограничения на количество строк нет.
+XLSX пишется write-only книгой openpyxl во временный файл (openpyxl собирает
+zip только после завершения листа), поэтому скачивание XLSX начинается после
+построения всей книги; файл отдается клиенту частями и удаляется при закрытии
+ответа. Потоковые форматы - CSV и NDJSON (для интеграций): они отдаются сразу
+по мере чтения порций, при поддержке клиентом - со сжатием gzip.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+
+from flask import Response
+from openpyxl import Workbook
+
+from app.utils import mask_email, mask_phone, mask_site
+
+# Размер порции строк из MSSQL и размер куска HTTP ответа
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+CHUNK_SIZE = 64 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+ZAKUPKI_HEADERS = ['Дата запроса', 'Товар/услуга', 'Цена контракта', 'Покупатель', 'Email', 'Телефон', 'Адрес']
+# Имена полей тех же колонок для NDJSON
+ZAKUPKI_FIELDS = ['date_request', 'purchase_object', 'price', 'customer', 'email', 'phone', 'address']
+
+# Дополнительная колонка выгрузки закупок с позициями спецификации (specs=1)
+SPECIFICATIONS_HEADER = 'Спецификация'
+SPECIFICATIONS_FIELD = 'specifications'
+
+COMPANIES_HEADERS = ['Компания', 'Рубрика', 'Подрубрика', 'Город', 'Телефон', 'Email', 'Сайт', 'ИНН', 'ОГРН', 'Директор']
+COMPANIES_FIELDS = ['company', 'rubric', 'subrubric', 'city', 'phone', 'email', 'site', 'inn', 'ogrn', 'director']
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'ndjson')
+
+
+def zakupki_export_row(row):
+    """Строка get_zakupki -> значения колонок ZAKUPKI_HEADERS"""
+    # Используем start_cost_var если есть, иначе числовой start_cost
+    price = row.get('start_cost_var') or (str(row['start_cost']) if row.get('start_cost') else '')
+
+    return [
+        row['date_request'].strftime('%d.%m.%Y') if row['date_request'] else '',
+        row['purchase_object'],
+        price,
+        row['customer'],
+        row['email'],
+        row['phone'],
+        row['address']
+    ]
+
+
+def format_specifications(specifications):
+    """Позиции спецификации одной строкой: 'Товар - количество - цена; ...'"""
+    items = []
+    for spec in specifications or []:
+        parts = [spec.get('product') or spec.get('product_specification') or '-']
+        if spec.get('quantity'):
+            parts.append(str(spec['quantity']))
+        if spec.get('price_vat'):
+            parts.append(str(spec['price_vat']))
+        items.append(' - '.join(parts))
+    return '; '.join(items)
+
+
+def zakupki_export_row_with_specifications(row):
+    """Колонки zakupki_export_row + позиции спецификации"""
+    return zakupki_export_row(row) + [format_specifications(row.get('specifications'))]
+
+
+def zakupki_export_columns(include_specifications=False):
+    """Заголовки, имена полей и функция строки для выгрузки закупок
+
+    Returns:
+        tuple: (headers, fields, convert)
+    """
+    if include_specifications:
+        return (ZAKUPKI_HEADERS + [SPECIFICATIONS_HEADER], ZAKUPKI_FIELDS + [SPECIFICATIONS_FIELD],
+                zakupki_export_row_with_specifications)
+    return ZAKUPKI_HEADERS, ZAKUPKI_FIELDS, zakupki_export_row
+
+
+def with_specifications(rows, fetch_batch, batch_size=EXPORT_BATCH_SIZE):
+    """Добавить к строкам закупок row['specifications'] - один запрос на порцию строк
+
+    Args:
+        fetch_batch: функция (список id) -> {id: [спецификации]}, обычно mssql.get_specifications_batch
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from _attach_specifications(batch, fetch_batch)
+            batch = []
+    if batch:
+        yield from _attach_specifications(batch, fetch_batch)
+
+
+def _attach_specifications(batch, fetch_batch):
+    specifications = fetch_batch([row['id'] for row in batch])
+    for row in batch:
+        row = dict(row)
+        row['specifications'] = specifications.get(row['id'], [])
+        yield row
+
+
+def companies_export_row(row, masked=False):
+    """Строка get_companies -> значения колонок COMPANIES_HEADERS
+
+    masked: маскировать телефон, email и сайт (как на странице предприятий без положительного баланса)
+    """
+    phone = row.get('phone') or row.get('mobile_phone')
+    email = row.get('Email')
+    site = row.get('site')
+    if masked:
+        phone = mask_phone(phone)
+        email = mask_email(email)
+        site = mask_site(site)
+
+    return [
+        row['company'],
+        row.get('rubric'),
+        row.get('subrubric'),
+        row.get('city'),
+        phone,
+        email,
+        site,
+        row.get('inn'),
+        row.get('ogrn'),
+        row.get('director')
+    ]
+
+
+def write_xlsx(path, title, headers, rows, convert):
+    """Записать строки в XLSX файл write-only книгой (память не растет с числом строк)
+
+    Returns:
+        int: количество записанных строк (без заголовка)
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title)
+    ws.append(headers)
+
+    count = 0
+    for row in rows:
+        ws.append(convert(row))
+        count += 1
+
+    wb.save(path)
+    return count
+
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Отдать файл кусками"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def xlsx_response(title, headers, rows, convert, download_name):
+    """HTTP ответ с XLSX файлом, построенным из итератора строк
+
+    Книга строится целиком до ответа. Временный файл удаляется при закрытии ответа -
+    в том числе если тело не читалось (HEAD, обрыв соединения до первого куска).
+    """
+    fd, path = tempfile.mkstemp(prefix='export_', suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_xlsx(path, title, headers, rows, convert)
+    except Exception:
+        os.remove(path)
+        raise
+
+    response = Response(
+        iter_file_chunks(path),
+        mimetype=XLSX_MIMETYPE,
+        headers={
+            'Content-Disposition': f'attachment; filename={download_name}',
+            'Content-Length': str(os.path.getsize(path))
+        },
+        direct_passthrough=True
+    )
+    response.call_on_close(lambda: _remove_file(path))
+    return response
+
+
+def iter_csv(headers, rows, convert, batch_size=EXPORT_BATCH_SIZE):
+    """CSV (UTF-8, разделитель ';' как в русской локали Excel) по мере чтения строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    writer.writerow(headers)
+
+    count = 0
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in convert(row)])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(fields, rows, convert, batch_size=EXPORT_BATCH_SIZE):
+    """NDJSON: один JSON объект на строку"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, convert(row))), ensure_ascii=False, default=str))
+        if len(lines) >= batch_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Сжать поток кусков в формат gzip на лету (без буферизации всего ответа)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # Z_SYNC_FLUSH - каждая порция уходит клиенту сразу, а не копится в буфере zlib
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_response(export_format, headers, fields, rows, convert, download_name, accept_gzip=False):
+    """HTTP ответ CSV / NDJSON, который начинает отдаваться сразу
+
+    Args:
+        accept_gzip: клиент поддерживает Content-Encoding: gzip
+    """
+    if export_format == 'csv':
+        chunks = iter_csv(headers, rows, convert)
+        mimetype = 'text/csv'
+    else:
+        chunks = iter_ndjson(fields, rows, convert)
+        mimetype = 'application/x-ndjson'
+
+    response_headers = {
+        'Content-Disposition': f'attachment; filename={download_name}',
+        'Vary': 'Accept-Encoding'
+    }
+    if accept_gzip:
+        chunks = gzip_chunks(chunks)
+        response_headers['Content-Encoding'] = 'gzip'
+
+    return Response(chunks, mimetype=mimetype, headers=response_headers, direct_passthrough=True)
@@ -0,0 +1,247 @@
+"""
+Фоновые задания экспорта
+
+Длинная выгрузка больше не занимает поток waitress: запрос только ставит
+задание в очередь и сразу получает его id. Файл пишется на диск
+ограниченным пулом потоков, ход выполнения (строк записано, оценка
+оставшегося времени) доступен по id задания, готовый файл отдается через
+send_file и удаляется по истечении срока хранения (проверка - в фоновом
+потоке каждые cleanup_interval секунд, даже если новых заданий нет).
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.export import XLSX_MIMETYPE, iter_csv, iter_ndjson, write_xlsx
+
+EXPORT_MIMETYPES = {
+    'xlsx': XLSX_MIMETYPE,
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportQueueFull(Exception):
+    """Слишком много незавершенных заданий экспорта"""
+    pass
+
+
+class ExportJob:
+    """Задание экспорта и его состояние"""
+
+    def __init__(self, user_id, export_format, title, headers, fields, convert, rows_factory,
+                 count_factory, download_name):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.format = export_format
+        self.title = title
+        self.headers = headers
+        self.fields = fields
+        self.convert = convert
+        self.rows_factory = rows_factory
+        self.count_factory = count_factory
+        self.download_name = download_name
+
+        self.status = 'queued'  # queued | running | done | failed
+        self.rows = 0
+        self.total = None
+        self.total_capped = False
+        self.error = None
+        self.path = None
+        self.size = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def mimetype(self):
+        return EXPORT_MIMETYPES[self.format]
+
+    def eta(self):
+        """Оценка оставшегося времени (сек) по текущей скорости, None если неизвестно"""
+        if self.status != 'running' or not self.total or self.total_capped or not self.rows:
+            return None
+        elapsed = time.time() - self.started_at
+        rate = self.rows / elapsed if elapsed > 0 else 0
+        if not rate:
+            return None
+        return max(0.0, (self.total - self.rows) / rate)
+
+    def to_dict(self):
+        progress = None
+        if self.status == 'done':
+            progress = 100
+        elif self.total and not self.total_capped:
+            progress = min(99, int(self.rows * 100 / self.total))
+
+        end = self.finished_at or time.time()
+        eta = self.eta()
+        return {
+            'id': self.id,
+            'status': self.status,
+            'format': self.format,
+            'rows': self.rows,
+            'total': self.total,
+            'total_capped': self.total_capped,
+            'progress': progress,
+            'eta': round(eta, 1) if eta is not None else None,
+            'elapsed': round(end - self.started_at, 1) if self.started_at else 0,
+            'size': self.size,
+            'error': self.error,
+        }
+
+
+class ExportJobManager:
+    """Очередь заданий экспорта с ограниченным пулом потоков
+
+    Args:
+        directory: каталог для готовых файлов
+        workers: количество одновременно выполняемых заданий
+        max_pending: максимум заданий в очереди и в работе (защита от перегрузки MSSQL)
+        retention: сколько секунд хранить готовый файл
+        cleanup_interval: как часто (сек) удалять файлы с истекшим сроком хранения
+    """
+
+    def __init__(self, directory, workers=2, max_pending=10, retention=3600.0, cleanup_interval=60.0):
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.cleanup_interval = cleanup_interval
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.getenv('EXPORT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'xbmc_exports')),
+            workers=int(os.getenv('EXPORT_JOBS_WORKERS', '2')),
+            max_pending=int(os.getenv('EXPORT_JOBS_MAX_PENDING', '10')),
+            retention=float(os.getenv('EXPORT_JOBS_RETENTION', '3600')),
+        )
+
+    def submit(self, user_id, export_format, title, headers, fields, convert, rows_factory,
+               count_factory=None, download_name=None):
+        """Поставить экспорт в очередь
+
+        Args:
+            rows_factory: функция без аргументов, возвращающая итератор строк
+                          (вызывается в рабочем потоке)
+            count_factory: функция без аргументов -> (total, capped) для прогресса
+        Returns:
+            ExportJob
+        Raises:
+            ExportQueueFull: если незавершенных заданий уже max_pending
+        """
+        self.cleanup()
+
+        job = ExportJob(user_id, export_format, title, headers, fields, convert, rows_factory,
+                        count_factory, download_name or f'export.{export_format}')
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise ExportQueueFull(f"Export queue is full ({pending} jobs)")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export')
+                threading.Thread(target=self._cleanup_loop, name='export-cleanup', daemon=True).start()
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{job.id}.{job.format}')
+
+        if job.count_factory is not None:
+            # Количество нужно только для процента и ETA - без него задание пишет файл дальше
+            try:
+                job.total, job.total_capped = job.count_factory()
+            except Exception as e:
+                print(f"Export job {job.id} count failed: {e}")
+
+        try:
+            rows = self._counted(job, job.rows_factory())
+            if job.format == 'xlsx':
+                write_xlsx(path, job.title, job.headers, rows, job.convert)
+            else:
+                if job.format == 'csv':
+                    chunks = iter_csv(job.headers, rows, job.convert)
+                else:
+                    chunks = iter_ndjson(job.fields, rows, job.convert)
+                with open(path, 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+
+            job.path = path
+            job.size = os.path.getsize(path)
+            job.status = 'done'
+        except Exception as e:
+            print(f"Export job {job.id} failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            job.finished_at = time.time()
+            # Итератор строк и функции выборки больше не нужны
+            job.rows_factory = job.count_factory = None
+
+    @staticmethod
+    def _counted(job, rows):
+        for row in rows:
+            yield row
+            job.rows += 1
+
+    def cleanup(self):
+        """Удалить задания и файлы старше срока хранения (в т.ч. оставшиеся от прошлого запуска)"""
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished_at and now - job.finished_at > self.retention]
+            for job in expired:
+                del self._jobs[job.id]
+            known = {os.path.basename(job.path) for job in self._jobs.values() if job.path}
+
+        for job in expired:
+            if job.path and os.path.exists(job.path):
+                os.remove(job.path)
+
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name not in known and now - os.path.getmtime(path) > self.retention:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _cleanup_loop(self):
+        while True:
+            time.sleep(self.cleanup_interval)
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"Export cleanup failed: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        stats = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for job in jobs:
+            stats[job.status] += 1
+        return stats
+
+
+export_jobs = ExportJobManager.from_env()
@@ -0,0 +1,236 @@
+"""
+Метрики запросов к MSSQL (для админов)
+
+Вместо общего словаря query_stats, который потоки waitress меняли без
+блокировки, каждый метод MSSQLConnection пишет время выполнения в
+потокобезопасную гистограмму: отдельно всего (total) и по фазам -
+получение подключения (connect), подсчет количества (count), выборка
+строк (fetch). Кроме времени считаются строки и ошибки.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы корзин гистограммы, мс (последняя корзина - все, что больше)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+PHASES = ('total', 'connect', 'count', 'fetch')
+
+
+class LatencyHistogram:
+    """Гистограмма времени выполнения с фиксированными корзинами
+
+    Память не зависит от количества наблюдений, перцентили оцениваются
+    интерполяцией внутри корзины. Не потокобезопасна - защищается владельцем.
+    """
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Оценка q-го перцентиля (0..100), мс"""
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            if seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                fraction = (rank - seen) / bucket_count
+                return lower + (upper - lower) * fraction
+            seen += bucket_count
+        return self.max
+
+
+class Metrics:
+    """Реестр метрик: (метод, фаза) -> гистограмма, строки, ошибки"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._summary = {'total_queries': 0, 'total_time': 0.0, 'last_query_time': 0.0, 'connection_time': 0.0}
+        self.started_at = time.time()
+        # Функции (phase, мс), которые получают каждый замер фазы (например, Server-Timing текущего запроса)
+        self.listeners = []
+
+    def timed(self, method):
+        """Декоратор метода: время total, количество строк результата, ошибки
+
+        Вложенные вызовы (например, get_specifications -> get_specifications_batch)
+        пишутся каждый в свою серию; фазы относятся к самому внутреннему методу.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                stack = self._stack()
+                top_level = not stack
+                stack.append(method)
+                start = time.perf_counter()
+                failed = False
+                result = None
+                try:
+                    result = func(*args, **kwargs)
+                    return result
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    elapsed = (time.perf_counter() - start) * 1000
+                    stack.pop()
+                    if isinstance(result, dict) and result.get('success') is False:
+                        failed = True
+                    self.observe(method, 'total', elapsed, rows=_count_rows(result), error=failed)
+                    if top_level:
+                        with self._lock:
+                            self._summary['total_queries'] += 1
+                            self._summary['total_time'] += elapsed
+                            self._summary['last_query_time'] = elapsed
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def phase(self, phase):
+        """Замер фазы текущего метода: with metrics.phase('count'): ..."""
+        method = self.current_method()
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.observe(method, phase, elapsed, error=failed)
+            if phase == 'connect':
+                with self._lock:
+                    self._summary['connection_time'] = elapsed
+            for listener in self.listeners:
+                listener(phase, elapsed)
+
+    def observe(self, method, phase, value, rows=None, error=False):
+        with self._lock:
+            series = self._series.get((method, phase))
+            if series is None:
+                series = {'histogram': LatencyHistogram(self.buckets), 'rows': 0, 'errors': 0}
+                self._series[(method, phase)] = series
+            series['histogram'].observe(value)
+            if rows:
+                series['rows'] += rows
+            if error:
+                series['errors'] += 1
+
+    def error(self, phase='total'):
+        """Учесть ошибку текущего метода без замера времени (например, нет подключения)"""
+        method = self.current_method()
+        with self._lock:
+            series = self._series.get((method, phase))
+            if series is None:
+                series = {'histogram': LatencyHistogram(self.buckets), 'rows': 0, 'errors': 0}
+                self._series[(method, phase)] = series
+            series['errors'] += 1
+
+    def current_method(self):
+        stack = self._stack()
+        return stack[-1] if stack else 'other'
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def snapshot(self):
+        """Метрики по методам для админ-страницы
+
+        Returns:
+            list: [{'method', 'phases': {phase: {...}}, 'calls', 'errors', 'rows'}] по убыванию общего времени
+        """
+        with self._lock:
+            items = [(key, series['histogram'], series['rows'], series['errors'])
+                     for key, series in self._series.items()]
+            methods = {}
+            for (method, phase), hist, rows, errors in items:
+                methods.setdefault(method, {})[phase] = {
+                    'count': hist.count,
+                    'errors': errors,
+                    'rows': rows,
+                    'avg': hist.total / hist.count if hist.count else 0.0,
+                    'p50': hist.percentile(50),
+                    'p95': hist.percentile(95),
+                    'p99': hist.percentile(99),
+                    'max': hist.max,
+                    'last': hist.last,
+                    'sum': hist.total,
+                }
+
+        result = []
+        for method, phases in methods.items():
+            total = phases.get('total', {})
+            result.append({
+                'method': method,
+                'phases': [(phase, phases[phase]) for phase in _ordered_phases(phases)],
+                'calls': total.get('count', 0),
+                'errors': sum(p['errors'] for p in phases.values()),
+                'rows': total.get('rows', 0),
+                'sum': total.get('sum', 0.0),
+            })
+        result.sort(key=lambda item: item['sum'], reverse=True)
+        return result
+
+    def summary(self):
+        """Краткая сводка для панели админа в base.html"""
+        with self._lock:
+            return dict(self._summary)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._summary = {'total_queries': 0, 'total_time': 0.0, 'last_query_time': 0.0, 'connection_time': 0.0}
+            self.started_at = time.time()
+
+
+def _ordered_phases(phases):
+    """Сначала известные фазы в порядке PHASES, затем остальные по алфавиту"""
+    return [p for p in PHASES if p in phases] + sorted(p for p in phases if p not in PHASES)
+
+
+def _count_rows(result):
+    """Количество строк в результате метода MSSQLConnection"""
+    if isinstance(result, dict):
+        if isinstance(result.get('data'), list):
+            return len(result['data'])
+        if isinstance(result.get('rowcount'), int):
+            return result['rowcount']
+        return None
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+metrics = Metrics()
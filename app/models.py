@@ -108,3 +108,24 @@ class EmailVerification(db.Model):
 
     def __repr__(self):
         return f'<EmailVerification {self.verification_type} for User {self.user_id}>'
+
+
+class SQLQueryHistory(db.Model):
+    """История запросов консоли SQL (админы)"""
+    __tablename__ = 'sql_query_history'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    query_text = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='running')  # running, done, failed, canceled
+    rowcount = db.Column(db.Integer, nullable=True)  # строк первой страницы / затронуто DML
+    has_more = db.Column(db.Boolean, default=False)
+    duration_ms = db.Column(db.Float, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User', backref='sql_queries')
+
+    def __repr__(self):
+        return f'<SQLQueryHistory {self.id} {self.status}>'
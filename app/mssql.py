@@ -2,8 +2,53 @@ import pymssql
 import os
 import time
 from datetime import datetime
+from app.mssql_pool import ConnectionPool, PoolTimeout
+from app.mssql_breaker import (CircuitBreaker, GuardedConnection, MSSQLError, MSSQLTimeout,
+                               MSSQLUnavailable, translate_error)
+from app.mssql_replicas import ReplicaSet
+from app.count_service import CountService
+from app.cache import WatermarkTracker
+from app.search import ZakupkiSearch, classify_company_search
+from app.metrics import metrics
+from app.slow_query_log import SlowQueryLog
+from app import rows
+
+# Коды DB-Lib сбоев подключения, сети и таймаута. Остальные OperationalError
+# (деление на ноль, неверная колонка, deadlock...) - ошибки выполнения запроса
+CONNECTION_ERROR_CODES = (
+    20002,  # connection failed
+    20003,  # connection timed out
+    20004,  # read from the server failed
+    20006,  # write to the server failed
+    20009,  # unable to connect
+    20017,  # unexpected EOF from the server
+    20047,  # DBPROCESS is dead or not enabled
+)
+
+
+def is_connection_error(error):
+    """Ошибка драйвера означает сбой сервера или сети (а не ошибку в тексте запроса)"""
+    if isinstance(error, pymssql.InterfaceError):
+        return True
+    if isinstance(error, pymssql.OperationalError):
+        return bool(error.args) and error.args[0] in CONNECTION_ERROR_CODES
+    return False
+
 
 class MSSQLConnection:
+    # Колонки списка закупок (общие для постраничной выборки и выборки по списку id)
+    ZAKUPKI_COLUMNS = """
+                z.id,
+                z.created as date_request,
+                z.purchase_object,
+                z.start_cost_var,
+                z.start_cost,
+                z.customer,
+                isnull(z.email, z.additional_contacts) as email,
+                z.contact_number as phone,
+                z.post_address as address,
+                z.purchase_type"""
+
     def __init__(self):
         self.server = os.getenv('MSSQL_SERVER', '172.26.192.1')
         self.user = os.getenv('MSSQL_USER', 'sa')
@@ -13,70 +58,223 @@ class MSSQLConnection:
         # Пустой charset по умолчанию - pymssql автоматически определит кодировку
         # для каждого типа поля (nvarchar=UTF-16, varchar=cp1251 по collation)
         self.charset = os.getenv('MSSQL_CHARSET', '')
-
-        # Профилирование запросов (для админов)
-        self.query_stats = {
-            'total_queries': 0,
-            'total_time': 0,
-            'last_query_time': 0,
-            'connection_time': 0
+        # Таймауты (сек): подключения и выполнения запроса (0 - без ограничения)
+        self.login_timeout = int(os.getenv('MSSQL_LOGIN_TIMEOUT', '5'))
+        self.query_timeout = int(os.getenv('MSSQL_QUERY_TIMEOUT', '30'))
+        # Консоль SQL: долгие аналитические запросы админа, зависший запрос отменяется через KILL
+        self.console_query_timeout = int(os.getenv('MSSQL_CONSOLE_QUERY_TIMEOUT', '0'))
+
+        # Автомат отключения: при серии сбоев запросы к основному серверу сразу получают MSSQLUnavailable
+        self.breaker = CircuitBreaker.from_env()
+
+        # Пулы подключений: отдельно для UTF-16 (zakupki) и cp1251 (db_companies и справочники)
+        self.pool = ConnectionPool.from_env(lambda: self._connect(self.charset), name='utf16')
+        self.pool_cp1251 = ConnectionPool.from_env(lambda: self._connect('cp1251'), name='cp1251')
+        # Отдельный пул консоли SQL - со своим таймаутом запроса (MSSQL_CONSOLE_QUERY_TIMEOUT)
+        self.console_pool = ConnectionPool.from_env(
+            lambda: self._connect(self.charset, timeout=self.console_query_timeout),
+            name='console', prefix='MSSQL_CONSOLE_POOL'
+        )
+
+        # Реплики для тяжелых чтений (поиск, экспорт, подсчет количества) - MSSQL_READ_REPLICAS
+        self.replicas = ReplicaSet.from_env(
+            lambda server, port, charset: self._connect(charset, server=server, port=port), self.port,
+            is_failure=is_connection_error,
+        )
+
+        # Отметки MAX(id) таблиц - по ним кэши узнают о новых записях
+        self.watermarks = WatermarkTracker(float(os.getenv('MSSQL_COUNT_WATERMARK_INTERVAL', '5')))
+
+        # Кэшированный / приблизительный подсчет total для пагинации
+        self.counts = CountService.from_env(watermarks=self.watermarks)
+
+        # Поиск по закупкам: LIKE / полнотекстовый индекс SQL Server / локальный индекс
+        self.search = ZakupkiSearch.from_env(fetch_batch=self.get_zakupki_search_batch)
+
+        # Журнал медленных запросов (MSSQL_SLOW_QUERY_MS > 0)
+        self.slow_queries = SlowQueryLog.from_env()
+
+    def _connect(self, charset=None, server=None, port=None, timeout=None):
+        """Открыть новое физическое подключение (используется пулами)
+
+        server / port - адрес реплики; по умолчанию основной сервер
+        timeout - таймаут запроса, сек; по умолчанию MSSQL_QUERY_TIMEOUT
+        """
+        # Для nvarchar (UTF-16) не указываем charset, pymssql сам правильно декодирует
+        conn_params = {
+            'server': server or self.server,
+            'user': self.user,
+            'password': self.password,
+            'database': self.database,
+            'port': port or self.port,
+            'login_timeout': self.login_timeout,
+            'timeout': self.query_timeout if timeout is None else timeout
         }
+        # Добавляем charset только если он явно задан и не пустой
+        if charset:
+            conn_params['charset'] = charset
+        return pymssql.connect(**conn_params)
+
+    def get_connection(self, route='primary'):
+        """Получить подключение из пула (UTF-16 / charset по умолчанию)
+
+        Возвращенное подключение нужно закрыть через conn.close() -
+        при этом оно возвращается в пул, а не закрывается физически.
+
+        Args:
+            route: 'primary' - основной сервер, 'replica' - реплика для чтения
+                   (если подходящей реплики нет - основной сервер)
+
+        Raises:
+            MSSQLUnavailable: не удалось подключиться или автомат отключения разомкнут
+            MSSQLTimeout: все подключения пула заняты дольше таймаута пула
+        """
+        with metrics.phase('connect'):
+            conn = self._acquire(self.pool, route)
+        return self.slow_queries.wrap(conn)
+
+    def get_console_connection(self):
+        """Подключение консоли SQL к основному серверу
+
+        Из отдельного пула с таймаутом запроса MSSQL_CONSOLE_QUERY_TIMEOUT (по умолчанию
+        без ограничения - зависший запрос админ отменяет). Ошибки не учитываются
+        автоматом отключения: произвольные запросы админа и KILL не говорят о состоянии сервера.
+        """
+        with metrics.phase('connect'):
+            conn = self._acquire(self.console_pool, 'primary', use_breaker=False)
+        return self.slow_queries.wrap(conn)
+
+    def get_connection_cp1251(self, route='primary'):
+        """Отдельное подключение для таблиц с VARCHAR(cp1251) - db_companies, db_rubrics и т.д."""
+        with metrics.phase('connect'):
+            conn = self._acquire(self.pool_cp1251, route, cp1251=True)
+        return self.slow_queries.wrap(conn)
+
+    def _acquire(self, pool, route, cp1251=False, use_breaker=True):
+        """Подключение реплики (route='replica') или основного сервера через автомат отключения"""
+        if route == 'replica':
+            checkout = self.replicas.checkout(cp1251=cp1251)
+            if checkout is not None:
+                replica, conn = checkout
+                return GuardedConnection(conn, pymssql.Error, is_connection_error, replica=replica)
+
+        self.breaker.before_call()
+        try:
+            conn = pool.acquire()
+        except PoolTimeout as e:
+            # Сервер отвечает, но все подключения заняты - автомату не сообщаем
+            print(f"MSSQL Connection Error ({pool.name}): {e}")
+            raise MSSQLTimeout(str(e), retry_after=5) from e
+        except Exception as e:
+            print(f"MSSQL Connection Error ({pool.name}): {e}")
+            self.breaker.record_failure(e)
+            raise translate_error(e, retry_after=self.breaker.retry_after()) from e
+        return GuardedConnection(conn, pymssql.Error, is_connection_error, self.breaker if use_breaker else None)
+
+    def get_max_id(self, table, blocking=True):
+        """MAX(id) таблицы (zakupki / db_companies) - не чаще раза в MSSQL_COUNT_WATERMARK_INTERVAL сек
+
+        Args:
+            blocking: False - без обращения к серверу (None, если отметка старше интервала)
+
+        Returns:
+            int или None, если подключиться не удалось
+        """
+        def fetch():
+            try:
+                conn = self.get_connection() if table == 'zakupki' else self.get_connection_cp1251()
+            except MSSQLError:
+                return None
+            try:
+                cursor = conn.cursor(as_dict=True)
+                cursor.execute(f"SELECT MAX(id) as max_id FROM {table}")
+                return cursor.fetchone()['max_id']
+            finally:
+                conn.close()
+
+        return self.watermarks.get(table, fetch, blocking=blocking)
+
+    @staticmethod
+    def _read(route, read):
+        """Выполнить чтение read(route); если реплика отказала во время запроса - один повтор на основном сервере
+
+        Реплика при этом уже исключена из ротации (см. GuardedConnection), ошибки
+        основного сервера и ошибки запроса пробрасываются как есть.
+        """
+        try:
+            return read(route)
+        except MSSQLError as e:
+            if route != 'replica' or e.replica is None:
+                raise
+            print(f"MSSQL replica {e.replica} failed, retrying on primary: {e}")
+        return read('primary')
+
+    def get_pool_stats(self):
+        """Статистика пулов подключений (для админов)"""
+        return ([self.pool.get_stats(), self.pool_cp1251.get_stats(), self.console_pool.get_stats()]
+                + self.replicas.get_pool_stats())
+
+    def _count_on_replica(self, table, alias, where_clauses, params, cp1251=False):
+        """Подсчет количества на реплике, пока страница читается с основного сервера
+
+        Подключение берется только из пулов реплик (без перехода на основной сервер -
+        поток уже держит подключение основного пула).
 
-    def get_connection(self):
+        Returns:
+            dict как у CountService.count или None, если реплик нет / они недоступны
+        """
+        if not self.replicas.enabled:
+            return None
         try:
-            start_time = time.time()
-            # Для nvarchar (UTF-16) не указываем charset, pymssql сам правильно декодирует
-            conn_params = {
-                'server': self.server,
-                'user': self.user,
-                'password': self.password,
-                'database': self.database,
-                'port': self.port
-            }
-            # Добавляем charset только если он явно задан и не пустой
-            if self.charset:
-                conn_params['charset'] = self.charset
-
-            conn = pymssql.connect(**conn_params)
-            self.query_stats['connection_time'] = (time.time() - start_time) * 1000  # в миллисекундах
-            return conn
+            checkout = self.replicas.checkout(cp1251=cp1251)
         except Exception as e:
-            print(f"MSSQL Connection Error: {e}")
+            print(f"MSSQL replica count error: {e}")
+            return None
+        if checkout is None:
             return None
 
-    def get_connection_cp1251(self):
-        """Отдельное подключение для таблиц с VARCHAR(cp1251) - db_companies, db_rubrics и т.д."""
+        replica, conn = checkout
+        conn = self.slow_queries.wrap(GuardedConnection(conn, pymssql.Error, is_connection_error, replica=replica))
         try:
-            start_time = time.time()
-            conn_params = {
-                'server': self.server,
-                'user': self.user,
-                'password': self.password,
-                'database': self.database,
-                'port': self.port,
-                'charset': 'cp1251'  # Явно указываем cp1251 для VARCHAR полей
-            }
-            conn = pymssql.connect(**conn_params)
-            self.query_stats['connection_time'] = (time.time() - start_time) * 1000
-            return conn
+            return self.counts.count(conn.cursor(as_dict=True), table, alias, where_clauses, params)
         except Exception as e:
-            print(f"MSSQL Connection Error (cp1251): {e}")
+            print(f"MSSQL replica count error: {e}")
+            conn.invalidate()
             return None
+        finally:
+            conn.close()
 
-    def get_zakupki(self, date_from=None, date_to=None, search_text=None, limit=100, offset=0, restrict_to_ids=None, count_all=False):
+    @metrics.timed('get_zakupki')
+    def get_zakupki(self, date_from=None, date_to=None, search_text=None, limit=100, offset=0, restrict_to_ids=None, count_all=False,
+                    before_id=None, after_id=None, order='id', route=None, exact_count=False):
         """Получить закупки с фильтрацией
 
         Args:
             restrict_to_ids: Список ID для ограничения выборки (для неавторизированных пользователей)
             count_all: Если True, считать total без учета restrict_to_ids (для отображения реального кол-ва)
+            before_id: Keyset-пагинация - вернуть limit записей с id < before_id (следующая страница).
+                       offset при этом игнорируется, стоимость не зависит от глубины страницы
+            after_id: Keyset-пагинация - вернуть limit записей с id > after_id (предыдущая страница)
+            order: 'id' - новые сверху, 'relevance' - по релевантности поиска
+                   (только при search_text и полнотекстовом / локальном индексе, без keyset)
+            route: 'primary' | 'replica'; по умолчанию поиск читается с реплики (если они заданы)
+            exact_count: точный COUNT(*) без порога и кэша CountService (прогресс фонового
+                         экспорта - вызывается вне потока запроса, с route='replica')
+
+        Returns:
+            dict: {'data': [...], 'total': int, 'has_more': bool}
+                  has_more - есть ли записи дальше в направлении листания (только для keyset)
         """
-        query_start_time = time.time()
+        if restrict_to_ids is not None and not restrict_to_ids:
+            # Если список пустой, возвращаем пустой результат
+            return {'data': [], 'total': 0, 'has_more': False}
 
-        conn = self.get_connection()
-        if conn is None:
-            return {'data': [], 'total': 0}
+        if route is None:
+            route = 'replica' if search_text else 'primary'
 
-        cursor = conn.cursor(as_dict=True)
+        if search_text and restrict_to_ids is None and self.search.uses_local_index:
+            return self._get_zakupki_local_search(date_from, date_to, search_text, limit, offset,
+                                                  before_id, after_id, order, route)
 
         where_clauses = []
         params = []
@@ -85,9 +283,6 @@ class MSSQLConnection:
 
         # Ограничение по ID (для неавторизированных пользователей)
         if restrict_to_ids is not None:
-            if not restrict_to_ids:
-                # Если список пустой, возвращаем пустой результат
-                return {'data': [], 'total': 0}
             placeholders = ','.join(['%s'] * len(restrict_to_ids))
             where_clauses.append(f"z.id IN ({placeholders})")
             params.extend(restrict_to_ids)
@@ -104,217 +299,393 @@ class MSSQLConnection:
             where_clauses_for_count.append("z.created <= %s")
             params_for_count.append(date_to)
 
+        fulltext_query = None
         if search_text:
             # Поиск только по основной таблице zakupki (без specification для производительности)
-            search_clause = """(
-                z.purchase_object LIKE %s
-                OR z.customer LIKE %s
-            )"""
+            search_clause, search_params = self.search.where_clause(search_text)
+            if search_clause is None:
+                # В запросе нет слов (только знаки препинания / служебные слова)
+                return {'data': [], 'total': 0, 'has_more': False}
             where_clauses.append(search_clause)
             where_clauses_for_count.append(search_clause)
-            search_param = f"%{search_text}%"
-            params.extend([search_param, search_param])
-            params_for_count.extend([search_param, search_param])
+            params.extend(search_params)
+            params_for_count.extend(search_params)
+            if self.search.backend == 'fulltext':
+                fulltext_query = search_params[0]
 
         where_sql = ""
         if where_clauses:
             where_sql = "WHERE " + " AND ".join(where_clauses)
 
-        # Получаем общее количество записей
+        # Общее количество записей: через CountService (кэш / каталог / порог),
+        # точный COUNT только для выборки по списку ID - он дешевый
+        count_query = None
+        count_params = params
         if count_all and restrict_to_ids is not None:
             # Считаем без restrict_to_ids для отображения реального количества
-            where_sql_for_count = ""
-            if where_clauses_for_count:
-                where_sql_for_count = "WHERE " + " AND ".join(where_clauses_for_count)
-            count_query = f"SELECT COUNT(*) as total FROM zakupki z {where_sql_for_count}"
-            cursor.execute(count_query, tuple(params_for_count))
-        else:
+            count_filter = (where_clauses_for_count, params_for_count)
+        elif restrict_to_ids is not None:
+            count_filter = None
             count_query = f"SELECT COUNT(*) as total FROM zakupki z {where_sql}"
-            cursor.execute(count_query, tuple(params))
-        total = cursor.fetchone()['total']
+        else:
+            count_filter = (where_clauses, params)
+
+        if exact_count and count_filter is not None:
+            count_where, count_params = count_filter
+            count_filter = None
+            count_query = "SELECT COUNT(*) as total FROM zakupki z"
+            if count_where:
+                count_query += " WHERE " + " AND ".join(count_where)
 
         # Получаем записи с пагинацией
-        query = f"""
+        columns_sql = self.ZAKUPKI_COLUMNS
+
+        if order == 'relevance' and fulltext_query:
+            # Ранжирование полнотекстового индекса: RANK из CONTAINSTABLE
+            query = f"""
             SELECT
-                z.id,
-                z.created as date_request,
-                z.purchase_object,
-                z.start_cost_var,
-                z.start_cost,
-                z.customer,
-                isnull(z.email, z.additional_contacts) as email,
-                z.contact_number as phone,
-                z.post_address as address,
-                z.purchase_type
+                {columns_sql}
+            FROM zakupki z
+            JOIN CONTAINSTABLE(zakupki, (purchase_object, customer), %s) ft ON ft.[KEY] = z.id
+            {where_sql}
+            ORDER BY ft.RANK DESC, z.id DESC
+            OFFSET %s ROWS
+            FETCH NEXT %s ROWS ONLY
+        """
+            page_params = tuple([fulltext_query] + params + [offset, limit])
+        elif before_id is not None or after_id is not None:
+            # Keyset (seek) пагинация: поиск по кластерному индексу вместо пропуска offset строк.
+            # Берем limit + 1 запись, чтобы узнать, есть ли следующая страница
+            seek_clauses = list(where_clauses)
+            if before_id is not None:
+                seek_clauses.append("z.id < %s")
+                seek_params = params + [before_id]
+                order_sql = "z.id DESC"
+            else:
+                seek_clauses.append("z.id > %s")
+                seek_params = params + [after_id]
+                order_sql = "z.id ASC"
+            query = f"""
+            SELECT TOP (%s)
+                {columns_sql}
+            FROM zakupki z
+            WHERE {" AND ".join(seek_clauses)}
+            ORDER BY {order_sql}
+        """
+            page_params = tuple([limit + 1] + seek_params)
+        else:
+            query = f"""
+            SELECT
+                {columns_sql}
             FROM zakupki z
             {where_sql}
             ORDER BY z.id DESC
             OFFSET %s ROWS
             FETCH NEXT %s ROWS ONLY
         """
+            page_params = tuple(params + [offset, limit])
+
+        def read(route):
+            conn = self.get_connection(route)
+
+            try:
+                cursor = conn.cursor(as_dict=True)
+                with metrics.phase('count'):
+                    if count_filter is not None:
+                        # При чтении страницы с основного сервера количество считаем на реплике
+                        count = None
+                        if route == 'primary':
+                            count = self._count_on_replica('zakupki', 'z', *count_filter)
+                        if count is None:
+                            count = self.counts.count(cursor, 'zakupki', 'z', *count_filter)
+                    else:
+                        cursor.execute(count_query, tuple(count_params))
+                        count = {'total': cursor.fetchone()['total'], 'approximate': False, 'capped': False}
+
+                with metrics.phase('fetch'):
+                    # Строки страницы - компактные Row (см. app/rows.py), количество выше - as_dict
+                    cursor = conn.cursor()
+                    cursor.execute(query, page_params)
+                    return count, rows.fetchall(cursor)
+            finally:
+                conn.close()
+
+        count, results = self._read(route, read)
+
+        has_more = False
+        if before_id is not None or after_id is not None:
+            has_more = len(results) > limit
+            results = results[:limit]
+            if after_id is not None:
+                # Предыдущая страница выбиралась по возрастанию id - возвращаем порядок DESC
+                results.reverse()
 
-        cursor.execute(query, tuple(params + [offset, limit]))
-        results = cursor.fetchall()
+        return {
+            'data': results,
+            'total': count['total'],
+            'total_approximate': count['approximate'],
+            'total_capped': count['capped'],
+            'has_more': has_more
+        }
 
-        conn.close()
+    def iter_zakupki(self, date_from=None, date_to=None, search_text=None, batch_size=1000):
+        """Все закупки по фильтру порциями по batch_size (для экспорта)
 
-        # Обновляем статистику профилирования
-        query_time = (time.time() - query_start_time) * 1000  # в миллисекундах
-        self.query_stats['total_queries'] += 1
-        self.query_stats['total_time'] += query_time
-        self.query_stats['last_query_time'] = query_time
+        Yields:
+            Row: строки в формате get_zakupki (новые сверху)
+        """
+        return self._iter_keyset(self.get_zakupki, batch_size, route='replica',
+                                 date_from=date_from, date_to=date_to, search_text=search_text)
+
+    def iter_companies(self, id_rubric=None, id_subrubric=None, id_city=None, search_text=None, batch_size=1000):
+        """Все предприятия по фильтру порциями по batch_size (для экспорта)
+
+        Yields:
+            Row: строки в формате get_companies (новые сверху)
+        """
+        return self._iter_keyset(self.get_companies, batch_size, route='replica', id_rubric=id_rubric,
+                                 id_subrubric=id_subrubric, id_city=id_city, search_text=search_text)
+
+    @staticmethod
+    def _iter_keyset(fetch, batch_size, **filters):
+        """Последовательное чтение выборки порциями keyset-пагинацией (id < последнего id порции)
+
+        Глубина выборки не влияет на стоимость запроса, в памяти одновременно
+        находится не больше одной порции, подключение берется из пула только
+        на время запроса порции.
+        """
+        before_id = None
+        while True:
+            result = fetch(limit=batch_size, offset=0, before_id=before_id, **filters)
+            batch = result['data']
+            for row in batch:
+                yield row
+
+            has_more = result['has_more'] if before_id is not None else len(batch) == batch_size
+            if not batch or not has_more:
+                break
+            before_id = batch[-1]['id']
+
+    def _get_zakupki_local_search(self, date_from, date_to, search_text, limit, offset,
+                                  before_id, after_id, order, route):
+        """Поиск закупок по локальному инвертированному индексу
+
+        Индекс возвращает id страницы и точное количество совпадений,
+        из MSSQL читаются только строки этой страницы (по первичному ключу).
+        """
+        with metrics.phase('count'):
+            found = self.search.index.search(
+                search_text, date_from=date_from, date_to=date_to, order=order,
+                limit=limit, offset=offset, before_id=before_id, after_id=after_id
+            )
+        results = self.get_zakupki_by_ids(found['ids'], route=route)
 
         return {
             'data': results,
-            'total': total
+            'total': found['total'],
+            'total_approximate': False,
+            'total_capped': False,
+            'has_more': found['has_more']
         }
 
-    def get_specifications(self, zakupki_id):
-        """Получить спецификации для закупки"""
-        conn = self.get_connection()
-        if conn is None:
+    @metrics.timed('get_zakupki_by_ids')
+    def get_zakupki_by_ids(self, ids, route='primary'):
+        """Закупки по списку id в порядке этого списка"""
+        if not ids:
             return []
 
-        cursor = conn.cursor(as_dict=True)
-
-        query = """
+        placeholders = ','.join(['%s'] * len(ids))
+        query = f"""
             SELECT
-                id,
-                id_zakupki,
-                product,
-                product_specification,
-                quantity,
-                price_vat,
-                terms_of_payment,
-                delivery_time
-            FROM zakupki_specification
-            WHERE id_zakupki = %s
-            ORDER BY id
+                {self.ZAKUPKI_COLUMNS}
+            FROM zakupki z
+            WHERE z.id IN ({placeholders})
         """
 
-        cursor.execute(query, (zakupki_id,))
-        results = cursor.fetchall()
-        conn.close()
+        def read(route):
+            conn = self.get_connection(route)
 
-        return results
+            try:
+                cursor = conn.cursor()
+                with metrics.phase('fetch'):
+                    cursor.execute(query, tuple(ids))
+                    return {row['id']: row for row in rows.fetchall(cursor)}
+            finally:
+                conn.close()
+
+        by_id = self._read(route, read)
+
+        return [by_id[zakupki_id] for zakupki_id in ids if zakupki_id in by_id]
 
-    def execute_query(self, query):
-        """Выполнить произвольный SQL запрос (только для админов)
+    @metrics.timed('get_zakupki_search_batch')
+    def get_zakupki_search_batch(self, after_id, limit):
+        """Очередная порция закупок для локального поискового индекса (по возрастанию id)
+
+        Читается с реплики (полный проход по таблице при построении индекса).
 
         Returns:
-            dict: {'success': bool, 'columns': [...], 'data': [...], 'rowcount': int, 'error': str}
+            list или None, если MSSQL недоступен
         """
-        query_start_time = time.time()
-
-        conn = self.get_connection()
-        if conn is None:
-            return {'success': False, 'error': 'Не удалось подключиться к базе данных', 'data': [], 'columns': [], 'rowcount': 0}
+        def read(route):
+            conn = self.get_connection(route)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT TOP (%s) z.id, z.created, z.purchase_object, z.customer
+                    FROM zakupki z
+                    WHERE z.id > %s
+                    ORDER BY z.id
+                """, (limit, after_id))
+                return rows.fetchall(cursor)
+            finally:
+                conn.close()
 
         try:
-            cursor = conn.cursor(as_dict=True)
-            cursor.execute(query)
+            return self._read('replica', read)
+        except MSSQLError:
+            return None
 
-            # Проверяем, есть ли результаты (SELECT запрос)
-            if cursor.description:
-                columns = [desc[0] for desc in cursor.description]
-                results = cursor.fetchall()
-                rowcount = len(results)
-            else:
-                # Для INSERT/UPDATE/DELETE запросов
-                columns = []
-                results = []
-                rowcount = cursor.rowcount
-                conn.commit()
+    def get_specifications(self, zakupki_id):
+        """Получить спецификации для закупки"""
+        return self.get_specifications_batch([zakupki_id])[zakupki_id]
 
-            conn.close()
+    @metrics.timed('get_specifications_batch')
+    def get_specifications_batch(self, zakupki_ids, chunk_size=1000, route='primary'):
+        """Спецификации сразу для многих закупок (страница списка, порция экспорта)
 
-            # Обновляем статистику
-            query_time = (time.time() - query_start_time) * 1000
-            self.query_stats['total_queries'] += 1
-            self.query_stats['total_time'] += query_time
-            self.query_stats['last_query_time'] = query_time
-
-            return {
-                'success': True,
-                'columns': columns,
-                'data': results,
-                'rowcount': rowcount,
-                'query_time': round(query_time, 2),
-                'error': None
-            }
-        except Exception as e:
-            conn.close()
-            return {
-                'success': False,
-                'error': str(e),
-                'data': [],
-                'columns': [],
-                'rowcount': 0
-            }
+        Один запрос WHERE id_zakupki IN (...) на chunk_size закупок (SQL Server
+        ограничивает количество параметров запроса 2100) вместо запроса на каждую
+        закупку, все порции - через одно подключение.
 
+        Returns:
+            dict: {id_zakupki: [спецификации по порядку id]} - для каждого переданного id,
+                  закупки без спецификации получают пустой список
+        """
+        ids = list(dict.fromkeys(zakupki_ids))
+        if not ids:
+            return {}
+
+        def read(route):
+            grouped = {zakupki_id: [] for zakupki_id in ids}
+            conn = self.get_connection(route)
+
+            try:
+                cursor = conn.cursor()
+                for start in range(0, len(ids), chunk_size):
+                    chunk = ids[start:start + chunk_size]
+                    placeholders = ','.join(['%s'] * len(chunk))
+                    cursor.execute(f"""
+                        SELECT
+                            id,
+                            id_zakupki,
+                            product,
+                            product_specification,
+                            quantity,
+                            price_vat,
+                            terms_of_payment,
+                            delivery_time
+                        FROM zakupki_specification
+                        WHERE id_zakupki IN ({placeholders})
+                        ORDER BY id_zakupki, id
+                    """, tuple(chunk))
+                    for row in rows.fetchall(cursor):
+                        grouped.setdefault(row['id_zakupki'], []).append(row)
+            finally:
+                conn.close()
+            return grouped
+
+        return self._read(route, read)
+
+    @metrics.timed('get_rubrics')
     def get_rubrics(self):
         """Получить список рубрик"""
         conn = self.get_connection_cp1251()  # Используем cp1251 для VARCHAR полей
-        if conn is None:
-            return []
 
-        cursor = conn.cursor(as_dict=True)
-        query = "SELECT id, rubric FROM db_rubrics ORDER BY rubric"
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            query = "SELECT id, rubric FROM db_rubrics ORDER BY rubric"
+            cursor.execute(query)
+            results = rows.fetchall(cursor)
+        finally:
+            conn.close()
         return results
 
+    @metrics.timed('get_subrubrics')
     def get_subrubrics(self, id_rubric=None):
         """Получить список подрубрик (опционально для конкретной рубрики)"""
         conn = self.get_connection_cp1251()  # Используем cp1251 для VARCHAR полей
-        if conn is None:
-            return []
 
-        cursor = conn.cursor(as_dict=True)
+        try:
+            cursor = conn.cursor()
 
-        if id_rubric:
-            query = "SELECT id, id_rubric, subrubric FROM db_subrubrics WHERE id_rubric = %s ORDER BY subrubric"
-            cursor.execute(query, (id_rubric,))
-        else:
-            query = "SELECT id, id_rubric, subrubric FROM db_subrubrics ORDER BY subrubric"
-            cursor.execute(query)
+            if id_rubric:
+                query = "SELECT id, id_rubric, subrubric FROM db_subrubrics WHERE id_rubric = %s ORDER BY subrubric"
+                cursor.execute(query, (id_rubric,))
+            else:
+                query = "SELECT id, id_rubric, subrubric FROM db_subrubrics ORDER BY subrubric"
+                cursor.execute(query)
 
-        results = cursor.fetchall()
-        conn.close()
+            results = rows.fetchall(cursor)
+        finally:
+            conn.close()
         return results
 
+    @metrics.timed('get_cities')
     def get_cities(self):
         """Получить список городов"""
         conn = self.get_connection_cp1251()  # Используем cp1251 для VARCHAR полей
-        if conn is None:
-            return []
 
-        cursor = conn.cursor(as_dict=True)
-        query = "SELECT id, city FROM db_cities ORDER BY city"
-        cursor.execute(query)
-        results = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            query = "SELECT id, city FROM db_cities ORDER BY city"
+            cursor.execute(query)
+            results = rows.fetchall(cursor)
+        finally:
+            conn.close()
         return results
 
-    def get_companies(self, id_rubric=None, id_subrubric=None, id_city=None, search_text=None, limit=100, offset=0):
+    @metrics.timed('get_reference_checksum')
+    def get_reference_checksum(self):
+        """Контрольная сумма справочников (db_rubrics, db_subrubrics, db_cities) одним запросом
+
+        Используется кэшем справочников, чтобы не перечитывать таблицы, если они не менялись.
+        """
+        conn = self.get_connection_cp1251()
+
+        try:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute("""
+                SELECT
+                    (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM db_rubrics) as rubrics,
+                    (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM db_subrubrics) as subrubrics,
+                    (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM db_cities) as cities
+            """)
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return (row['rubrics'], row['subrubrics'], row['cities'])
+
+    @metrics.timed('get_companies')
+    def get_companies(self, id_rubric=None, id_subrubric=None, id_city=None, search_text=None, limit=100, offset=0,
+                      before_id=None, after_id=None, route=None):
         """Получить предприятия с фильтрацией
 
         Args:
             id_rubric: ID рубрики
             id_subrubric: ID подрубрики
             id_city: ID города
-            search_text: Текст для поиска (по названию компании, ИНН, директору)
+            search_text: ИНН / ОГРН (точно или по началу номера) либо текст (название компании, директор)
             limit: Количество записей на странице
             offset: Смещение для пагинации
-        """
-        query_start_time = time.time()
+            before_id: Keyset-пагинация - limit записей с id < before_id (следующая страница)
+            after_id: Keyset-пагинация - limit записей с id > after_id (предыдущая страница)
+            route: 'primary' | 'replica'; по умолчанию поиск читается с реплики (если они заданы)
 
-        conn = self.get_connection_cp1251()  # Используем cp1251 для VARCHAR полей
-        if conn is None:
-            return {'data': [], 'total': 0}
-
-        cursor = conn.cursor(as_dict=True)
+        Returns:
+            dict: {'data': [...], 'total': int, 'has_more': bool}
+        """
+        if route is None:
+            route = 'replica' if search_text else 'primary'
 
         where_clauses = []
         params = []
@@ -332,26 +703,70 @@ class MSSQLConnection:
             params.append(id_city)
 
         if search_text:
-            search_clause = """(
+            # ИНН / ОГРН ищем точным совпадением или по началу номера - это поиск по индексу
+            # (см. scripts/mssql_indexes.sql). Параметр приводим к varchar: сравнение
+            # varchar-колонки с N'...' отключает поиск по индексу.
+            # LIKE '%...%' по названию и директору - только для обычного текста
+            search_kind, search_value = classify_company_search(search_text)
+            if search_kind == 'inn':
+                where_clauses.append("c.inn = CAST(%s AS varchar(12))")
+                params.append(search_value)
+            elif search_kind == 'ogrn':
+                where_clauses.append("c.ogrn = CAST(%s AS varchar(15))")
+                params.append(search_value)
+            elif search_kind == 'digits':
+                where_clauses.append("""(
+                c.inn LIKE CAST(%s AS varchar(16))
+                OR c.ogrn LIKE CAST(%s AS varchar(16))
+            )""")
+                prefix_param = f"{search_value}%"
+                params.extend([prefix_param, prefix_param])
+            else:
+                search_clause = """(
                 c.company LIKE %s
-                OR c.inn LIKE %s
                 OR c.director LIKE %s
             )"""
-            where_clauses.append(search_clause)
-            search_param = f"%{search_text}%"
-            params.extend([search_param, search_param, search_param])
+                where_clauses.append(search_clause)
+                search_param = f"%{search_value}%"
+                params.extend([search_param, search_param])
 
         where_sql = ""
         if where_clauses:
             where_sql = "WHERE " + " AND ".join(where_clauses)
 
-        # Получаем общее количество записей
-        count_query = f"SELECT COUNT(*) as total FROM db_companies c {where_sql}"
-        cursor.execute(count_query, tuple(params))
-        total = cursor.fetchone()['total']
+        # Сначала выбираем только id страницы (по индексу фильтра + id),
+        # и лишь для этих строк подтягиваем справочники - пропущенные строки не JOIN-ятся
+        if before_id is not None or after_id is not None:
+            seek_clauses = list(where_clauses)
+            if before_id is not None:
+                seek_clauses.append("c.id < %s")
+                seek_params = params + [before_id]
+                order_sql = "c.id DESC"
+            else:
+                seek_clauses.append("c.id > %s")
+                seek_params = params + [after_id]
+                order_sql = "c.id ASC"
+            page_ids_sql = f"""
+                SELECT TOP (%s) c.id
+                FROM db_companies c
+                WHERE {" AND ".join(seek_clauses)}
+                ORDER BY {order_sql}"""
+            # limit + 1 - чтобы узнать, есть ли следующая страница
+            page_params = tuple([limit + 1] + seek_params)
+        else:
+            order_sql = "c.id DESC"
+            page_ids_sql = f"""
+                SELECT c.id
+                FROM db_companies c
+                {where_sql}
+                ORDER BY c.id DESC
+                OFFSET %s ROWS
+                FETCH NEXT %s ROWS ONLY"""
+            page_params = tuple(params + [offset, limit])
 
-        # Получаем записи с пагинацией
         query = f"""
+            WITH page_ids AS ({page_ids_sql}
+            )
             SELECT
                 c.id,
                 c.company,
@@ -365,30 +780,87 @@ class MSSQLConnection:
                 r.rubric,
                 sr.subrubric,
                 ct.city
-            FROM db_companies c
+            FROM page_ids p
+            JOIN db_companies c ON c.id = p.id
             LEFT JOIN db_rubrics r ON c.id_rubric = r.id
             LEFT JOIN db_subrubrics sr ON c.id_subrubric = sr.id
             LEFT JOIN db_cities ct ON c.id_city = ct.id
-            {where_sql}
-            ORDER BY c.id DESC
-            OFFSET %s ROWS
-            FETCH NEXT %s ROWS ONLY
+            ORDER BY {order_sql}
         """
 
-        cursor.execute(query, tuple(params + [offset, limit]))
-        results = cursor.fetchall()
-
-        conn.close()
-
-        # Обновляем статистику профилирования
-        query_time = (time.time() - query_start_time) * 1000  # в миллисекундах
-        self.query_stats['total_queries'] += 1
-        self.query_stats['total_time'] += query_time
-        self.query_stats['last_query_time'] = query_time
+        def read(route):
+            conn = self.get_connection_cp1251(route)  # Используем cp1251 для VARCHAR полей
+
+            try:
+                cursor = conn.cursor(as_dict=True)
+                # Общее количество записей (кэш / каталог / порог - см. CountService),
+                # при чтении страницы с основного сервера - на реплике
+                with metrics.phase('count'):
+                    count = None
+                    if route == 'primary':
+                        count = self._count_on_replica('db_companies', 'c', where_clauses, params, cp1251=True)
+                    if count is None:
+                        count = self.counts.count(cursor, 'db_companies', 'c', where_clauses, params)
+
+                with metrics.phase('fetch'):
+                    cursor = conn.cursor()
+                    cursor.execute(query, page_params)
+                    return count, rows.fetchall(cursor)
+            finally:
+                conn.close()
+
+        count, results = self._read(route, read)
+
+        has_more = False
+        if before_id is not None or after_id is not None:
+            has_more = len(results) > limit
+            results = results[:limit]
+            if after_id is not None:
+                results.reverse()
 
         return {
             'data': results,
-            'total': total
+            'total': count['total'],
+            'total_approximate': count['approximate'],
+            'total_capped': count['capped'],
+            'has_more': has_more
         }
 
+    @metrics.timed('get_company')
+    def get_company(self, company_id):
+        """Предприятие по id со справочниками (рубрика, подрубрика, город)
+
+        Returns:
+            Row (см. app/rows.py) или None, если предприятие не найдено
+        """
+        conn = self.get_connection_cp1251()  # Используем cp1251 для VARCHAR полей
+
+        try:
+            cursor = conn.cursor()
+            with metrics.phase('fetch'):
+                cursor.execute("""
+                    SELECT
+                        c.id,
+                        c.company,
+                        c.phone,
+                        c.mobile_phone,
+                        c.Email,
+                        c.site,
+                        c.inn,
+                        c.ogrn,
+                        c.director,
+                        r.rubric,
+                        sr.subrubric,
+                        ct.city
+                    FROM db_companies c
+                    LEFT JOIN db_rubrics r ON c.id_rubric = r.id
+                    LEFT JOIN db_subrubrics sr ON c.id_subrubric = sr.id
+                    LEFT JOIN db_cities ct ON c.id_city = ct.id
+                    WHERE c.id = %s
+                """, (company_id,))
+                company = rows.fetchone(cursor)
+        finally:
+            conn.close()
+        return company
+
 mssql = MSSQLConnection()
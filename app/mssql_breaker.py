@@ -0,0 +1,248 @@
+"""
+Типизированные ошибки MSSQL и автомат отключения (circuit breaker)
+
+Когда SQL Server тормозит или недоступен, каждый запрос ждал таймаут входа
+драйвера, а потоки waitress копились в очереди. Теперь:
+
+- подключение и запросы ограничены таймаутами (MSSQL_LOGIN_TIMEOUT, MSSQL_QUERY_TIMEOUT);
+- ошибки драйвера приводятся к MSSQLTimeout / MSSQLUnavailable (общий предок MSSQLError),
+  их обрабатывает приложение (страница 503) или вызывающий код;
+- сбоем считаются только ошибки подключения, сети и таймауты; ошибка выполнения
+  запроса (деление на ноль, неверная колонка, deadlock) означает, что сервер
+  отвечает, и сбрасывает серию сбоев;
+- после MSSQL_BREAKER_THRESHOLD сбоев подряд автомат размыкается и следующие
+  MSSQL_BREAKER_RESET секунд запросы к основному серверу сразу получают
+  MSSQLUnavailable, не занимая подключение пула. Затем один запрос пропускается
+  как пробный: удачный замыкает автомат, неудачный размыкает его снова.
+"""
+import os
+import threading
+import time
+
+
+class MSSQLError(Exception):
+    """Ошибка обращения к MSSQL (базовый класс)
+
+    retry_after - через сколько секунд имеет смысл повторить запрос (для заголовка Retry-After)
+    replica - имя реплики, если сбой произошел на ней (чтение можно повторить на основном сервере)
+    """
+
+    def __init__(self, message, retry_after=None, replica=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.replica = replica
+
+
+class MSSQLUnavailable(MSSQLError):
+    """Сервер недоступен: не удалось подключиться, соединение разорвано или автомат разомкнут"""
+
+
+class MSSQLTimeout(MSSQLError):
+    """Превышен таймаут запроса или ожидания подключения из пула"""
+
+
+# Коды DB-Lib, означающие таймаут (20003 - Adaptive Server connection timed out)
+TIMEOUT_CODES = (20003,)
+
+
+def translate_error(error, retry_after=None, replica=None):
+    """Ошибка драйвера -> MSSQLTimeout / MSSQLUnavailable"""
+    if isinstance(error, MSSQLError):
+        return error
+    code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+    message = str(error)
+    if code in TIMEOUT_CODES or 'timed out' in message.lower() or 'timeout' in message.lower():
+        return MSSQLTimeout(message, retry_after=retry_after, replica=replica)
+    return MSSQLUnavailable(message, retry_after=retry_after, replica=replica)
+
+
+class CircuitBreaker:
+    """Автомат отключения основного сервера
+
+    Состояния: closed - запросы идут как обычно; open - запросы отклоняются сразу;
+    half_open - пропущен один пробный запрос, остальные отклоняются до его результата
+    (если проба не завершилась за reset_timeout - пропускается следующая).
+
+    Args:
+        name: имя сервера (для сообщений и статистики)
+        failure_threshold: сбоев подряд до размыкания (0 - автомат выключен)
+        reset_timeout: сколько секунд автомат разомкнут до пробного запроса
+    """
+
+    def __init__(self, name='primary', failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self.stats = {'trips': 0, 'rejected': 0, 'failures': 0}
+
+    @classmethod
+    def from_env(cls, name='primary'):
+        return cls(
+            name,
+            failure_threshold=int(os.getenv('MSSQL_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('MSSQL_BREAKER_RESET', '30')),
+        )
+
+    @property
+    def enabled(self):
+        return self.failure_threshold > 0
+
+    def retry_after(self):
+        """Секунд до следующего пробного запроса"""
+        if self.opened_at is None:
+            return None
+        return max(1, int(self.reset_timeout - (time.time() - self.opened_at) + 0.999))
+
+    def before_call(self):
+        """Проверка перед обращением к серверу
+
+        Raises:
+            MSSQLUnavailable: автомат разомкнут (или уже идет пробный запрос)
+        """
+        if self.state == 'closed':
+            return
+        with self._lock:
+            now = time.time()
+            if self.state == 'open' and now - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.probe_started_at = now
+                return
+            if self.state == 'half_open' and now - self.probe_started_at >= self.reset_timeout:
+                # Пробный запрос не завершился (подключение не использовали) - пробуем снова
+                self.probe_started_at = now
+                return
+            if self.state == 'closed':
+                return
+            self.stats['rejected'] += 1
+        raise MSSQLUnavailable(f"MSSQL {self.name} недоступен (автомат разомкнут): {self.last_error}",
+                               retry_after=self.retry_after())
+
+    def record_success(self):
+        if self.state == 'closed' and self.failures == 0:
+            return
+        with self._lock:
+            if self.state != 'closed':
+                print(f"MSSQL {self.name}: сервер снова отвечает, автомат замкнут")
+            self.state = 'closed'
+            self.failures = 0
+            self.opened_at = self.probe_started_at = None
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.stats['failures'] += 1
+            self.last_error = str(error)
+            if not self.enabled:
+                return
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                if self.state == 'closed':
+                    self.stats['trips'] += 1
+                    print(f"MSSQL {self.name}: {self.failures} сбоев подряд, автомат разомкнут "
+                          f"на {self.reset_timeout:.0f} с")
+                self.state = 'open'
+                self.opened_at = time.time()
+                self.probe_started_at = None
+
+    def get_stats(self):
+        """Состояние автомата (для админов)"""
+        return {
+            'name': self.name,
+            'enabled': self.enabled,
+            'state': self.state,
+            'failures': self.failures,
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout': self.reset_timeout,
+            'retry_after': self.retry_after() if self.state != 'closed' else None,
+            'last_error': self.last_error,
+            **self.stats,
+        }
+
+
+class GuardedConnection:
+    """Подключение, курсоры которого приводят ошибки драйвера к MSSQLError
+
+    Args:
+        conn: подключение пула (PooledConnection)
+        driver_errors: классы ошибок драйвера (остальные исключения проходят как есть)
+        is_failure: функция (error) -> True, если ошибка означает сбой сервера / сети;
+                    прочие ошибки драйвера - ошибки запроса, они пробрасываются без изменений
+        breaker: CircuitBreaker сервера или None (реплики, консоль SQL - ошибки не учитываются)
+        replica: Replica, если подключение к реплике - при сбое она исключается до следующей
+                 проверки, а ошибка помечается ее именем (см. MSSQLError.replica)
+    """
+
+    def __init__(self, conn, driver_errors, is_failure, breaker=None, replica=None):
+        self._conn = conn
+        self._driver_errors = driver_errors
+        self._is_failure = is_failure
+        self._breaker = breaker
+        self._replica = replica
+
+    def cursor(self, *args, **kwargs):
+        return GuardedCursor(self._conn.cursor(*args, **kwargs), self)
+
+    def close(self):
+        return self._conn.close()
+
+    def _failed(self, error):
+        """Сбой сервера: подключение в пул не возвращаем, сообщаем автомату"""
+        self._conn.invalidate()
+        if self._replica is not None:
+            self._replica.record_failure(error)
+            return translate_error(error, replica=self._replica.name)
+        if self._breaker is not None:
+            self._breaker.record_failure(error)
+            return translate_error(error, retry_after=self._breaker.retry_after())
+        return translate_error(error)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class GuardedCursor:
+    """Курсор GuardedConnection"""
+
+    def __init__(self, cursor, conn):
+        self._cursor = cursor
+        self._conn = conn
+
+    def execute(self, query, params=None):
+        if params is None:
+            result = self._call(self._cursor.execute, query)
+        else:
+            result = self._call(self._cursor.execute, query, params)
+        if self._conn._breaker is not None:
+            self._conn._breaker.record_success()
+        return result
+
+    def fetchall(self):
+        return self._call(self._cursor.fetchall)
+
+    def fetchone(self):
+        return self._call(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._call(self._cursor.fetchmany, *args)
+
+    def _call(self, method, *args):
+        try:
+            return method(*args)
+        except self._conn._driver_errors as e:
+            if self._conn._is_failure(e):
+                raise self._conn._failed(e) from e
+            # Ошибка запроса: сервер ответил - серия сбоев прерывается
+            if self._conn._breaker is not None:
+                self._conn._breaker.record_success()
+            raise
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
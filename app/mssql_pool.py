@@ -0,0 +1,285 @@
+"""
+Пул подключений к MSSQL
+
+Каждое подключение pymssql - это полноценный TDS login (десятки мс),
+поэтому соединения переиспользуются между запросами waitress.
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить подключение из пула за отведенное время"""
+
+
+class PooledConnection:
+    """Обертка над подключением pymssql
+
+    Ведет себя как обычное подключение: cursor(), commit(), rollback().
+    close() не закрывает сокет, а возвращает подключение в пул, поэтому
+    существующий код вида `conn = get_connection() ... conn.close()`
+    работает без изменений.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+        self.broken = False
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self, *args, **kwargs):
+        return self._raw.cursor(*args, **kwargs)
+
+    def commit(self):
+        return self._raw.commit()
+
+    def rollback(self):
+        return self._raw.rollback()
+
+    def invalidate(self):
+        """Пометить подключение как сломанное - при возврате оно будет закрыто"""
+        self.broken = True
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.invalidate()
+        self.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул подключений
+
+    Args:
+        connect: функция без аргументов, создающая новое DB-API подключение
+        name: имя пула (для статистики)
+        size: сколько подключений держать открытыми постоянно
+        max_overflow: сколько подключений можно открыть сверх size под нагрузкой
+        timeout: сколько секунд ждать свободное подключение
+        max_idle: через сколько секунд простоя подключение закрывается
+        ping_after: проверять подключение (SELECT 1) при выдаче, если оно простаивало дольше
+    """
+
+    def __init__(self, connect, name='default', size=8, max_overflow=4, timeout=10.0,
+                 max_idle=300.0, ping_after=30.0):
+        self._connect = connect
+        self.name = name
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+
+        self._idle = []  # LIFO: последнее возвращенное подключение выдается первым
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._open = 0
+        self._in_use = 0
+
+        self.stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'failed_pings': 0,
+            'connect_errors': 0,
+        }
+
+    @classmethod
+    def from_env(cls, connect, name, prefix='MSSQL_POOL'):
+        """Создать пул с параметрами из переменных окружения"""
+        return cls(
+            connect,
+            name=name,
+            # По умолчанию равен количеству потоков waitress (run_production.py)
+            size=int(os.getenv(f'{prefix}_SIZE', '8')),
+            max_overflow=int(os.getenv(f'{prefix}_MAX_OVERFLOW', '4')),
+            timeout=float(os.getenv(f'{prefix}_TIMEOUT', '10')),
+            max_idle=float(os.getenv(f'{prefix}_MAX_IDLE', '300')),
+            ping_after=float(os.getenv(f'{prefix}_PING_AFTER', '30')),
+        )
+
+    @property
+    def max_connections(self):
+        return self.size + self.max_overflow
+
+    def acquire(self):
+        """Получить подключение из пула (или создать новое)
+
+        Raises:
+            PoolTimeout: если все подключения заняты дольше timeout секунд
+            Exception: ошибка драйвера при создании подключения
+        """
+        deadline = time.time() + self.timeout
+        waited = False
+
+        while True:
+            expired = []
+            conn = None
+            create = False
+
+            with self._lock:
+                self._expire_idle(expired)
+                if self._idle:
+                    conn = self._idle.pop()
+                elif self._open < self.max_connections:
+                    self._open += 1
+                    create = True
+                else:
+                    if not waited:
+                        self.stats['waits'] += 1
+                        waited = True
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"Пул '{self.name}': нет свободных подключений за {self.timeout} с"
+                        )
+                    self._available.wait(remaining)
+                    continue
+                self._in_use += 1
+                self.stats['checkouts'] += 1
+
+            self._close_raw_all(expired)
+
+            if create:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                        self._in_use -= 1
+                        self.stats['connect_errors'] += 1
+                        self._available.notify()
+                    raise
+                with self._lock:
+                    self.stats['created'] += 1
+                conn = PooledConnection(self, raw)
+            elif not self._is_healthy(conn):
+                # Подключение умерло во время простоя - закрываем и пробуем снова
+                self._discard(conn)
+                continue
+
+            conn._released = False
+            conn.broken = False
+            conn.last_used = time.time()
+            return conn
+
+    def release(self, conn):
+        """Вернуть подключение в пул"""
+        if not conn.broken:
+            try:
+                # Сбрасываем незавершенную транзакцию, чтобы не отдать ее другому запросу
+                conn.raw.rollback()
+            except Exception:
+                conn.broken = True
+
+        if conn.broken:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) >= self.size:
+                # Подключение сверх size (overflow) не держим открытым
+                self._open -= 1
+                self.stats['closed'] += 1
+                close_it = True
+            else:
+                conn.last_used = time.time()
+                self._idle.append(conn)
+                close_it = False
+            self._available.notify()
+
+        if close_it:
+            self._close_raw(conn)
+
+    def dispose(self):
+        """Закрыть все простаивающие подключения"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self.stats['closed'] += len(idle)
+            self._available.notify_all()
+        self._close_raw_all(idle)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'name': self.name,
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        return stats
+
+    def _expire_idle(self, expired):
+        """Убрать из пула подключения, простаивающие дольше max_idle (под блокировкой)"""
+        if not self.max_idle:
+            return
+        now = time.time()
+        alive = []
+        for conn in self._idle:
+            if now - conn.last_used > self.max_idle:
+                expired.append(conn)
+            else:
+                alive.append(conn)
+        if expired:
+            self._idle = alive
+            self._open -= len(expired)
+            self.stats['closed'] += len(expired)
+
+    def _is_healthy(self, conn):
+        if self.ping_after is None or time.time() - conn.last_used < self.ping_after:
+            return True
+        try:
+            cursor = conn.raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception:
+            with self._lock:
+                self.stats['failed_pings'] += 1
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._in_use -= 1
+            self._open -= 1
+            self.stats['closed'] += 1
+            self._available.notify()
+        self._close_raw(conn)
+
+    def _close_raw_all(self, conns):
+        for conn in conns:
+            self._close_raw(conn)
+
+    @staticmethod
+    def _close_raw(conn):
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
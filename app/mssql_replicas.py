@@ -0,0 +1,246 @@
+"""
+Чтение с реплик MSSQL (readable secondaries)
+
+Поиск, экспорт и подсчет количества - самые тяжелые чтения - можно
+отправлять на реплики, чтобы они не конкурировали с остальной работой на
+основном сервере. Реплики задаются переменной MSSQL_READ_REPLICAS
+("host1,host2:1434"; пользователь, пароль и база - как у основного сервера).
+
+Реплика используется, пока она доступна и ее отставание не больше
+MSSQL_REPLICA_MAX_LAG секунд. Состояние проверяется не чаще раза в
+MSSQL_REPLICA_CHECK_INTERVAL секунд в фоновом потоке - запрос не ждет
+подключения к реплике и запроса отставания, а использует последний результат
+(до первой проверки реплика не используется). Если подходящей реплики нет или
+подключиться не удалось, запрос выполняется на основном сервере.
+
+Реплику из ротации исключают только сбои подключения и сети (is_failure):
+ошибка в тексте запроса или занятый пул (PoolTimeout) говорят о том, что
+реплика отвечает.
+"""
+import os
+import threading
+import time
+
+from app.mssql_pool import ConnectionPool, PoolTimeout
+
+# Отставание реплики (сек) по DMV Always On; для базы вне группы доступности строк нет - отставание
+# считается нулевым. Можно заменить своим запросом (MSSQL_REPLICA_LAG_QUERY), возвращающим колонку lag
+DEFAULT_LAG_QUERY = """
+    SELECT MAX(COALESCE(secondary_lag_seconds, DATEDIFF(SECOND, last_redone_time, last_received_time))) AS lag
+    FROM sys.dm_hadr_database_replica_states
+    WHERE is_local = 1 AND database_id = DB_ID()
+"""
+
+
+class Replica:
+    """Реплика: адрес, пулы подключений (UTF-16 и cp1251) и последнее известное состояние"""
+
+    def __init__(self, name, pool, pool_cp1251):
+        self.name = name
+        self.pool = pool
+        self.pool_cp1251 = pool_cp1251
+        self.healthy = True
+        self.lag = None
+        self.checked_at = 0
+        self.last_error = None
+        self.failures = 0
+        self.checkouts = 0
+        self._check_lock = threading.Lock()
+
+    def in_use(self):
+        return self.pool.get_stats()['in_use'] + self.pool_cp1251.get_stats()['in_use']
+
+    def record_failure(self, error):
+        """Реплика недоступна - не используем ее до следующей проверки"""
+        print(f"MSSQL replica {self.name} failed: {error}")
+        self.healthy = False
+        self.last_error = str(error)
+        self.failures += 1
+        self.checked_at = time.time()
+
+
+class ReplicaSet:
+    """Выбор реплики для чтения с проверкой доступности и отставания
+
+    Args:
+        replicas: список Replica
+        max_lag: допустимое отставание реплики, сек
+        check_interval: период проверки состояния реплики, сек
+        lag_query: SQL, возвращающий колонку lag (сек) на реплике
+        is_failure: функция (error) -> True, если ошибка означает сбой реплики / сети
+                    (по умолчанию сбоем считается любая ошибка, кроме PoolTimeout)
+    """
+
+    def __init__(self, replicas=None, max_lag=30.0, check_interval=10.0, lag_query=DEFAULT_LAG_QUERY,
+                 is_failure=None):
+        self.replicas = replicas or []
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag_query = lag_query
+        self.is_failure = is_failure or (lambda error: True)
+        self._lock = threading.Lock()
+        self.stats = {'replica_checkouts': 0, 'fallbacks': 0, 'failed_checks': 0}
+
+    @classmethod
+    def from_env(cls, connect, default_port, is_failure=None):
+        """Реплики из MSSQL_READ_REPLICAS
+
+        Args:
+            connect: функция (server, port, charset) -> новое подключение pymssql
+            default_port: порт, если он не указан в адресе реплики
+            is_failure: см. ReplicaSet
+        """
+        replicas = []
+        for address in os.getenv('MSSQL_READ_REPLICAS', '').split(','):
+            address = address.strip()
+            if not address:
+                continue
+            server, _, port = address.partition(':')
+            port = int(port) if port else default_port
+            replicas.append(Replica(
+                address,
+                ConnectionPool.from_env(_connect_to(connect, server, port, None), name=f'{address} utf16',
+                                        prefix='MSSQL_REPLICA_POOL'),
+                ConnectionPool.from_env(_connect_to(connect, server, port, 'cp1251'), name=f'{address} cp1251',
+                                        prefix='MSSQL_REPLICA_POOL'),
+            ))
+        return cls(
+            replicas,
+            max_lag=float(os.getenv('MSSQL_REPLICA_MAX_LAG', '30')),
+            check_interval=float(os.getenv('MSSQL_REPLICA_CHECK_INTERVAL', '10')),
+            lag_query=os.getenv('MSSQL_REPLICA_LAG_QUERY') or DEFAULT_LAG_QUERY,
+            is_failure=is_failure,
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def acquire(self, cp1251=False):
+        """Подключение к наименее загруженной подходящей реплике
+
+        Returns:
+            PooledConnection или None, если подходящих реплик нет (читать с основного сервера)
+        """
+        checkout = self.checkout(cp1251=cp1251)
+        return checkout[1] if checkout is not None else None
+
+    def checkout(self, cp1251=False):
+        """Как acquire, но вместе с репликой - чтобы сообщить ей о сбое во время запроса
+
+        Returns:
+            (Replica, PooledConnection) или None, если подходящих реплик нет
+        """
+        candidates = self.available()
+        candidates.sort(key=lambda replica: replica.in_use())
+        for replica in candidates:
+            pool = replica.pool_cp1251 if cp1251 else replica.pool
+            try:
+                conn = pool.acquire()
+            except PoolTimeout as e:
+                # Реплика отвечает, но все подключения заняты - пробуем следующую
+                print(f"MSSQL replica {replica.name} connection error: {e}")
+                continue
+            except Exception as e:
+                print(f"MSSQL replica {replica.name} connection error: {e}")
+                if self.is_failure(e):
+                    replica.record_failure(e)
+                continue
+            with self._lock:
+                self.stats['replica_checkouts'] += 1
+                replica.checkouts += 1
+            return replica, conn
+
+        if self.replicas:
+            with self._lock:
+                self.stats['fallbacks'] += 1
+        return None
+
+    def available(self):
+        """Реплики, доступные и отстающие не больше max_lag
+
+        Устаревшее состояние обновляется в фоновом потоке (check_async), до его
+        завершения используется последний результат.
+        """
+        result = []
+        now = time.time()
+        for replica in self.replicas:
+            if now - replica.checked_at >= self.check_interval:
+                self.check_async(replica)
+            if self._usable(replica):
+                result.append(replica)
+        return result
+
+    def _usable(self, replica):
+        return (replica.checked_at > 0 and replica.healthy
+                and (replica.lag is None or replica.lag <= self.max_lag))
+
+    def check_async(self, replica):
+        """Проверить реплику в фоновом потоке (если ее уже проверяют - ничего не делать)"""
+        if not replica._check_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._check_locked, args=(replica,), daemon=True,
+                         name=f'replica-check-{replica.name}').start()
+
+    def check(self, replica, blocking=True):
+        """Проверить доступность и отставание реплики
+
+        blocking=False - если реплику уже проверяет другой поток, не ждать его
+        """
+        if not replica._check_lock.acquire(blocking=blocking):
+            return
+        self._check_locked(replica)
+
+    def _check_locked(self, replica):
+        """Проверка реплики; вызывающий уже захватил replica._check_lock, он освобождается здесь"""
+        try:
+            conn = replica.pool.acquire()
+            try:
+                cursor = conn.cursor(as_dict=True)
+                cursor.execute(self.lag_query)
+                row = cursor.fetchone()
+            except Exception:
+                conn.invalidate()
+                raise
+            finally:
+                conn.close()
+            lag = row.get('lag') if row else None
+            replica.lag = float(lag) if lag is not None else None
+            replica.healthy = True
+            replica.last_error = None
+        except PoolTimeout as e:
+            # Все подключения заняты запросами - реплика отвечает, состояние не меняем
+            print(f"MSSQL replica {replica.name} check skipped: {e}")
+        except Exception as e:
+            print(f"MSSQL replica {replica.name} check failed: {e}")
+            replica.healthy = False
+            replica.last_error = str(e)
+            replica.failures += 1
+            with self._lock:
+                self.stats['failed_checks'] += 1
+        finally:
+            replica.checked_at = time.time()
+            replica._check_lock.release()
+
+    def get_pool_stats(self):
+        stats = []
+        for replica in self.replicas:
+            stats.extend([replica.pool.get_stats(), replica.pool_cp1251.get_stats()])
+        return stats
+
+    def get_stats(self):
+        """Состояние реплик (для админов)"""
+        return [{
+            'name': replica.name,
+            'healthy': replica.healthy,
+            'lag': replica.lag,
+            'usable': self._usable(replica),
+            'checked_at': replica.checked_at,
+            'failures': replica.failures,
+            'checkouts': replica.checkouts,
+            'last_error': replica.last_error,
+        } for replica in self.replicas]
+
+
+def _connect_to(connect, server, port, charset):
+    return lambda: connect(server, port, charset)
@@ -0,0 +1,146 @@
+"""
+Окно предпросмотра закупок для неавторизованных посетителей
+
+Гости видят только 50 последних закупок с замаскированными контактами.
+Раньше на каждый такой запрос выполнялись TOP 50 + COUNT + выборка по
+списку IN (...). Теперь окно поддерживается фоновым потоком: 50 последних
+строк уже замаскированы и лежат в памяти, гостевые страницы (включая
+фильтр по датам и тексту) строятся без обращения к SQL Server.
+
+Количество для страницы с фильтром - по всей таблице, как у авторизованных
+(get_zakupki: подсчет через CountService с кэшем), а не только совпадения в окне.
+До первого обновления окна гости видят пустую страницу - окно заполняется в
+фоне, недоступность MSSQL при старте не превращается в ошибку страницы.
+"""
+import os
+import threading
+import time
+
+from app.mssql import mssql, MSSQLError
+from app.utils import mask_email, mask_phone
+
+
+class PreviewWindow:
+    """Периодически обновляемое окно последних закупок
+
+    Args:
+        mssql: экземпляр MSSQLConnection
+        size: количество последних записей в окне
+        refresh_interval: период фонового обновления (сек)
+    """
+
+    def __init__(self, mssql, size=50, refresh_interval=30.0):
+        self.mssql = mssql
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self._rows = []
+        self._total = 0
+        self._total_approximate = True
+        self._refreshed_at = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, mssql):
+        return cls(
+            mssql,
+            size=int(os.getenv('PREVIEW_WINDOW_SIZE', '50')),
+            refresh_interval=float(os.getenv('PREVIEW_WINDOW_REFRESH', '30')),
+        )
+
+    def start(self):
+        """Запустить фоновое обновление (один раз на процесс)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='preview-window', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if self._refreshed_at is not None:
+                time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Оставляем прежнее окно - гости увидят данные чуть старше
+                print(f"Preview window refresh error: {e}")
+                time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Перечитать последние записи одним запросом TOP N и замаскировать контакты"""
+        with self._refresh_lock:
+            result = self.mssql.get_zakupki(limit=self.size, offset=0)
+            if not result['data'] and self._rows:
+                # Пустой ответ при непустом окне - скорее всего ошибка подключения
+                return
+
+            rows = []
+            for row in result['data']:
+                item = dict(row)
+                item['email'] = mask_email(item.get('email'))
+                item['phone'] = mask_phone(item.get('phone'))
+                rows.append(item)
+
+            self._rows = rows
+            self._total = result['total']
+            self._total_approximate = result.get('total_approximate', False)
+            self._refreshed_at = time.time()
+
+    def get_page(self, offset, limit, date_from=None, date_to=None, search_text=None):
+        """Страница окна с фильтрацией в памяти
+
+        Фильтры повторяют условия get_zakupki: created >= date_from, created <= date_to,
+        поиск подстроки без учета регистра в purchase_object и customer.
+
+        Returns:
+            dict: {'data': [...], 'total': int, 'total_approximate': bool, 'total_capped': bool, 'has_more': bool}
+        """
+        # Окно заполняется в фоне; до первого обновления страница пустая
+        self.start()
+
+        rows = self._rows
+        filtered = bool(date_from or date_to or search_text)
+        if filtered:
+            needle = search_text.lower() if search_text else None
+            rows = [
+                row for row in rows
+                if (not date_from or (row['date_request'] and row['date_request'] >= date_from))
+                and (not date_to or (row['date_request'] and row['date_request'] <= date_to))
+                and (not needle
+                     or needle in (row.get('purchase_object') or '').lower()
+                     or needle in (row.get('customer') or '').lower())
+            ]
+
+        total, total_approximate, total_capped = self._total, self._total_approximate, False
+        if filtered:
+            total, total_approximate, total_capped = self._filtered_total(date_from, date_to, search_text, rows)
+
+        return {
+            'data': rows[offset:offset + limit],
+            'total': total,
+            'total_approximate': total_approximate,
+            'total_capped': total_capped,
+            'has_more': False
+        }
+
+    def _filtered_total(self, date_from, date_to, search_text, rows):
+        """Количество закупок по фильтру во всей таблице
+
+        Выборка TOP 1 с тем же фильтром - total считает CountService (кэш / каталог / порог).
+        Если MSSQL недоступен - приблизительно, по совпадениям в окне.
+
+        Returns:
+            tuple: (total, total_approximate, total_capped)
+        """
+        try:
+            result = self.mssql.get_zakupki(date_from=date_from, date_to=date_to, search_text=search_text,
+                                            limit=1, offset=0)
+        except MSSQLError as e:
+            print(f"Preview window count error: {e}")
+            return len(rows), True, False
+        return result['total'], result.get('total_approximate', False), result.get('total_capped', False)
+
+
+preview_window = PreviewWindow.from_env(mssql)
@@ -0,0 +1,140 @@
+"""
+Кэш справочников MSSQL (рубрики, подрубрики, города) в памяти процесса
+
+Справочники почти не меняются, а companies_index запрашивал их на каждой
+странице. Теперь они загружаются один раз (при старте), а обновляются по TTL
+только если изменилась контрольная сумма таблиц.
+"""
+import os
+import threading
+import time
+
+from app.mssql import mssql, MSSQLError
+
+
+class ReferenceSnapshot:
+    """Неизменяемый снимок справочников одной версии"""
+
+    def __init__(self, rubrics, subrubrics, cities, checksum, version):
+        self.rubrics = rubrics
+        self.subrubrics = subrubrics
+        self.cities = cities
+        self.checksum = checksum
+        self.version = version
+        self.loaded_at = time.time()
+
+        # Индекс подрубрик по рубрике - список для рубрики фильтруется в памяти
+        self.subrubrics_by_rubric = {}
+        for item in subrubrics:
+            self.subrubrics_by_rubric.setdefault(item['id_rubric'], []).append(item)
+
+        self.rubric_by_id = {item['id']: item for item in rubrics}
+        self.subrubric_by_id = {item['id']: item for item in subrubrics}
+        self.city_by_id = {item['id']: item for item in cities}
+
+
+class ReferenceDataCache:
+    """Версионируемый кэш справочников
+
+    Args:
+        mssql: экземпляр MSSQLConnection (источник данных)
+        ttl: через сколько секунд проверять контрольную сумму таблиц
+        retry_interval: пауза перед повторной загрузкой после ошибки
+    """
+
+    def __init__(self, mssql, ttl=600.0, retry_interval=30.0):
+        self.mssql = mssql
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._snapshot = None
+        self._checked_at = 0
+        self._version = 0
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, mssql):
+        return cls(mssql, ttl=float(os.getenv('MSSQL_REFERENCE_TTL', '600')))
+
+    def preload(self, background=True):
+        """Загрузить справочники при старте приложения"""
+        if background:
+            thread = threading.Thread(target=self.refresh, name='reference-preload', daemon=True)
+            thread.start()
+            return thread
+        return self.refresh()
+
+    def snapshot(self):
+        """Текущий снимок справочников (при необходимости - обновленный)"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Первое обращение до окончания предзагрузки - грузим синхронно
+            return self.refresh() or ReferenceSnapshot([], [], [], None, 0)
+
+        if time.time() - self._checked_at > self.ttl:
+            self.refresh(force=False)
+            snapshot = self._snapshot
+        return snapshot
+
+    def refresh(self, force=True):
+        """Перечитать справочники
+
+        force=False: сначала сверить контрольную сумму таблиц и перечитать только при изменении.
+        Одновременно обновлять может только один поток, остальные получают текущий снимок.
+        """
+        if not self._refresh_lock.acquire(blocking=self._snapshot is None):
+            return self._snapshot
+        try:
+            if self._snapshot is not None and time.time() - self._checked_at <= self.ttl and not force:
+                return self._snapshot
+
+            try:
+                checksum = self.mssql.get_reference_checksum()
+                if not force and self._snapshot is not None and checksum is not None \
+                        and checksum == self._snapshot.checksum:
+                    self._checked_at = time.time()
+                    return self._snapshot
+
+                rubrics = self.mssql.get_rubrics()
+                subrubrics = self.mssql.get_subrubrics()
+                cities = self.mssql.get_cities()
+            except MSSQLError as e:
+                print(f"Reference data refresh error: {e}")
+                rubrics = cities = None
+
+            if not rubrics and not cities:
+                # MSSQL недоступен - оставляем прежний снимок и пробуем позже
+                self._checked_at = time.time() - self.ttl + self.retry_interval
+                return self._snapshot
+
+            self._version += 1
+            self._snapshot = ReferenceSnapshot(rubrics, subrubrics, cities, checksum, self._version)
+            self._checked_at = time.time()
+            return self._snapshot
+        finally:
+            self._refresh_lock.release()
+
+    def get_rubrics(self):
+        return self.snapshot().rubrics
+
+    def get_subrubrics(self, id_rubric=None):
+        """Подрубрики (все или для конкретной рубрики) - без обращения к MSSQL"""
+        snapshot = self.snapshot()
+        if id_rubric:
+            return snapshot.subrubrics_by_rubric.get(id_rubric, [])
+        return snapshot.subrubrics
+
+    def get_cities(self):
+        return self.snapshot().cities
+
+    def get_stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else 0,
+            'loaded_at': snapshot.loaded_at if snapshot else None,
+            'rubrics': len(snapshot.rubrics) if snapshot else 0,
+            'subrubrics': len(snapshot.subrubrics) if snapshot else 0,
+            'cities': len(snapshot.cities) if snapshot else 0,
+        }
+
+
+reference_cache = ReferenceDataCache.from_env(mssql)
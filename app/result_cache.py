@@ -0,0 +1,211 @@
+"""
+Кэш результатов списков закупок и предприятий (read-through)
+
+Большая часть трафика main.index - несколько одинаковых комбинаций фильтров
+и первые страницы. Результат get_zakupki / get_companies кэшируется по
+нормализованным параметрам (LRU + TTL, ограничение по числу строк) и
+считается устаревшим, как только в таблице появляется запись с большим id.
+
+Устаревшая запись хранится еще MSSQL_RESULT_CACHE_STALE_TTL секунд
+(stale-while-revalidate): проверка MAX(id) (если отметка старше интервала
+проверки) и обновление выполняются в фоновом потоке, запрос ждет их не
+дольше MSSQL_RESULT_CACHE_BUDGET_MS. Если MSSQL не уложился в
+этот бюджет или недоступен, отдается последний удачный результат с пометкой
+stale, а фоновое обновление сохранит свежий результат, когда закончится.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from app.cache import TTLCache
+from app.count_service import normalize_filter_value
+from app.mssql import mssql, MSSQLError
+
+
+def result_key(name, params):
+    """Ключ кэша: имя выборки + нормализованные параметры (порядок аргументов не важен)"""
+    items = []
+    for key in sorted(params):
+        value = params[key]
+        if isinstance(value, (list, tuple)):
+            value = tuple(normalize_filter_value(v) for v in value)
+        else:
+            value = normalize_filter_value(value)
+        items.append((key, value))
+    return (name, tuple(items))
+
+
+class ResultCache:
+    """Read-through кэш результатов выборок MSSQL
+
+    Args:
+        max_rows: ограничение памяти - суммарное количество строк во всех записях
+        ttl: время жизни свежей записи (сек)
+        stale_ttl: сколько еще секунд запись может отдаваться как устаревшая при сбоях MSSQL
+                   (0 - не отдавать устаревшие записи)
+        budget_ms: сколько запрос ждет обновления устаревшей записи, прежде чем отдать ее
+        max_refreshes: ограничение одновременных фоновых обновлений
+    """
+
+    def __init__(self, mssql, max_rows=20000, ttl=120.0, stale_ttl=300.0, budget_ms=2000, max_refreshes=4):
+        self.mssql = mssql
+        self.enabled = max_rows > 0
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.budget = budget_ms / 1000
+        self.max_refreshes = max_refreshes
+        self._cache = TTLCache(maxsize=max_rows, ttl=ttl + stale_ttl)
+        self._lock = threading.Lock()
+        # Обновления в фоне: ключ -> Future (одно обновление на ключ)
+        self._refreshing = {}
+        # Промахом считается и запись, устаревшая по MAX(id) / TTL
+        self.stats = {'hits': 0, 'misses': 0, 'invalidated': 0, 'stale': 0, 'refresh_errors': 0}
+
+    @classmethod
+    def from_env(cls, mssql):
+        return cls(
+            mssql,
+            max_rows=int(os.getenv('MSSQL_RESULT_CACHE_MAX_ROWS', '20000')),
+            ttl=float(os.getenv('MSSQL_RESULT_CACHE_TTL', '120')),
+            stale_ttl=float(os.getenv('MSSQL_RESULT_CACHE_STALE_TTL', '300')),
+            budget_ms=float(os.getenv('MSSQL_RESULT_CACHE_BUDGET_MS', '2000')),
+            max_refreshes=int(os.getenv('MSSQL_RESULT_CACHE_REFRESH_THREADS', '4')),
+        )
+
+    def get_or_load(self, name, table, params, loader):
+        """Вернуть закэшированный результат или загрузить его через loader()
+
+        Args:
+            name: имя выборки (часть ключа)
+            table: таблица, по MAX(id) которой проверяется актуальность
+            params: параметры выборки (dict)
+            loader: функция без аргументов, возвращающая {'data': [...], ...}
+
+        Returns:
+            dict результата; устаревший результат - копия с 'stale': True и
+            'stale_age' (сколько секунд назад он был загружен)
+        """
+        if not self.enabled:
+            return loader()
+
+        key = result_key(name, params)
+        cached = self._cache.get(key)
+
+        if cached is None or self.stale_ttl <= 0:
+            # Отдать нечего - проверяем и загружаем в потоке запроса, ошибки MSSQL идут вызывающему коду
+            watermark = self.mssql.get_max_id(table)
+            if self._is_fresh(cached, watermark):
+                self._count('hits')
+                return cached['result']
+            self._count('misses')
+            if cached is not None:
+                self._count('invalidated')
+            result = loader()
+            self._store(key, watermark, result)
+            return result
+
+        # Отметка, проверенная недавно, - без обращения к серверу
+        if self._is_fresh(cached, self.mssql.get_max_id(table, blocking=False)):
+            self._count('hits')
+            return cached['result']
+
+        # Проверка MAX(id) и загрузка - в фоне, запрос ждет их не дольше бюджета
+        future = self._refresh(key, table, cached, loader)
+        if future is not None:
+            try:
+                result, fresh = future.result(timeout=self.budget)
+            except (FutureTimeout, MSSQLError):
+                pass
+            else:
+                self._count('hits' if fresh else 'misses')
+                if not fresh:
+                    self._count('invalidated')
+                return result
+
+        self._count('misses')
+        self._count('stale')
+        result = dict(cached['result'])
+        result['stale'] = True
+        result['stale_age'] = time.time() - cached['loaded_at']
+        return result
+
+    def _is_fresh(self, cached, watermark):
+        return cached is not None and watermark is not None and cached['watermark'] == watermark \
+            and time.time() - cached['loaded_at'] <= self.ttl
+
+    def _refresh(self, key, table, cached, loader):
+        """Фоновая проверка и обновление записи (если по этому ключу они еще не идут)
+
+        Returns:
+            Future с (результат, запись была актуальна) или None,
+            если достигнут лимит одновременных обновлений
+        """
+        with self._lock:
+            future = self._refreshing.get(key)
+            if future is not None:
+                return future
+            if len(self._refreshing) >= self.max_refreshes:
+                return None
+            future = Future()
+            self._refreshing[key] = future
+
+        thread = threading.Thread(target=self._run_refresh, args=(key, table, cached, loader, future),
+                                  name='result-cache-refresh', daemon=True)
+        thread.start()
+        return future
+
+    def _run_refresh(self, key, table, cached, loader, future):
+        try:
+            watermark = self.mssql.get_max_id(table)
+            if self._is_fresh(cached, watermark):
+                future.set_result((cached['result'], True))
+                return
+            result = loader()
+            self._store(key, watermark, result)
+            future.set_result((result, False))
+        except Exception as e:
+            print(f"Result cache refresh error: {e}")
+            self._count('refresh_errors')
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+    def _store(self, key, watermark, result):
+        # Без отметки MAX(id) запись не считается свежей, но годится как устаревшая копия при сбое.
+        # Вес записи - количество строк, чтобы 500-строчные страницы не занимали память бесконтрольно
+        self._cache.set(key, {'watermark': watermark, 'result': result, 'loaded_at': time.time()},
+                        weight=len(result['data']) + 1)
+
+    def get_zakupki(self, **params):
+        return self.get_or_load('zakupki', 'zakupki', params, lambda: self.mssql.get_zakupki(**params))
+
+    def get_companies(self, **params):
+        return self.get_or_load('companies', 'db_companies', params, lambda: self.mssql.get_companies(**params))
+
+    def get_specifications(self, zakupki_id):
+        return self.get_or_load('specifications', 'zakupki', {'zakupki_id': zakupki_id},
+                                lambda: {'data': self.mssql.get_specifications(zakupki_id)})
+
+    def get_company(self, company_id):
+        def load():
+            company = self.mssql.get_company(company_id)
+            return {'data': [company] if company else []}
+        return self.get_or_load('company', 'db_companies', {'company_id': company_id}, load)
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        stats = self._cache.get_stats()
+        with self._lock:
+            stats.update(self.stats)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+
+result_cache = ResultCache.from_env(mssql)
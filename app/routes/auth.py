@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import db, User, EmailVerification
+from app.user_cache import user_cache
 from app.email_service import email_service
 from app.sms_service import sms_service
 from datetime import datetime, timedelta
@@ -126,6 +127,7 @@ def verify_email():
             user.phone_verified = True  # Автоматически подтверждаем телефон
             verification.is_used = True
             db.session.commit()
+            user_cache.invalidate(user.id)
 
             # Очищаем сессию и логиним пользователя
             session.pop('pending_user_id', None)
@@ -223,6 +225,7 @@ def verify_phone():
             user.phone_verified = True
             verification.is_used = True
             db.session.commit()
+            user_cache.invalidate(user.id)
 
             # Удаляем из сессии
             session.pop('pending_user_id', None)
@@ -1,14 +1,72 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file
+from flask import Blueprint, render_template, request, flash, redirect, url_for, send_file, Response, current_app
 from flask_login import login_required, current_user
-from app.models import db, News, Idea, User
-from app.mssql import mssql
+from app.models import db, News, Idea, User, SQLQueryHistory
+from app.mssql import mssql, MSSQLError
+from app.reference_cache import reference_cache
+from app.result_cache import result_cache
+from app.sql_console import sql_console
+from app.sql_jobs import sql_jobs, SQLJobQueueFull
+from app.preview_window import preview_window
 from app.decorators import admin_required
+from app.utils import encode_page_cursor, decode_page_cursor
+from app.export import (COMPANIES_FIELDS, COMPANIES_HEADERS, EXPORT_BATCH_SIZE, EXPORT_FORMATS,
+                        companies_export_row, stream_response, with_specifications, xlsx_response,
+                        zakupki_export_columns)
+from app.export_jobs import export_jobs, ExportQueueFull
+from app.metrics import metrics
+from app.counters import navbar_counters
+from app.user_cache import user_cache
+from app.server_timing import route_metrics
 from datetime import datetime, timedelta
-import io
-from openpyxl import Workbook
+from functools import partial
+import os
 
 bp = Blueprint('main', __name__)
 
+
+def _parse_page_cursor(page):
+    """Разобрать параметр cursor (keyset-пагинация) текущего запроса
+
+    Returns:
+        tuple: (cursor_token, before_id, after_id) - если курсор не задан или
+        поврежден, before_id/after_id равны None и используется offset
+    """
+    cursor_token = request.args.get('cursor', '')
+    page_cursor = decode_page_cursor(cursor_token) if page > 1 else None
+    if not page_cursor:
+        return '', None, None
+    direction, last_id = page_cursor
+    if direction == 'next':
+        return cursor_token, last_id, None
+    return cursor_token, None, last_id
+
+
+def _page_navigation(rows, page, offset, total, result, before_id, after_id):
+    """Курсоры соседних страниц и признак наличия следующей страницы
+
+    Returns:
+        tuple: (has_next, next_cursor, prev_cursor)
+    """
+    if before_id is not None:
+        has_next = result['has_more']
+    elif after_id is not None:
+        has_next = True
+    else:
+        has_next = offset + len(rows) < total
+        if result.get('total_capped') and rows:
+            # Количество посчитано только до порога - записи за порогом тоже есть
+            has_next = True
+
+    next_cursor = None
+    prev_cursor = None
+    if rows:
+        next_cursor = encode_page_cursor('next', rows[-1]['id'])
+        if page > 2:
+            # На вторую страницу надежнее вернуться по offset (page=1 без курсора)
+            prev_cursor = encode_page_cursor('prev', rows[0]['id'])
+    return has_next, next_cursor, prev_cursor
+
+
 @bp.route('/')
 def index():
     # Получаем параметр выбора базы данных
@@ -34,8 +92,6 @@ def index():
         per_page = 20
 
     # Определяем лимит и доступ на основе авторизации и баланса
-    restrict_to_ids = None  # Для ограничения доступа неавторизированных пользователей
-
     if not current_user.is_authenticated:
         # Без авторизации: только top 50 с пагинацией, email и телефон замаскированы
         max_records = 50
@@ -46,20 +102,9 @@ def index():
             page = 1
         limit = min(per_page, max_records - offset)
         has_full_access = False
-        show_masked_email = True
-        show_masked_phone = True
-
-        # Получаем ID первых 50 записей для ограничения доступа
-        conn = mssql.get_connection()
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute("""
-            SELECT TOP 50 id
-            FROM zakupki
-            ORDER BY id DESC
-        """)
-        top_50_records = cursor.fetchall()
-        conn.close()
-        restrict_to_ids = [r['id'] for r in top_50_records]
+        # Записи окна предпросмотра уже замаскированы - повторно в шаблоне не маскируем
+        show_masked_email = False
+        show_masked_phone = False
 
     elif current_user.has_positive_balance() or current_user.is_admin():
         # С положительным балансом или админ: полный доступ, email и телефон открыты
@@ -81,18 +126,21 @@ def index():
     date_to_obj = datetime.strptime(date_to, '%Y-%m-%d') if date_to else None
 
     # Валидация и ограничение периода поиска
+    # (LIKE '%текст%' не использует индексы; при полнотекстовом индексе ищем по всей истории)
     MAX_SEARCH_DAYS = 30
+    limit_period = bool(search_text) and not mssql.search.indexed
 
     # Если есть поиск по тексту, но не заданы даты - устанавливаем последние 30 дней
-    if search_text and not date_from_obj and not date_to_obj:
-        date_to_obj = datetime.now()
+    if limit_period and not date_from_obj and not date_to_obj:
+        # Округляем до минуты, чтобы одинаковые запросы попадали в кэш количества
+        date_to_obj = datetime.now().replace(second=0, microsecond=0)
         date_from_obj = date_to_obj - timedelta(days=MAX_SEARCH_DAYS)
         date_from = date_from_obj.strftime('%Y-%m-%d')
         date_to = date_to_obj.strftime('%Y-%m-%d')
         flash(f'Поиск выполнен за последние {MAX_SEARCH_DAYS} дней. Для изменения периода укажите даты.', 'info')
 
     # Если задан только один из диапазона дат при поиске - дополняем вторую дату
-    elif search_text:
+    elif limit_period:
         if date_from_obj and not date_to_obj:
             date_to_obj = date_from_obj + timedelta(days=MAX_SEARCH_DAYS)
             date_to = date_to_obj.strftime('%Y-%m-%d')
@@ -103,7 +151,7 @@ def index():
             flash(f'Период поиска ограничен {MAX_SEARCH_DAYS} днями до указанной даты.', 'info')
 
     # Ограничение интервала поиска (защита от больших интервалов)
-    if search_text and date_from_obj and date_to_obj:
+    if limit_period and date_from_obj and date_to_obj:
         days_diff = (date_to_obj - date_from_obj).days
         if days_diff > MAX_SEARCH_DAYS:
             # Обрезаем интервал до 30 дней от date_to
@@ -111,31 +159,85 @@ def index():
             date_from = date_from_obj.strftime('%Y-%m-%d')
             flash(f'Интервал поиска ограничен {MAX_SEARCH_DAYS} днями. Период скорректирован.', 'warning')
 
-    # Получаем данные из MSSQL
-    result = mssql.get_zakupki(
-        date_from=date_from_obj,
-        date_to=date_to_obj,
-        search_text=search_text if search_text else None,
-        limit=limit,
-        offset=offset,
-        restrict_to_ids=restrict_to_ids,
-        count_all=not current_user.is_authenticated  # Для неавторизованных считаем общее количество
-    )
+    # Сортировка результатов поиска: по дате (по умолчанию) или по релевантности -
+    # только если поиск идет по полнотекстовому индексу
+    order = 'id'
+    if request.args.get('sort') == 'relevance' and search_text and mssql.search.indexed \
+            and current_user.is_authenticated:
+        order = 'relevance'
+    sort = order if order == 'relevance' else None
+
+    # Курсор keyset-пагинации (ссылки "вперед"/"назад"): страница выбирается по id,
+    # без пропуска offset строк. Переход на произвольную страницу - через offset.
+    # Гостям курсоры не нужны - у них всего 50 записей, при сортировке по релевантности - тоже по offset
+    cursor_token, before_id, after_id = '', None, None
+    if current_user.is_authenticated and order == 'id':
+        cursor_token, before_id, after_id = _parse_page_cursor(page)
+
+    if not current_user.is_authenticated:
+        # Гости: страница из окна предпросмотра в памяти, без обращения к MSSQL
+        result = preview_window.get_page(
+            offset,
+            limit,
+            date_from=date_from_obj,
+            date_to=date_to_obj,
+            search_text=search_text if search_text else None
+        )
+    else:
+        # Получаем данные из MSSQL (через кэш результатов)
+        result = result_cache.get_zakupki(
+            date_from=date_from_obj,
+            date_to=date_to_obj,
+            search_text=search_text if search_text else None,
+            limit=limit,
+            offset=offset,
+            before_id=before_id,
+            after_id=after_id,
+            order=order
+        )
 
     total = result['total']
+    zakupki = result['data']
+
+    has_next, next_cursor, prev_cursor = _page_navigation(zakupki, page, offset, total, result, before_id, after_id)
+    if not current_user.is_authenticated or order != 'id':
+        next_cursor = prev_cursor = None
+
+    # Спецификации всех закупок страницы - одним запросом (specs=1)
+    show_specs = current_user.is_authenticated and request.args.get('specs') == '1'
+    specifications = {}
+    if show_specs and zakupki:
+        try:
+            specifications = mssql.get_specifications_batch([item['id'] for item in zakupki])
+        except MSSQLError:
+            if not result.get('stale'):
+                raise
+            # Страница из кэша при недоступном MSSQL - показываем ее без спецификаций
+            flash('Спецификации временно недоступны', 'warning')
 
     return render_template('index.html',
                          db_type='zakupki',
-                         zakupki=result['data'],
+                         zakupki=zakupki,
                          total=total,
+                         total_approximate=result.get('total_approximate', False),
+                         total_capped=result.get('total_capped', False),
                          date_from=date_from or '',
                          date_to=date_to or '',
                          search_text=search_text,
+                         sort=sort,
+                         specs='1' if show_specs else None,
+                         specifications=specifications,
+                         search_indexed=mssql.search.indexed,
+                         stale_age=result.get('stale_age'),
                          has_full_access=has_full_access,
                          show_masked_email=show_masked_email,
                          show_masked_phone=show_masked_phone,
                          page=page,
-                         per_page=per_page)
+                         per_page=per_page,
+                         cursor=cursor_token,
+                         has_next=has_next,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 @login_required
 def companies_index():
@@ -156,35 +258,43 @@ def companies_index():
     except ValueError:
         per_page = 20
 
-    # Получаем списки для фильтров
-    rubrics = mssql.get_rubrics()
-    subrubrics = mssql.get_subrubrics(id_rubric) if id_rubric else []
-    cities = mssql.get_cities()
+    # Получаем списки для фильтров (из кэша справочников, без обращения к MSSQL)
+    rubrics = reference_cache.get_rubrics()
+    subrubrics = reference_cache.get_subrubrics(id_rubric) if id_rubric else []
+    cities = reference_cache.get_cities()
 
     # Определяем доступ на основе баланса (пользователь уже авторизован)
     has_full_access = current_user.has_positive_balance() or current_user.is_admin()
     show_masked_email = not has_full_access
     show_masked_phone = not has_full_access
 
-    # Пагинация
+    # Пагинация: keyset-курсор для "вперед"/"назад", offset для перехода на номер страницы
     limit = per_page
     offset = (page - 1) * per_page
+    cursor_token, before_id, after_id = _parse_page_cursor(page)
 
-    # Получаем данные из MSSQL
-    result = mssql.get_companies(
+    # Получаем данные из MSSQL (через кэш результатов)
+    result = result_cache.get_companies(
         id_rubric=id_rubric,
         id_subrubric=id_subrubric,
         id_city=id_city,
         search_text=search_text if search_text else None,
         limit=limit,
-        offset=offset
+        offset=offset,
+        before_id=before_id,
+        after_id=after_id
     )
 
     total = result['total']
+    companies = result['data']
+    has_next, next_cursor, prev_cursor = _page_navigation(companies, page, offset, total, result, before_id, after_id)
 
     return render_template('index_companies.html',
-                         companies=result['data'],
+                         companies=companies,
                          total=total,
+                         total_approximate=result.get('total_approximate', False),
+                         total_capped=result.get('total_capped', False),
+                         stale_age=result.get('stale_age'),
                          rubrics=rubrics,
                          subrubrics=subrubrics,
                          cities=cities,
@@ -196,7 +306,11 @@ def companies_index():
                          show_masked_email=show_masked_email,
                          show_masked_phone=show_masked_phone,
                          page=page,
-                         per_page=per_page)
+                         per_page=per_page,
+                         cursor=cursor_token,
+                         has_next=has_next,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 @bp.route('/news')
 def news():
@@ -221,6 +335,7 @@ def add_news():
         )
         db.session.add(news_item)
         db.session.commit()
+        navbar_counters.invalidate('news')
 
         flash('Новость успешно добавлена!', 'success')
         return redirect(url_for('main.news'))
@@ -304,8 +419,30 @@ def toggle_admin(user_id):
         flash(f'{user.username} назначен администратором', 'success')
 
     db.session.commit()
+    user_cache.invalidate(user.id)
     return redirect(url_for('main.admin_users'))
 
+@bp.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Время выполнения методов MSSQL и маршрутов (Server-Timing): перцентили по фазам, строки, ошибки"""
+    return render_template('admin_metrics.html',
+                           methods=metrics.snapshot(),
+                           routes=route_metrics.snapshot(),
+                           replicas=mssql.replicas.get_stats(),
+                           replica_max_lag=mssql.replicas.max_lag,
+                           breaker=mssql.breaker.get_stats(),
+                           summary=metrics.summary(),
+                           started_at=datetime.fromtimestamp(metrics.started_at))
+
+@bp.route('/admin/metrics/reset', methods=['POST'])
+@admin_required
+def admin_metrics_reset():
+    metrics.reset()
+    route_metrics.reset()
+    flash('Метрики сброшены', 'success')
+    return redirect(url_for('main.admin_metrics'))
+
 @bp.route('/admin/ideas')
 @admin_required
 def admin_ideas():
@@ -326,6 +463,7 @@ def approve_idea(idea_id):
     idea = Idea.query.get_or_404(idea_id)
     idea.status = 'approved'
     db.session.commit()
+    navbar_counters.invalidate('ideas')
     flash(f'Идея "{idea.title}" одобрена', 'success')
     return redirect(url_for('main.admin_ideas'))
 
@@ -335,6 +473,7 @@ def reject_idea(idea_id):
     idea = Idea.query.get_or_404(idea_id)
     idea.status = 'rejected'
     db.session.commit()
+    navbar_counters.invalidate('ideas')
     flash(f'Идея "{idea.title}" отклонена', 'warning')
     return redirect(url_for('main.admin_ideas'))
 
@@ -345,6 +484,7 @@ def delete_idea(idea_id):
     title = idea.title
     db.session.delete(idea)
     db.session.commit()
+    navbar_counters.invalidate('ideas')
     flash(f'Идея "{title}" удалена', 'success')
 
     # Редирект на страницу, откуда была нажата кнопка удаления
@@ -360,6 +500,7 @@ def delete_news(news_id):
     title = news_item.title
     db.session.delete(news_item)
     db.session.commit()
+    navbar_counters.invalidate('news')
     flash(f'Новость "{title}" удалена', 'success')
     return redirect(url_for('main.news'))
 
@@ -373,9 +514,12 @@ def zakupki_detail(zakupki_id):
     search_text = request.args.get('search_text', '')
     page = request.args.get('page', '1')
     per_page = request.args.get('per_page', '20')
+    cursor = request.args.get('cursor', '')
+    sort = request.args.get('sort') or None
+    specs = request.args.get('specs') or None
 
-    # Получить данные закупки
-    result = mssql.get_zakupki(limit=1, offset=0, restrict_to_ids=[zakupki_id])
+    # Получить данные закупки (через кэш результатов)
+    result = result_cache.get_zakupki(limit=1, offset=0, restrict_to_ids=[zakupki_id])
 
     if not result['data']:
         flash('Закупка не найдена', 'error')
@@ -384,7 +528,8 @@ def zakupki_detail(zakupki_id):
     zakupka = result['data'][0]
 
     # Получить спецификации (если есть)
-    specifications = mssql.get_specifications(zakupki_id)
+    specifications_result = result_cache.get_specifications(zakupki_id)
+    specifications = specifications_result['data']
 
     # Определить нужно ли маскировать данные (пользователь уже авторизован благодаря @login_required)
     show_masked_email = False
@@ -397,13 +542,17 @@ def zakupki_detail(zakupki_id):
     return render_template('zakupki_detail.html',
                          zakupka=zakupka,
                          specifications=specifications,
+                         stale_age=result.get('stale_age', specifications_result.get('stale_age')),
                          show_masked_email=show_masked_email,
                          show_masked_phone=show_masked_phone,
                          date_from=date_from,
                          date_to=date_to,
                          search_text=search_text,
+                         sort=sort,
+                         specs=specs,
                          page=page,
-                         per_page=per_page)
+                         per_page=per_page,
+                         cursor=cursor)
 
 @bp.route('/zakupki/<int:zakupki_id>/specifications')
 @login_required
@@ -422,37 +571,11 @@ def company_detail(company_id):
     search_text = request.args.get('search_text', '')
     page = request.args.get('page', '1')
     per_page = request.args.get('per_page', '20')
+    cursor = request.args.get('cursor', '')
 
-    # Получить данные компании по ID
-    conn = mssql.get_connection_cp1251()
-    if conn is None:
-        flash('Ошибка подключения к базе данных', 'error')
-        return redirect(url_for('main.index', db_type='companies'))
-
-    cursor = conn.cursor(as_dict=True)
-    query = """
-        SELECT
-            c.id,
-            c.company,
-            c.phone,
-            c.mobile_phone,
-            c.Email,
-            c.site,
-            c.inn,
-            c.ogrn,
-            c.director,
-            r.rubric,
-            sr.subrubric,
-            ct.city
-        FROM db_companies c
-        LEFT JOIN db_rubrics r ON c.id_rubric = r.id
-        LEFT JOIN db_subrubrics sr ON c.id_subrubric = sr.id
-        LEFT JOIN db_cities ct ON c.id_city = ct.id
-        WHERE c.id = %s
-    """
-    cursor.execute(query, (company_id,))
-    company = cursor.fetchone()
-    conn.close()
+    # Получить данные компании по ID (через кэш результатов)
+    result = result_cache.get_company(company_id)
+    company = result['data'][0] if result['data'] else None
 
     if not company:
         flash('Компания не найдена', 'error')
@@ -468,6 +591,7 @@ def company_detail(company_id):
 
     return render_template('company_detail.html',
                          company=company,
+                         stale_age=result.get('stale_age'),
                          show_masked_email=show_masked_email,
                          show_masked_phone=show_masked_phone,
                          id_rubric=id_rubric,
@@ -475,15 +599,21 @@ def company_detail(company_id):
                          id_city=id_city,
                          search_text=search_text,
                          page=page,
-                         per_page=per_page)
+                         per_page=per_page,
+                         cursor=cursor)
 
-@bp.route('/export')
-@login_required
-def export_zakupki():
-    # Получаем параметры фильтрации
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
-    search_text = request.args.get('search_text', '').strip()
+def _export_zakupki_params(args):
+    """Фильтры и формат выгрузки закупок из параметров запроса
+
+    Returns:
+        tuple: (date_from, date_to, search_text, export_format)
+    """
+    date_from = args.get('date_from')
+    date_to = args.get('date_to')
+    search_text = args.get('search_text', '').strip()
+    export_format = args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'xlsx'
 
     # Конвертируем даты
     date_from_obj = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
@@ -491,77 +621,218 @@ def export_zakupki():
 
     # Валидация и ограничение периода поиска (та же логика что и в index)
     MAX_SEARCH_DAYS = 30
+    limit_period = bool(search_text) and not mssql.search.indexed
 
     # Если есть поиск по тексту, но не заданы даты - устанавливаем последние 30 дней
-    if search_text and not date_from_obj and not date_to_obj:
-        date_to_obj = datetime.now()
+    if limit_period and not date_from_obj and not date_to_obj:
+        # Округляем до минуты, чтобы одинаковые запросы попадали в кэш количества
+        date_to_obj = datetime.now().replace(second=0, microsecond=0)
         date_from_obj = date_to_obj - timedelta(days=MAX_SEARCH_DAYS)
 
     # Если задан только один из диапазона дат при поиске - дополняем вторую дату
-    elif search_text:
+    elif limit_period:
         if date_from_obj and not date_to_obj:
             date_to_obj = date_from_obj + timedelta(days=MAX_SEARCH_DAYS)
         elif date_to_obj and not date_from_obj:
             date_from_obj = date_to_obj - timedelta(days=MAX_SEARCH_DAYS)
 
     # Ограничение интервала поиска (защита от больших интервалов)
-    if search_text and date_from_obj and date_to_obj:
+    if limit_period and date_from_obj and date_to_obj:
         days_diff = (date_to_obj - date_from_obj).days
         if days_diff > MAX_SEARCH_DAYS:
             # Обрезаем интервал до 30 дней от date_to
             date_from_obj = date_to_obj - timedelta(days=MAX_SEARCH_DAYS)
 
-    # Получаем все данные (без лимита)
-    result = mssql.get_zakupki(
+    return date_from_obj, date_to_obj, search_text if search_text else None, export_format
+
+
+@bp.route('/export')
+@login_required
+def export_zakupki():
+    date_from_obj, date_to_obj, search_text, export_format = _export_zakupki_params(request.args)
+    include_specifications = request.args.get('specs') == '1'
+    headers, fields, convert = zakupki_export_columns(include_specifications)
+
+    # Все строки по фильтру порциями (без ограничения количества)
+    rows = mssql.iter_zakupki(
         date_from=date_from_obj,
         date_to=date_to_obj,
+        search_text=search_text,
+        batch_size=EXPORT_BATCH_SIZE
+    )
+    if include_specifications:
+        # Позиции спецификации - одним запросом на порцию строк
+        rows = with_specifications(rows, partial(mssql.get_specifications_batch, route='replica'))
+
+    download_name = f'zakupki_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+
+    if export_format != 'xlsx':
+        # CSV / NDJSON для интеграций: отдаются сразу по мере чтения, со сжатием gzip
+        return stream_response(
+            export_format,
+            headers,
+            fields,
+            rows,
+            convert,
+            download_name=download_name,
+            accept_gzip='gzip' in request.headers.get('Accept-Encoding', '')
+        )
+
+    return xlsx_response(
+        "Закупки",
+        headers,
+        rows,
+        convert,
+        download_name=download_name
+    )
+
+
+@bp.route('/export/companies')
+@login_required
+def export_companies():
+    """Выгрузка базы предприятий по фильтрам страницы предприятий (одно последовательное чтение)"""
+    id_rubric = request.args.get('id_rubric', type=int)
+    id_subrubric = request.args.get('id_subrubric', type=int)
+    id_city = request.args.get('id_city', type=int)
+    search_text = request.args.get('search_text', '').strip()
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'xlsx'
+
+    # Те же правила маскировки, что и на странице предприятий
+    has_full_access = current_user.has_positive_balance() or current_user.is_admin()
+    convert = partial(companies_export_row, masked=not has_full_access)
+
+    rows = mssql.iter_companies(
+        id_rubric=id_rubric,
+        id_subrubric=id_subrubric,
+        id_city=id_city,
         search_text=search_text if search_text else None,
-        limit=10000,
-        offset=0
+        batch_size=EXPORT_BATCH_SIZE
     )
 
-    # Создаем Excel файл
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Закупки"
-
-    # Заголовки
-    headers = ['Дата запроса', 'Товар/услуга', 'Цена контракта', 'Покупатель', 'Email', 'Телефон', 'Адрес']
-    ws.append(headers)
-
-    # Данные
-    for row in result['data']:
-        # Используем start_cost_var если есть, иначе числовой start_cost
-        price = row.get('start_cost_var') or (str(row['start_cost']) if row.get('start_cost') else '')
-
-        ws.append([
-            row['date_request'].strftime('%d.%m.%Y') if row['date_request'] else '',
-            row['purchase_object'],
-            price,
-            row['customer'],
-            row['email'],
-            row['phone'],
-            row['address']
-        ])
-
-    # Сохраняем в память
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    download_name = f'companies_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+
+    if export_format != 'xlsx':
+        return stream_response(
+            export_format,
+            COMPANIES_HEADERS,
+            COMPANIES_FIELDS,
+            rows,
+            convert,
+            download_name=download_name,
+            accept_gzip='gzip' in request.headers.get('Accept-Encoding', '')
+        )
+
+    return xlsx_response(
+        "Предприятия",
+        COMPANIES_HEADERS,
+        rows,
+        convert,
+        download_name=download_name
+    )
+
+
+@bp.route('/export/jobs', methods=['POST'])
+@login_required
+def export_job_create():
+    """Поставить выгрузку закупок в фоновую очередь - ответ сразу, с id задания"""
+    date_from_obj, date_to_obj, search_text, export_format = _export_zakupki_params(request.values)
+    include_specifications = request.values.get('specs') == '1'
+    headers, fields, convert = zakupki_export_columns(include_specifications)
+
+    def rows_factory():
+        rows = mssql.iter_zakupki(
+            date_from=date_from_obj,
+            date_to=date_to_obj,
+            search_text=search_text,
+            batch_size=EXPORT_BATCH_SIZE
+        )
+        if include_specifications:
+            rows = with_specifications(rows, partial(mssql.get_specifications_batch, route='replica'))
+        return rows
+
+    def count_factory():
+        # Количество для прогресса - точный COUNT на реплике (без порога CountService:
+        # большие выгрузки по фильтру иначе шли бы без прогресса); выполняется в рабочем потоке
+        result = mssql.get_zakupki(date_from=date_from_obj, date_to=date_to_obj, search_text=search_text,
+                                   limit=1, offset=0, route='replica', exact_count=True)
+        return result['total'], result.get('total_capped', False)
+
+    try:
+        job = export_jobs.submit(
+            current_user.id,
+            export_format,
+            "Закупки",
+            headers,
+            fields,
+            convert,
+            rows_factory,
+            count_factory=count_factory,
+            download_name=f'zakupki_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+        )
+    except ExportQueueFull:
+        return {'error': 'Очередь выгрузок переполнена, повторите попытку позже'}, 429
+
+    return {
+        'job_id': job.id,
+        'status_url': url_for('main.export_job_status', job_id=job.id)
+    }, 202
+
+
+def _get_export_job(job_id):
+    """Задание экспорта текущего пользователя (админ видит все) или None"""
+    job = export_jobs.get(job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.is_admin()):
+        return None
+    return job
+
+
+@bp.route('/export/jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    """Состояние задания: строк записано, прогресс, оценка оставшегося времени"""
+    job = _get_export_job(job_id)
+    if job is None:
+        return {'error': 'Задание не найдено'}, 404
+
+    status = job.to_dict()
+    if job.status == 'done':
+        status['download_url'] = url_for('main.export_job_download', job_id=job.id)
+    return status
+
+
+@bp.route('/export/jobs/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    """Готовый файл задания (повторная загрузка не перестраивает выгрузку)"""
+    job = _get_export_job(job_id)
+    if job is None or job.status != 'done' or not os.path.exists(job.path):
+        flash('Файл выгрузки не найден или срок его хранения истек', 'warning')
+        return redirect(url_for('main.index'))
 
     return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        job.path,
+        mimetype=job.mimetype,
         as_attachment=True,
-        download_name=f'zakupki_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        download_name=job.download_name,
+        conditional=True
     )
 
 @bp.route('/admin/sql-query', methods=['GET', 'POST'])
 @admin_required
 def admin_sql_query():
-    """Страница для выполнения произвольных SQL запросов (только для админов)"""
-    result = None
+    """Страница для выполнения произвольных SQL запросов (только для админов)
+
+    Запрос выполняется в фоне (app/sql_jobs.py), результат SELECT выводится
+    постранично из открытого курсора (app/sql_console.py)
+    """
     query = ""
+    history_id = request.args.get('history_id', type=int)
+    if history_id:
+        # Повтор запроса из истории - подставляем его текст в форму
+        history = db.session.get(SQLQueryHistory, history_id)
+        query = history.query_text if history else ""
 
     if request.method == 'POST':
         query = request.form.get('query', '').strip()
@@ -569,14 +840,128 @@ def admin_sql_query():
         if not query:
             flash('Введите SQL запрос', 'warning')
         else:
-            result = mssql.execute_query(query)
-
-            if result['success']:
-                if result['data']:
-                    flash(f'Запрос выполнен успешно. Получено строк: {result["rowcount"]}. Время: {result["query_time"]} мс', 'success')
-                else:
-                    flash(f'Запрос выполнен успешно. Затронуто строк: {result["rowcount"]}. Время: {result["query_time"]} мс', 'success')
+            try:
+                job = sql_jobs.submit(current_app._get_current_object(), current_user.id, query)
+            except SQLJobQueueFull:
+                flash('Слишком много выполняющихся запросов, дождитесь их завершения', 'warning')
             else:
-                flash(f'Ошибка выполнения запроса: {result["error"]}', 'danger')
+                return redirect(url_for('main.admin_sql_job', job_id=job.id))
 
-    return render_template('admin_sql_query.html', result=result, query=query)
+    return _render_sql_query(query=query)
+
+@bp.route('/admin/sql-query/jobs/<job_id>')
+@admin_required
+def admin_sql_job(job_id):
+    """Запрос консоли: время выполнения и отмена, пока он идет; первая страница результата - когда готов"""
+    job = sql_jobs.get(job_id)
+    if job is None:
+        flash('Запрос не найден или срок хранения его результата истек', 'warning')
+        return redirect(url_for('main.admin_sql_query'))
+
+    result = job.result if job.status == 'done' else None
+    if job.status == 'done' and not result['columns']:
+        flash(f'Запрос выполнен успешно. Затронуто строк: {result["rowcount"]}. Время: {result["query_time"]} мс', 'success')
+    elif job.status == 'done':
+        flash(f'Запрос выполнен успешно. Получено строк: {result["rowcount"]}'
+              f'{" (есть еще)" if result["has_more"] else ""}. Время: {result["query_time"]} мс', 'success')
+    elif job.status == 'failed':
+        flash(f'Ошибка выполнения запроса: {job.error}', 'danger')
+    elif job.status == 'canceled':
+        flash('Запрос отменен', 'warning')
+    return _render_sql_query(query=job.query, result=result, job=job)
+
+@bp.route('/admin/sql-query/jobs/<job_id>/status')
+@admin_required
+def admin_sql_job_status(job_id):
+    """Состояние запроса консоли (опрашивается страницей раз в секунду)"""
+    job = sql_jobs.get(job_id)
+    if job is None:
+        return {'error': 'Запрос не найден'}, 404
+    return job.to_dict()
+
+@bp.route('/admin/sql-query/jobs/<job_id>/cancel', methods=['POST'])
+@admin_required
+def admin_sql_job_cancel(job_id):
+    """Отменить запрос консоли (KILL сессии на SQL Server)"""
+    if not sql_jobs.cancel(job_id):
+        flash('Запрос уже завершен или отменить его не удалось', 'warning')
+    return redirect(url_for('main.admin_sql_job', job_id=job_id))
+
+def _render_sql_query(query, result=None, job=None):
+    history = SQLQueryHistory.query.order_by(SQLQueryHistory.id.desc()).limit(20).all()
+    return render_template('admin_sql_query.html', result=result, query=query, job=job, history=history,
+                           console=sql_console.get_stats())
+
+@bp.route('/admin/sql-query/<cursor_id>/next', methods=['POST'])
+@admin_required
+def admin_sql_query_next(cursor_id):
+    """Следующая страница открытой выборки консоли"""
+    query_cursor = sql_console.get(cursor_id)
+    query = query_cursor.query if query_cursor is not None else request.form.get('query', '')
+    result = sql_console.fetch_next(cursor_id)
+    if result is None:
+        flash('Выборка уже закрыта (истек срок или открыта новая) - выполните запрос заново', 'warning')
+    elif not result['success']:
+        flash(f'Ошибка чтения выборки: {result["error"]}', 'danger')
+    return _render_sql_query(query=query, result=result)
+
+@bp.route('/admin/sql-query/<cursor_id>/close', methods=['POST'])
+@admin_required
+def admin_sql_query_close(cursor_id):
+    """Закрыть выборку и освободить подключение"""
+    sql_console.close(cursor_id)
+    return redirect(url_for('main.admin_sql_query'))
+
+@bp.route('/admin/sql-query/csv', methods=['POST'])
+@admin_required
+def admin_sql_query_csv():
+    """Вся выборка запроса в CSV - строки идут из курсора в ответ порциями"""
+    query = request.form.get('query', '').strip()
+    if not query:
+        flash('Введите SQL запрос', 'warning')
+        return redirect(url_for('main.admin_sql_query'))
+
+    try:
+        columns, rows = sql_console.iter_rows(query)
+    except Exception as e:
+        flash(f'Ошибка выполнения запроса: {e}', 'danger')
+        return _render_sql_query(query=query)
+    if not columns:
+        flash('Запрос не возвращает строк - для выгрузки нужен SELECT (изменения отменены)', 'warning')
+        return _render_sql_query(query=query)
+
+    return stream_response(
+        'csv',
+        columns,
+        columns,
+        rows,
+        list,
+        download_name=f'query_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        accept_gzip='gzip' in request.headers.get('Accept-Encoding', '')
+    )
+
+@bp.route('/admin/sql-query/slow')
+@admin_required
+def admin_slow_queries():
+    """Журнал медленных запросов MSSQL (последние записи кольцевого буфера)"""
+    return render_template('admin_slow_queries.html',
+                           entries=mssql.slow_queries.entries(),
+                           slow_queries=mssql.slow_queries)
+
+@bp.route('/admin/sql-query/slow/<int:entry_id>/plan')
+@admin_required
+def admin_slow_query_plan(entry_id):
+    """Оценочный план медленного запроса - файл .sqlplan (открывается в SSMS)"""
+    entry = mssql.slow_queries.get(entry_id)
+    if entry is None or not entry['plan']:
+        flash('План выполнения не найден', 'warning')
+        return redirect(url_for('main.admin_slow_queries'))
+    return Response(entry['plan'], mimetype='application/xml',
+                    headers={'Content-Disposition': f'attachment; filename=slow_query_{entry_id}.sqlplan'})
+
+@bp.route('/admin/sql-query/slow/clear', methods=['POST'])
+@admin_required
+def admin_slow_queries_clear():
+    mssql.slow_queries.clear()
+    flash('Журнал медленных запросов очищен', 'success')
+    return redirect(url_for('main.admin_slow_queries'))
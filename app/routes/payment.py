@@ -1,6 +1,7 @@
 from flask import Blueprint, request, redirect, url_for, flash, render_template
 from flask_login import login_required, current_user
 from app.models import db, Transaction
+from app.user_cache import user_cache
 import requests
 import os
 import uuid
@@ -35,8 +36,11 @@ def create_payment():
         # ДЕМО-РЕЖИМ: Сразу пополняем баланс без реальной оплаты
         transaction.status = 'succeeded'
         transaction.payment_id = f"demo_{uuid.uuid4()}"
+        # current_user мог быть восстановлен из кэша - баланс перечитываем перед изменением
+        db.session.refresh(current_user._get_current_object())
         current_user.balance += transaction.amount
         db.session.commit()
+        user_cache.invalidate(current_user.id)
 
         flash(f'Баланс успешно пополнен на {amount} ₽ (демо-режим)', 'success')
         return redirect(url_for('payment.payment_success'))
@@ -107,6 +111,7 @@ def webhook():
             user = transaction.user
             user.balance += transaction.amount
             db.session.commit()
+            user_cache.invalidate(user.id)
 
     elif event['event'] == 'payment.canceled':
         payment_id = event['object']['id']
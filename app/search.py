@@ -0,0 +1,330 @@
+"""
+Полнотекстовый поиск закупок (purchase_object, customer)
+
+LIKE '%текст%' не использует индексы, поэтому поиск был ограничен 30 днями.
+Режим задается переменной ZAKUPKI_SEARCH_BACKEND:
+- like     - прежний LIKE по подстроке (по умолчанию, с ограничением периода);
+- fulltext - полнотекстовый индекс SQL Server (CONTAINS / CONTAINSTABLE,
+             словоформы через FORMSOF(INFLECTIONAL)), см. scripts/mssql_fulltext.sql;
+- local    - инвертированный индекс в памяти процесса, дополняется по id
+             фоновым потоком. Подходит для разработки и тестов без SQL Server
+             с полнотекстовым поиском (на полной таблице требует много памяти).
+
+Здесь же - разбор поисковой строки предприятий (ИНН / ОГРН / текст).
+"""
+import math
+import os
+import re
+import threading
+import time
+
+WORD_RE = re.compile(r'[0-9a-zа-я]+')
+
+# "7707083893", "ИНН 7707083893", "огрн: 1027700132195", "7707 083 893"
+REQUISITE_RE = re.compile(r'^(?:инн|огрнип|огрн)?[\s:№]*([\d][\d\s-]*)$', re.IGNORECASE)
+
+# Служебные слова, которые не несут смысла для поиска
+STOP_WORDS = frozenset("""
+    и в во на с со по к ко о об от до из за для при без под над не ни или а но
+    же ли то это как так что чем the of and
+""".split())
+
+# Окончания русских существительных, прилагательных и причастий - от длинных к коротким
+# (упрощенный стеммер в духе Snowball). Глагольные окончания не отсекаются: в названиях
+# закупок почти одни существительные, а "-ли", "-ть", "-ет" портят основы (кровли, печать, бюджет)
+RUSSIAN_ENDINGS = sorted(set("""
+    ующими ующего ующему ующей ующая ующее ующие ующий ующую
+    иями ями ами ией ием иях ого его ому ему ыми ими
+    ая яя ое ее ие ые ой ей ий ый ом ем ам ям ах ях ию ью ия ья ов ев ую юю их ых ым им
+    а я о е и ы у ю ь й
+""".split()), key=len, reverse=True)
+
+MIN_STEM_LENGTH = 3
+
+
+def stem(word):
+    """Основа слова: отсекаем самое длинное окончание, оставляя не меньше MIN_STEM_LENGTH букв
+
+    Цифры и латиница не изменяются (номера ГОСТ, артикулы, ИНН).
+    """
+    if not word or not ('а' <= word[0] <= 'я'):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text, stemmed=True):
+    """Разбить текст на (приведенные к основе) слова без служебных слов"""
+    if not text:
+        return []
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    words = [w for w in words if w not in STOP_WORDS and len(w) > 1]
+    if stemmed:
+        return [stem(w) for w in words]
+    return words
+
+
+def build_fulltext_query(text):
+    """Условие для CONTAINS / CONTAINSTABLE: все слова запроса в любой словоформе
+
+    'Поставка бумаги' -> FORMSOF(INFLECTIONAL, "поставка") AND FORMSOF(INFLECTIONAL, "бумаги")
+    """
+    words = tokenize(text, stemmed=False)
+    if not words:
+        return None
+    return ' AND '.join(f'FORMSOF(INFLECTIONAL, "{w}")' for w in words)
+
+
+def classify_company_search(text):
+    """Определить, что ищет пользователь в базе предприятий
+
+    ИНН - 10 (юр. лицо) или 12 (ИП) цифр, ОГРН - 13 цифр, ОГРНИП - 15 цифр.
+    Пробелы и дефисы внутри номера игнорируются.
+
+    Returns:
+        tuple: (вид, значение)
+            ('inn', '7707083893')    - точный поиск по ИНН
+            ('ogrn', '1027700132195') - точный поиск по ОГРН
+            ('digits', '77070')      - начало номера (префикс ИНН или ОГРН)
+            ('text', 'Ромашка')      - название / директор
+    """
+    text = (text or '').strip()
+    match = REQUISITE_RE.match(text)
+    if not match:
+        return 'text', text
+
+    digits = re.sub(r'[\s-]', '', match.group(1))
+    if len(digits) in (10, 12):
+        return 'inn', digits
+    if len(digits) in (13, 15):
+        return 'ogrn', digits
+    return 'digits', digits
+
+
+class InvertedIndex:
+    """Инвертированный индекс документов (закупок) в памяти
+
+    Документы добавляются по возрастанию id, поиск - пересечение списков
+    документов по всем словам запроса с ранжированием BM25.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._postings = {}  # основа слова -> {doc_id: частота}
+        self._docs = {}  # doc_id -> (created, количество слов)
+        self._total_length = 0
+        self.max_id = 0
+        self._lock = threading.RLock()
+
+    def add(self, doc_id, text, created=None):
+        """Проиндексировать документ (повторное добавление заменяет прежнюю версию)"""
+        terms = tokenize(text)
+        with self._lock:
+            if doc_id in self._docs:
+                self.remove(doc_id)
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, tf in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            self._docs[doc_id] = (created, len(terms))
+            self._total_length += len(terms)
+            if doc_id > self.max_id:
+                self.max_id = doc_id
+
+    def remove(self, doc_id):
+        """Удалить документ из индекса (полный проход по словарю - операция редкая)"""
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if doc is None:
+                return
+            self._total_length -= doc[1]
+            for term in [t for t, docs in self._postings.items() if doc_id in docs]:
+                docs = self._postings[term]
+                del docs[doc_id]
+                if not docs:
+                    del self._postings[term]
+
+    def search(self, query, date_from=None, date_to=None, order='id', limit=100, offset=0,
+               before_id=None, after_id=None):
+        """Найти документы, содержащие все слова запроса
+
+        Args:
+            order: 'id' - новые сверху (поддерживает before_id / after_id как в get_zakupki),
+                   'relevance' - по убыванию BM25
+        Returns:
+            dict: {'ids': [...], 'total': int, 'has_more': bool}
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        empty = {'ids': [], 'total': 0, 'has_more': False}
+        if not terms:
+            return empty
+
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return empty
+            postings.sort(key=len)
+
+            matches = []
+            for doc_id in postings[0]:
+                if not all(doc_id in docs for docs in postings[1:]):
+                    continue
+                created = self._docs[doc_id][0]
+                if date_from and (created is None or created < date_from):
+                    continue
+                if date_to and (created is None or created > date_to):
+                    continue
+                matches.append(doc_id)
+
+            total = len(matches)
+            if order == 'relevance':
+                scores = self._scores(matches, postings)
+                matches.sort(key=lambda doc_id: (scores[doc_id], doc_id), reverse=True)
+                page = matches[offset:offset + limit]
+                return {'ids': page, 'total': total, 'has_more': offset + limit < total}
+
+        matches.sort(reverse=True)
+        if before_id is not None:
+            candidates = [doc_id for doc_id in matches if doc_id < before_id]
+            return {'ids': candidates[:limit], 'total': total, 'has_more': len(candidates) > limit}
+        if after_id is not None:
+            candidates = [doc_id for doc_id in matches if doc_id > after_id]
+            return {'ids': candidates[-limit:], 'total': total, 'has_more': len(candidates) > limit}
+        return {'ids': matches[offset:offset + limit], 'total': total, 'has_more': offset + limit < total}
+
+    def _scores(self, doc_ids, postings):
+        """BM25 для найденных документов (под блокировкой)"""
+        count = len(self._docs)
+        avg_length = self._total_length / count if count else 1
+        scores = dict.fromkeys(doc_ids, 0.0)
+        for docs in postings:
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id in doc_ids:
+                tf = docs[doc_id]
+                length = self._docs[doc_id][1]
+                norm = self.K1 * (1 - self.B + self.B * length / (avg_length or 1))
+                scores[doc_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+        return scores
+
+    def __len__(self):
+        return len(self._docs)
+
+    def get_stats(self):
+        with self._lock:
+            return {'documents': len(self._docs), 'terms': len(self._postings), 'max_id': self.max_id}
+
+
+class ZakupkiSearch:
+    """Выбор механизма поиска по закупкам и поддержка локального индекса
+
+    Args:
+        backend: 'like' | 'fulltext' | 'local'
+        fetch_batch: функция (after_id, limit) -> строки с id, created, purchase_object, customer
+                     по возрастанию id (источник для локального индекса)
+        sync_interval: период дозагрузки новых закупок в локальный индекс (сек)
+        batch_size: количество строк за один запрос при дозагрузке
+    """
+
+    BACKENDS = ('like', 'fulltext', 'local')
+
+    def __init__(self, backend='like', fetch_batch=None, sync_interval=10.0, batch_size=5000):
+        if backend not in self.BACKENDS:
+            print(f"Unknown ZAKUPKI_SEARCH_BACKEND={backend}, using 'like'")
+            backend = 'like'
+        self.backend = backend
+        self.fetch_batch = fetch_batch
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.index = InvertedIndex()
+        self.ready = False  # локальный индекс построен полностью
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, fetch_batch=None):
+        return cls(
+            backend=os.getenv('ZAKUPKI_SEARCH_BACKEND', 'like').strip().lower(),
+            fetch_batch=fetch_batch,
+            sync_interval=float(os.getenv('ZAKUPKI_SEARCH_SYNC_INTERVAL', '10')),
+            batch_size=int(os.getenv('ZAKUPKI_SEARCH_BATCH_SIZE', '5000')),
+        )
+
+    @property
+    def indexed(self):
+        """Поиск идет по индексу - ограничивать период поиска не нужно"""
+        if self.backend == 'fulltext':
+            return True
+        return self.backend == 'local' and self.ready
+
+    @property
+    def uses_local_index(self):
+        return self.backend == 'local' and self.ready
+
+    def where_clause(self, search_text):
+        """SQL условие поиска для zakupki z
+
+        Returns:
+            tuple: (условие, параметры) или (None, []) если в запросе нет слов
+        """
+        if self.backend == 'fulltext':
+            fulltext_query = build_fulltext_query(search_text)
+            if fulltext_query is None:
+                return None, []
+            return "CONTAINS((z.purchase_object, z.customer), %s)", [fulltext_query]
+
+        search_param = f"%{search_text}%"
+        return """(
+                z.purchase_object LIKE %s
+                OR z.customer LIKE %s
+            )""", [search_param, search_param]
+
+    def start(self):
+        """Запустить построение и дозагрузку локального индекса (один раз на процесс)"""
+        if self.backend != 'local' or self.fetch_batch is None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='zakupki-search', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Search index sync error: {e}")
+            time.sleep(self.sync_interval)
+
+    def sync(self):
+        """Дозагрузить в локальный индекс закупки с id больше уже проиндексированных
+
+        Returns:
+            int: количество добавленных документов
+        """
+        added = 0
+        with self._sync_lock:
+            while True:
+                rows = self.fetch_batch(self.index.max_id, self.batch_size)
+                if rows is None:
+                    # Источник недоступен - индекс останется неполным до следующей попытки
+                    return added
+                for row in rows:
+                    text = f"{row.get('purchase_object') or ''} {row.get('customer') or ''}"
+                    self.index.add(row['id'], text, row.get('created'))
+                added += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+            self.ready = True
+        return added
+
+    def get_stats(self):
+        stats = self.index.get_stats()
+        stats.update({'backend': self.backend, 'ready': self.indexed})
+        return stats
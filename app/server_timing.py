@@ -0,0 +1,145 @@
+"""
+Заголовок Server-Timing с разбивкой времени запроса по фазам
+
+Каждый ответ получает заголовок вида
+    Server-Timing: mssql-connect;dur=1.2, mssql-count;dur=35.0, mssql-page;dur=80.4,
+                   app-db;dur=3.1, render;dur=12.7, total;dur=140.2
+(виден во вкладке Network браузера и может писаться в access log).
+
+- mssql-connect / mssql-count / mssql-page - фазы методов MSSQLConnection (app.metrics);
+- app-db - запросы SQLAlchemy к базе приложения (load_user, счетчики inject_counters и т.д.);
+- render - шаблоны Jinja (включает app-db запросы, выполненные во время рендера);
+- total - от начала обработки до after_request.
+
+Те же числа копятся по маршрутам в route_metrics (страница /admin/metrics).
+Время частей потокового ответа, отдаваемых после заголовков, не учитывается.
+"""
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.metrics import Metrics, metrics
+
+# Фаза metrics -> (имя в Server-Timing, описание)
+MSSQL_PHASES = {
+    'connect': ('mssql-connect', 'MSSQL connect'),
+    'count': ('mssql-count', 'MSSQL count'),
+    'fetch': ('mssql-page', 'MSSQL page query'),
+}
+
+TIMINGS = (
+    ('mssql-connect', 'MSSQL connect'),
+    ('mssql-count', 'MSSQL count'),
+    ('mssql-page', 'MSSQL page query'),
+    ('app-db', 'App DB'),
+    ('render', 'Template render'),
+)
+
+# Агрегаты по маршрутам: метод = endpoint, фаза = имя из Server-Timing
+route_metrics = Metrics()
+
+_engine_events_registered = False
+
+
+def init_app(app):
+    """Подключить сбор фаз: начало запроса, шаблоны, SQLAlchemy, фазы MSSQL"""
+    global _engine_events_registered
+
+    app.before_request(_start)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    if _on_mssql_phase not in metrics.listeners:
+        metrics.listeners.append(_on_mssql_phase)
+
+    if not _engine_events_registered:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_db_error)
+        _engine_events_registered = True
+
+
+def apply(response):
+    """Добавить Server-Timing к ответу и учесть фазы в агрегате маршрута (из after_request)"""
+    timings = _current()
+    if timings is None:
+        return response
+
+    total = (time.perf_counter() - g._server_timing_start) * 1000
+    parts = []
+    for name, description in TIMINGS:
+        if name in timings:
+            parts.append(f'{name};desc="{description}";dur={timings[name]:.1f}')
+    parts.append(f'total;dur={total:.1f}')
+    response.headers['Server-Timing'] = ', '.join(parts)
+
+    if request.endpoint and request.endpoint != 'static':
+        for name, value in timings.items():
+            route_metrics.observe(request.endpoint, name, value)
+        route_metrics.observe(request.endpoint, 'total', total, error=response.status_code >= 500)
+
+    # Повторный вызов (например, вложенный after_request) не должен учитывать запрос дважды
+    g._server_timing = None
+    return response
+
+
+def _start():
+    g._server_timing = {}
+    g._server_timing_start = time.perf_counter()
+
+
+def _current():
+    if not has_request_context():
+        return None
+    return g.get('_server_timing')
+
+
+def _add(name, value):
+    timings = _current()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + value
+
+
+def _on_mssql_phase(phase, elapsed):
+    if phase in MSSQL_PHASES:
+        _add(MSSQL_PHASES[phase][0], elapsed)
+
+
+def _before_render(sender, template, context, **extra):
+    stack = g.setdefault('_server_timing_render', [])
+    stack.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stack = g.get('_server_timing_render')
+    if not stack:
+        return
+    start = stack.pop()
+    if not stack:
+        # Вложенный render_template уже входит во внешний
+        _add('render', (time.perf_counter() - start) * 1000)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время начала - в контексте выполнения, а не в подключении пула: если запрос
+    # упадет, after_cursor_execute не вызывается и отметка уйдет вместе с контекстом
+    if context is not None:
+        context._server_timing_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish_statement(context)
+
+
+def _handle_db_error(exception_context):
+    # Упавший запрос тоже занимал базу
+    _finish_statement(exception_context.execution_context)
+
+
+def _finish_statement(context):
+    start = getattr(context, '_server_timing_start', None)
+    if start is not None:
+        context._server_timing_start = None
+        _add('app-db', (time.perf_counter() - start) * 1000)
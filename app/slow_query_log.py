@@ -0,0 +1,246 @@
+"""
+Журнал медленных запросов MSSQL (для админов)
+
+Включается переменной MSSQL_SLOW_QUERY_MS (порог, мс; 0 - выключено).
+Каждый оператор дольше порога (выполнение + чтение строк) попадает в
+кольцевой буфер в памяти и, если задан MSSQL_SLOW_QUERY_FILE, в файл
+с ротацией (одна JSON строка на запрос): текст SQL, параметры, метод
+MSSQLConnection, количество строк, время. С MSSQL_SLOW_QUERY_PLAN=1 для
+медленного оператора дополнительно снимается оценочный план выполнения
+(SET SHOWPLAN_XML ON - оператор при этом повторно не выполняется).
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from app.metrics import metrics
+
+
+class SlowQueryLog:
+    """Кольцевой буфер и файл медленных запросов
+
+    Args:
+        threshold_ms: порог времени оператора, мс (0 - журнал выключен)
+        size: сколько последних медленных запросов держать в памяти
+        path: файл журнала (None - только в памяти)
+        max_bytes: размер файла, после которого он ротируется
+        backup_count: сколько старых файлов хранить
+        capture_plan: снимать оценочный план (SHOWPLAN_XML) медленных операторов
+    """
+
+    def __init__(self, threshold_ms=0, size=200, path=None, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 capture_plan=False):
+        self.threshold_ms = threshold_ms
+        self.capture_plan = capture_plan
+        self.path = path
+        self._entries = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._logger = None
+        if path:
+            self._logger = logging.getLogger('xbmc.slow_queries')
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            if not self._logger.handlers:
+                handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self._logger.addHandler(handler)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold_ms=float(os.getenv('MSSQL_SLOW_QUERY_MS', '0')),
+            size=int(os.getenv('MSSQL_SLOW_QUERY_LOG_SIZE', '200')),
+            path=os.getenv('MSSQL_SLOW_QUERY_FILE') or None,
+            max_bytes=int(os.getenv('MSSQL_SLOW_QUERY_FILE_BYTES', str(10 * 1024 * 1024))),
+            backup_count=int(os.getenv('MSSQL_SLOW_QUERY_FILE_BACKUPS', '5')),
+            capture_plan=os.getenv('MSSQL_SLOW_QUERY_PLAN', '0').lower() in ('1', 'true', 'yes'),
+        )
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def wrap(self, conn):
+        """Подключение из пула -> подключение, курсоры которого замеряют операторы"""
+        if conn is None or not self.enabled:
+            return conn
+        return SlowQueryConnection(conn, self)
+
+    def record(self, sql, params, execute_ms, fetch_ms, rows, error=None, plan=None):
+        entry = {
+            'id': next(self._ids),
+            'time': datetime.now(),
+            'method': metrics.current_method(),
+            'duration_ms': round(execute_ms + fetch_ms, 1),
+            'execute_ms': round(execute_ms, 1),
+            'fetch_ms': round(fetch_ms, 1),
+            'rows': rows,
+            'sql': sql,
+            'params': list(params) if isinstance(params, (tuple, list)) else params,
+            'error': error,
+            'plan': plan,
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+        if self._logger is not None:
+            try:
+                self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+            except Exception as e:
+                print(f"Slow query log write error: {e}")
+        return entry
+
+    def entries(self):
+        """Медленные запросы, новые сверху"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def get(self, entry_id):
+        with self._lock:
+            for entry in self._entries:
+                if entry['id'] == entry_id:
+                    return entry
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SlowQueryConnection:
+    """Подключение пула, выдающее замеряющие курсоры (остальное - как у исходного)"""
+
+    def __init__(self, conn, log):
+        self._conn = conn
+        self._log = log
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._conn, self._log)
+
+    def close(self):
+        return self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TimedCursor:
+    """Курсор, который замеряет каждый оператор: execute + чтение его строк
+
+    Оператор считается завершенным после fetchall / fetchone, после
+    неполного fetchmany или сразу после execute, если строк нет (DML).
+    """
+
+    # Операторы, для которых план не снимается
+    NO_PLAN_PREFIXES = ('set ', 'use ', 'kill ', 'waitfor ')
+
+    def __init__(self, cursor, conn, log):
+        self._cursor = cursor
+        self._conn = conn
+        self._log = log
+        self._statement = None
+
+    def execute(self, query, params=None):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            if params is None:
+                result = self._cursor.execute(query)
+            else:
+                result = self._cursor.execute(query, params)
+        except Exception as e:
+            elapsed = (time.perf_counter() - start) * 1000
+            if elapsed >= self._log.threshold_ms:
+                self._log.record(query, params, elapsed, 0.0, None, error=str(e))
+            raise
+        elapsed = (time.perf_counter() - start) * 1000
+
+        self._statement = {'sql': query, 'params': params, 'execute': elapsed, 'fetch': 0.0, 'rows': 0}
+        if self._cursor.description is None:
+            self._statement['rows'] = self._cursor.rowcount
+            self._finish()
+        return result
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        if self._statement is not None:
+            self._statement['rows'] += len(rows)
+        self._finish()
+        return rows
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if self._statement is not None and row is not None:
+            self._statement['rows'] += 1
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = size or self._cursor.arraysize
+        rows = self._fetch(lambda: self._cursor.fetchmany(size))
+        if self._statement is not None:
+            self._statement['rows'] += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def _fetch(self, fetch):
+        start = time.perf_counter()
+        try:
+            return fetch()
+        finally:
+            if self._statement is not None:
+                self._statement['fetch'] += (time.perf_counter() - start) * 1000
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is None:
+            return
+        if statement['execute'] + statement['fetch'] < self._log.threshold_ms:
+            return
+
+        plan = None
+        if self._log.capture_plan and not statement['sql'].lstrip().lower().startswith(self.NO_PLAN_PREFIXES):
+            plan = self._capture_plan(statement['sql'], statement['params'])
+        self._log.record(statement['sql'], statement['params'], statement['execute'], statement['fetch'],
+                         statement['rows'], plan=plan)
+
+    def _capture_plan(self, sql, params):
+        """Оценочный план оператора (XML) - оператор компилируется, но не выполняется"""
+        cursor = self._conn.raw.cursor()
+        try:
+            cursor.execute("SET SHOWPLAN_XML ON")
+            try:
+                if params is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute(sql, params)
+                row = cursor.fetchone()
+                # Оператор может вернуть несколько наборов (по одному на запрос пакета) - читаем до конца
+                while cursor.nextset():
+                    pass
+            finally:
+                cursor.execute("SET SHOWPLAN_XML OFF")
+            return row[0] if row else None
+        except Exception as e:
+            print(f"Slow query plan capture error: {e}")
+            # SHOWPLAN_XML мог остаться включенным - такое подключение в пул не возвращаем
+            self._conn.invalidate()
+            return None
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
@@ -0,0 +1,294 @@
+"""
+Консоль произвольных SQL запросов для админов
+
+Результат SELECT не читается целиком: первая страница (MSSQL_CONSOLE_PAGE_SIZE
+строк) выбирается через fetchmany, а открытый курсор вместе с подключением
+сохраняется в реестре - следующие страницы дочитываются из той же выборки
+без повторного выполнения запроса. Всего через консоль можно пролистать не
+больше MSSQL_CONSOLE_MAX_ROWS строк, дальше выборка закрывается с пометкой
+"обрезано"; полную выборку можно скачать CSV - строки идут из курсора в ответ
+порциями, не накапливаясь в памяти.
+
+Подключения берутся из отдельного пула консоли (mssql.get_console_connection) -
+без таймаута запросов страниц MSSQL_QUERY_TIMEOUT, свой задается
+MSSQL_CONSOLE_QUERY_TIMEOUT (по умолчанию без ограничения, долгий запрос отменяется).
+
+Курсор держит подключение пула, поэтому открытых курсоров не больше
+MSSQL_CONSOLE_CURSORS (при превышении закрывается самый давний), а
+неиспользуемый дольше MSSQL_CONSOLE_CURSOR_TTL секунд закрывается сам.
+
+Время запросов консоли пишется в метрики (серии execute_query, execute_query_next,
+execute_query_csv; фазы connect и fetch).
+"""
+import os
+import threading
+import time
+import uuid
+
+from app.metrics import metrics
+from app.mssql import mssql
+
+
+class QueryCursor:
+    """Открытая выборка консоли: подключение, курсор и позиция"""
+
+    def __init__(self, query, conn, cursor, columns):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.conn = conn
+        self.cursor = cursor
+        self.columns = columns
+        self.offset = 0
+        self.exhausted = False
+        self.truncated = False
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        # Строка, прочитанная сверх страницы (по ней видно, есть ли следующая)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def close(self):
+        if self.conn is None:
+            return
+        if not self.exhausted:
+            # Выборка не дочитана до конца - подключение в пул не возвращаем
+            self.conn.invalidate()
+        self.conn.close()
+        self.conn = self.cursor = None
+
+
+class SQLConsole:
+    """Постраничное выполнение запросов консоли и выгрузка в CSV
+
+    Args:
+        mssql: MSSQLConnection
+        page_size: строк на странице
+        max_rows: максимум строк, которые можно пролистать в одной выборке
+        max_cursors: максимум одновременно открытых выборок (каждая держит подключение пула)
+        cursor_ttl: через сколько секунд без обращений выборка закрывается
+    """
+
+    def __init__(self, mssql, page_size=500, max_rows=10000, max_cursors=2, cursor_ttl=300.0):
+        self.mssql = mssql
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.max_cursors = max_cursors
+        self.cursor_ttl = cursor_ttl
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, mssql):
+        return cls(
+            mssql,
+            page_size=int(os.getenv('MSSQL_CONSOLE_PAGE_SIZE', '500')),
+            max_rows=int(os.getenv('MSSQL_CONSOLE_MAX_ROWS', '10000')),
+            max_cursors=int(os.getenv('MSSQL_CONSOLE_CURSORS', '2')),
+            cursor_ttl=float(os.getenv('MSSQL_CONSOLE_CURSOR_TTL', '300')),
+        )
+
+    @metrics.timed('execute_query')
+    def execute(self, query, on_spid=None):
+        """Выполнить запрос и вернуть первую страницу
+
+        Args:
+            on_spid: функция (spid) - вызывается до выполнения запроса с номером сессии
+                     SQL Server (для отмены через KILL, см. app/sql_jobs.py)
+
+        Returns:
+            dict: {'success', 'columns', 'data' (кортежи значений), 'offset', 'rowcount',
+                   'has_more', 'truncated', 'cursor_id', 'query_time', 'error'}
+                  cursor_id - id выборки для fetch_next (None, если строк больше нет)
+        """
+        start = time.perf_counter()
+        try:
+            conn = self.mssql.get_console_connection()
+        except Exception as e:
+            return _error(f'Не удалось подключиться к базе данных: {e}')
+
+        with metrics.phase('fetch'):
+            try:
+                cursor = conn.cursor()
+                if on_spid is not None:
+                    cursor.execute("SELECT @@SPID")
+                    on_spid(cursor.fetchone()[0])
+                cursor.execute(query)
+                if not cursor.description:
+                    # INSERT / UPDATE / DELETE
+                    rowcount = cursor.rowcount
+                    conn.commit()
+                    # Данные могли измениться - закэшированные количества больше не актуальны
+                    self.mssql.counts.invalidate()
+                    conn.close()
+                    return {
+                        'success': True, 'columns': [], 'data': [], 'offset': 0, 'rowcount': rowcount,
+                        'has_more': False, 'truncated': False, 'cursor_id': None,
+                        'query_time': round((time.perf_counter() - start) * 1000, 2), 'error': None,
+                    }
+                columns = [desc[0] for desc in cursor.description]
+            except Exception as e:
+                conn.invalidate()
+                conn.close()
+                return _error(str(e))
+
+            query_cursor = QueryCursor(query, conn, cursor, columns)
+            result = self._page(query_cursor)
+        result['query_time'] = round((time.perf_counter() - start) * 1000, 2)
+        if query_cursor.conn is not None:
+            self._register(query_cursor)
+        return result
+
+    @metrics.timed('execute_query_next')
+    def fetch_next(self, cursor_id):
+        """Следующая страница открытой выборки
+
+        Returns:
+            dict как у execute или None, если выборка уже закрыта (истек срок / вытеснена)
+        """
+        self._expire()
+        with self._lock:
+            query_cursor = self._cursors.get(cursor_id)
+        if query_cursor is None:
+            return None
+
+        start = time.perf_counter()
+        with query_cursor._lock:
+            if query_cursor.conn is None:
+                return None
+            with metrics.phase('fetch'):
+                result = self._page(query_cursor)
+        result['query_time'] = round((time.perf_counter() - start) * 1000, 2)
+        if query_cursor.conn is None:
+            self._unregister(cursor_id)
+        return result
+
+    def close(self, cursor_id):
+        query_cursor = self._unregister(cursor_id)
+        if query_cursor is not None:
+            with query_cursor._lock:
+                query_cursor.close()
+
+    def get(self, cursor_id):
+        with self._lock:
+            return self._cursors.get(cursor_id)
+
+    @metrics.timed('execute_query_csv')
+    def iter_rows(self, query, batch_size=None):
+        """Выполнить запрос и вернуть (колонки, итератор строк-кортежей) для выгрузки
+
+        Подключение занято, пока итератор не дочитан или не закрыт (обрыв скачивания).
+        Ошибки подключения и выполнения запроса возникают здесь, до начала ответа
+        (в метриках - время до первой строки, чтение выгрузки не входит).
+
+        Returns:
+            tuple: (columns, rows); columns пустой для запросов без результата
+        """
+        batch_size = batch_size or self.page_size
+        conn = self.mssql.get_console_connection()
+        try:
+            cursor = conn.cursor()
+            with metrics.phase('fetch'):
+                cursor.execute(query)
+        except Exception:
+            conn.invalidate()
+            conn.close()
+            raise
+
+        if not cursor.description:
+            conn.rollback()
+            conn.close()
+            return [], iter(())
+
+        def rows():
+            exhausted = False
+            try:
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        exhausted = True
+                        break
+                    yield from batch
+            finally:
+                if not exhausted:
+                    conn.invalidate()
+                conn.close()
+
+        return [desc[0] for desc in cursor.description], rows()
+
+    def get_stats(self):
+        self._expire()
+        with self._lock:
+            return {'open_cursors': len(self._cursors), 'max_cursors': self.max_cursors,
+                    'page_size': self.page_size, 'max_rows': self.max_rows}
+
+    def _page(self, query_cursor):
+        """Прочитать страницу (под блокировкой курсора); закрывает курсор, если строк больше нет"""
+        limit = min(self.page_size, self.max_rows - query_cursor.offset)
+        try:
+            rows = query_cursor._pending + query_cursor.cursor.fetchmany(limit + 1 - len(query_cursor._pending))
+        except Exception as e:
+            query_cursor.close()
+            return _error(str(e))
+
+        data, query_cursor._pending = rows[:limit], rows[limit:]
+        offset = query_cursor.offset
+        query_cursor.offset += len(data)
+        query_cursor.last_used = time.time()
+        has_more = bool(query_cursor._pending)
+
+        if not has_more:
+            query_cursor.exhausted = True
+        if has_more and query_cursor.offset >= self.max_rows:
+            query_cursor.truncated = True
+            has_more = False
+        if not has_more:
+            query_cursor.close()
+
+        return {
+            'success': True,
+            'columns': query_cursor.columns,
+            'data': data,
+            'offset': offset,
+            'rowcount': len(data),
+            'has_more': has_more,
+            'truncated': query_cursor.truncated,
+            'cursor_id': query_cursor.id if has_more else None,
+            'error': None,
+        }
+
+    def _register(self, query_cursor):
+        self._expire()
+        evicted = []
+        with self._lock:
+            self._cursors[query_cursor.id] = query_cursor
+            while len(self._cursors) > self.max_cursors:
+                oldest = min(self._cursors.values(), key=lambda item: item.last_used)
+                evicted.append(self._cursors.pop(oldest.id))
+        for item in evicted:
+            with item._lock:
+                item.close()
+
+    def _unregister(self, cursor_id):
+        with self._lock:
+            return self._cursors.pop(cursor_id, None)
+
+    def _expire(self):
+        """Закрыть выборки, к которым не обращались дольше cursor_ttl"""
+        now = time.time()
+        with self._lock:
+            expired = [item for item in self._cursors.values() if now - item.last_used > self.cursor_ttl]
+            for item in expired:
+                del self._cursors[item.id]
+        for item in expired:
+            with item._lock:
+                item.close()
+
+
+def _error(message):
+    return {
+        'success': False, 'columns': [], 'data': [], 'offset': 0, 'rowcount': 0, 'has_more': False,
+        'truncated': False, 'cursor_id': None, 'error': message,
+    }
+
+
+sql_console = SQLConsole.from_env(mssql)
@@ -0,0 +1,242 @@
+"""
+Фоновое выполнение запросов консоли SQL с отменой и историей
+
+Запрос админа больше не занимает поток waitress до завершения: он ставится
+в очередь и выполняется ограниченным пулом потоков, страница опрашивает
+состояние задания (время выполнения) и показывает результат, когда он готов.
+Выполняющийся запрос можно отменить - по номеру сессии (@@SPID), полученному
+перед запуском, сервер получает KILL с отдельного подключения. Отмена, пришедшая
+до того, как номер сессии известен, прерывает запрос до его выполнения; если
+запрос успел завершиться, записывается его настоящий результат.
+
+Каждый запрос записывается в таблицу sql_query_history базы приложения:
+текст, статус, длительность, количество строк и ошибка.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app.models import db, SQLQueryHistory
+from app.result_cache import result_cache
+from app.sql_console import sql_console
+
+
+class SQLJobQueueFull(Exception):
+    """Слишком много незавершенных запросов консоли"""
+    pass
+
+
+class SQLJobCanceled(Exception):
+    """Запрос отменен до выполнения"""
+    pass
+
+
+class SQLQueryJob:
+    """Запрос консоли и его состояние"""
+
+    def __init__(self, user_id, query, history_id):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.query = query
+        self.history_id = history_id
+
+        self.status = 'queued'  # queued | running | done | failed | canceled
+        self.spid = None
+        self.cancel_requested = False
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'canceled')
+
+    def elapsed(self):
+        if not self.started_at:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'elapsed': round(self.elapsed(), 1),
+            'spid': self.spid,
+            'rowcount': self.result['rowcount'] if self.result else None,
+            'error': self.error,
+        }
+
+
+class SQLJobManager:
+    """Очередь запросов консоли с ограниченным пулом потоков
+
+    Args:
+        console: SQLConsole, через которую выполняются запросы
+        workers: количество одновременно выполняемых запросов
+        max_pending: максимум запросов в очереди и в работе
+        retention: сколько секунд хранить результат завершенного запроса
+    """
+
+    def __init__(self, console, workers=2, max_pending=5, retention=3600.0):
+        self.console = console
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls, console):
+        return cls(
+            console,
+            workers=int(os.getenv('MSSQL_CONSOLE_WORKERS', '2')),
+            max_pending=int(os.getenv('MSSQL_CONSOLE_MAX_PENDING', '5')),
+            retention=float(os.getenv('MSSQL_CONSOLE_RETENTION', '3600')),
+        )
+
+    def submit(self, app, user_id, query):
+        """Поставить запрос в очередь и записать его в историю (вызывается в контексте запроса)
+
+        Args:
+            app: приложение Flask - история обновляется в рабочем потоке в его контексте
+        Returns:
+            SQLQueryJob
+        Raises:
+            SQLJobQueueFull: если незавершенных запросов уже max_pending
+        """
+        self.cleanup()
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+        if pending >= self.max_pending:
+            raise SQLJobQueueFull(f"SQL console queue is full ({pending} jobs)")
+
+        history = SQLQueryHistory(user_id=user_id, query_text=query, status='running')
+        db.session.add(history)
+        db.session.commit()
+
+        job = SQLQueryJob(user_id, query, history.id)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sql-console')
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, app, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Отменить запрос: из очереди - сразу, выполняющийся - KILL его сессии на сервере
+
+        Returns:
+            bool: отмена запрошена (False - запрос уже завершен или не найден). Запрос,
+                  успевший выполниться до отмены, завершится со своим результатом
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_requested = True
+        if job.status == 'queued' or job.spid is None:
+            # Поток еще не начал выполнение - он увидит cancel_requested
+            return True
+
+        conn = self.console.mssql.get_console_connection()
+        try:
+            # KILL нельзя выполнить внутри транзакции
+            conn.autocommit(True)
+            conn.cursor().execute(f"KILL {int(job.spid)}")
+            conn.autocommit(False)
+        except Exception as e:
+            print(f"SQL console cancel of session {job.spid} failed: {e}")
+            conn.invalidate()
+            return False
+        finally:
+            conn.close()
+        return True
+
+    def _run(self, app, job):
+        if job.cancel_requested:
+            self._finish(app, job, 'canceled')
+            return
+
+        job.status = 'running'
+        job.started_at = time.time()
+        aborted = []
+
+        def on_spid(spid):
+            # Порядок важен: cancel() сначала ставит cancel_requested, потом читает spid -
+            # отмена либо увидит spid и пошлет KILL, либо будет замечена здесь
+            job.spid = spid
+            if job.cancel_requested:
+                aborted.append(spid)
+                raise SQLJobCanceled('Запрос отменен')
+
+        try:
+            result = self.console.execute(job.query, on_spid=on_spid)
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'columns': [], 'data': [], 'rowcount': 0,
+                      'has_more': False, 'cursor_id': None}
+
+        # Запрос не начинался или прерван KILL. Если он успел выполниться (в том числе
+        # DML с commit), отмена опоздала - записываем настоящий результат
+        if aborted or (job.cancel_requested and not result['success']):
+            job.error = 'Запрос отменен'
+            self._finish(app, job, 'canceled')
+            return
+
+        job.result = result
+        if not result['success']:
+            job.error = result['error']
+            self._finish(app, job, 'failed')
+            return
+        if not result['columns']:
+            # INSERT/UPDATE/DELETE - закэшированные страницы могли устареть
+            result_cache.invalidate()
+        self._finish(app, job, 'done')
+
+    def _finish(self, app, job, status):
+        job.finished_at = time.time()
+        try:
+            with app.app_context():
+                history = db.session.get(SQLQueryHistory, job.history_id)
+                if history is not None:
+                    history.status = status
+                    history.error = job.error
+                    history.duration_ms = round(job.elapsed() * 1000, 2) if job.started_at else None
+                    if job.result and job.result['success']:
+                        history.rowcount = job.result['rowcount']
+                        history.has_more = job.result['has_more']
+                    history.finished_at = datetime.utcnow()
+                    db.session.commit()
+        except Exception as e:
+            print(f"SQL console history update failed: {e}")
+        # Статус меняется после записи истории - страница, перезагрузившись по завершении, увидит ее
+        job.status = status
+
+    def cleanup(self):
+        """Удалить завершенные задания старше срока хранения (их выборки закроются по сроку консоли)"""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.finished_at > self.retention]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def get_stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        stats = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0, 'canceled': 0}
+        for job in jobs:
+            stats[job.status] += 1
+        return stats
+
+
+sql_jobs = SQLJobManager.from_env(sql_console)
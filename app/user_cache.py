@@ -0,0 +1,76 @@
+"""
+Кэш пользователей для login_manager.user_loader
+
+Раньше каждый запрос авторизованного пользователя начинался с
+User.query.get(id). Теперь значения колонок пользователя хранятся в памяти
+процесса с коротким TTL, а объект User восстанавливается из них без SELECT
+и присоединяется к сессии (изменения current_user по-прежнему сохраняются
+через db.session.commit()). Маршруты, меняющие пользователя (платежи,
+права администратора, подтверждение email / телефона), сбрасывают запись.
+"""
+import os
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.cache import TTLCache
+from app.models import db, User
+
+
+class UserCache:
+    """Снимки колонок пользователей по id
+
+    Args:
+        ttl: время жизни снимка (сек); 0 - кэш выключен
+        maxsize: максимум пользователей в кэше
+    """
+
+    def __init__(self, ttl=30.0, maxsize=10000):
+        self.enabled = ttl > 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl=float(os.getenv('USER_CACHE_TTL', '30')),
+            maxsize=int(os.getenv('USER_CACHE_MAX_SIZE', '10000')),
+        )
+
+    def load(self, user_id):
+        """Пользователь по id: из снимка (без запроса) или из базы"""
+        if not self.enabled:
+            return User.query.get(user_id)
+
+        snapshot = self._cache.get(user_id)
+        if snapshot is not None:
+            return self._restore(snapshot)
+
+        user = User.query.get(user_id)
+        if user is not None:
+            self._cache.set(user_id, self._snapshot(user))
+        return user
+
+    def invalidate(self, user_id=None):
+        """Сбросить снимок пользователя (всех, если id не задан) после изменения"""
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(user_id)
+
+    def get_stats(self):
+        return self._cache.get_stats()
+
+    @staticmethod
+    def _snapshot(user):
+        return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+    @staticmethod
+    def _restore(snapshot):
+        user = User(**snapshot)
+        # Объект считается загруженным из базы: merge(load=False) присоединяет его
+        # к сессии без SELECT (или возвращает уже загруженный в этом запросе экземпляр)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+user_cache = UserCache.from_env()
@@ -1,6 +1,8 @@
 """
 Вспомогательные функции
 """
+import base64
+
 
 def mask_email(email, mask_percentage=45):
     """
@@ -167,3 +169,34 @@ def format_price(value):
             return value
 
     return str(value)
+
+
+def encode_page_cursor(direction, last_id):
+    """
+    Кодирует курсор keyset-пагинации в непрозрачную строку для URL
+
+    direction: 'next' - записи с id меньше last_id (следующая страница при ORDER BY id DESC)
+               'prev' - записи с id больше last_id (предыдущая страница)
+    """
+    raw = f"{'n' if direction == 'next' else 'p'}:{int(last_id)}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(token):
+    """
+    Декодирует курсор keyset-пагинации
+
+    Возвращает кортеж (direction, last_id) или None, если курсор отсутствует или поврежден
+    """
+    if not token:
+        return None
+
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii')
+        prefix, value = raw.split(':', 1)
+        if prefix not in ('n', 'p'):
+            return None
+        return ('next' if prefix == 'n' else 'prev', int(value))
+    except (ValueError, UnicodeError):
+        return None
@@ -1,9 +1,19 @@
 from app import create_app
+from app.reference_cache import reference_cache
+from app.preview_window import preview_window
+from app.mssql import mssql
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = create_app()
 
+# Предзагрузка справочников MSSQL (в фоне, не задерживает старт)
+reference_cache.preload()
+# Окно предпросмотра для гостей обновляется фоновым потоком
+preview_window.start()
+# Локальный поисковый индекс закупок (ZAKUPKI_SEARCH_BACKEND=local) строится в фоне
+mssql.search.start()
+
 if __name__ == '__main__':
     app.run(debug=False, host='0.0.0.0', port=5000)
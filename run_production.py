@@ -3,10 +3,20 @@ Production server using Waitress (Windows-compatible WSGI server)
 """
 from waitress import serve
 from app import create_app
+from app.reference_cache import reference_cache
+from app.preview_window import preview_window
+from app.mssql import mssql
 import os
 
 app = create_app()
 
+# Предзагрузка справочников MSSQL (в фоне, не задерживает старт)
+reference_cache.preload()
+# Окно предпросмотра для гостей обновляется фоновым потоком
+preview_window.start()
+# Локальный поисковый индекс закупок (ZAKUPKI_SEARCH_BACKEND=local) строится в фоне
+mssql.search.start()
+
 if __name__ == '__main__':
     host = os.getenv('FLASK_HOST', '127.0.0.1')
     port = int(os.getenv('FLASK_PORT', 5000))
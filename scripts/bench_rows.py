@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк: строки выборки dict (cursor as_dict=True) против Row (app/rows.py)
+
+Строки имитируют страницу списка закупок (10 колонок get_zakupki).
+Для каждого представления на 1000 строк измеряется:
+- память (tracemalloc, без самих значений - они общие для обоих вариантов);
+- время построения строк из кортежей драйвера (pymssql строит dict в C, так что
+  для dict цифра завышена - основной выигрыш Row в памяти);
+- время чтения полей: в шаблоне (item.email - через Environment.getattr Jinja)
+  и в коде (row['id'], row.get('email')).
+
+Использование:
+    python3 scripts/bench_rows.py [--rows 1000] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from jinja2 import Environment
+
+from app.rows import row_type
+
+COLUMNS = ('id', 'date_request', 'purchase_object', 'start_cost_var', 'start_cost',
+           'customer', 'email', 'phone', 'address', 'purchase_type')
+
+
+def make_tuples(count):
+    """Строки в том виде, в каком их отдает курсор без as_dict"""
+    created = datetime(2024, 1, 1)
+    return [(1000000 - i, created, f'Поставка бумаги {i}', None, 100.0 + i, 'ГБУЗ "Больница"',
+             'zakupki@example.com', '+79161234567', 'г. Москва', 'Электронный аукцион')
+            for i in range(count)]
+
+
+def build_dicts(tuples):
+    # pymssql строит такой же dict на каждую строку
+    return [dict(zip(COLUMNS, values)) for values in tuples]
+
+
+def build_rows(tuples):
+    return list(map(row_type(COLUMNS), tuples))
+
+
+def read_keys(rows):
+    total = 0
+    for row in rows:
+        total += row['id']
+        if row.get('email') and row['purchase_object']:
+            total += 1
+    return total
+
+
+def read_template(rows, getattr=Environment().getattr):
+    # Так шаблон списка читает {{ item.id }}, {{ item.email }}, {{ item.purchase_object }}
+    total = 0
+    for item in rows:
+        total += getattr(item, 'id')
+        if getattr(item, 'email') and getattr(item, 'purchase_object'):
+            total += 1
+    return total
+
+
+def measure_memory(build, tuples):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = build(tuples)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del rows
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    tuples = make_tuples(args.rows)
+    dicts = build_dicts(tuples)
+    rows = build_rows(tuples)
+    assert read_keys(dicts) == read_keys(rows) == read_template(rows)
+
+    results = {}
+    for name, build, built in (('dict', build_dicts, dicts), ('Row', build_rows, rows)):
+        results[name] = {
+            'memory': measure_memory(build, tuples),
+            'build': min(timeit.repeat(lambda: build(tuples), number=args.repeat, repeat=3)) / args.repeat,
+            'template': min(timeit.repeat(lambda: read_template(built), number=args.repeat, repeat=3)) / args.repeat,
+            'keys': min(timeit.repeat(lambda: read_keys(built), number=args.repeat, repeat=3)) / args.repeat,
+        }
+
+    print(f"{args.rows} строк, {len(COLUMNS)} колонок\n")
+    print(f"{'':6} {'память, КБ':>12} {'построение, мс':>16} {'шаблон, мс':>12} {'по ключу, мс':>14}")
+    for name, item in results.items():
+        print(f"{name:6} {item['memory'] / 1024:12.1f} {item['build'] * 1000:16.3f} "
+              f"{item['template'] * 1000:12.3f} {item['keys'] * 1000:14.3f}")
+
+    base, compact = results['dict'], results['Row']
+    print(f"\nЭкономия памяти: {(base['memory'] - compact['memory']) / 1024:.1f} КБ "
+          f"({1 - compact['memory'] / base['memory']:.0%})")
+    for key, title in (('build', 'Построение'), ('template', 'Чтение в шаблоне'), ('keys', 'Чтение по ключу')):
+        print(f"{title}: {(base[key] - compact[key]) * 1000:+.3f} мс экономии на {args.rows} строк "
+              f"(x{base[key] / compact[key]:.2f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+-- Полнотекстовый индекс для поиска по закупкам (ZAKUPKI_SEARCH_BACKEND=fulltext)
+-- Требуется компонент Full-Text Search SQL Server. Выполнять вручную:
+--   sqlcmd -S <server> -d <database> -i scripts/mssql_fulltext.sql
+--
+-- Индекс обновляется сервером автоматически (CHANGE_TRACKING AUTO) по мере
+-- добавления закупок. Первичное заполнение на всей таблице идет в фоне,
+-- ход можно смотреть запросом:
+--   SELECT FULLTEXTCATALOGPROPERTY('ftc_zakupki', 'PopulateStatus')  -- 0 = завершено
+
+IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'ftc_zakupki')
+    CREATE FULLTEXT CATALOG ftc_zakupki;
+
+-- KEY INDEX - уникальный индекс по id (первичный ключ таблицы), его имя ищем в каталоге
+IF NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('zakupki'))
+BEGIN
+    DECLARE @key_index sysname = (
+        SELECT TOP 1 i.name
+        FROM sys.indexes i
+        JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+        JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+        WHERE i.object_id = OBJECT_ID('zakupki') AND i.is_unique = 1 AND c.name = 'id'
+        ORDER BY i.is_primary_key DESC
+    );
+
+    IF @key_index IS NULL
+        RAISERROR('zakupki: нет уникального индекса по id для полнотекстового индекса', 16, 1);
+    ELSE
+        -- LANGUAGE 1049 - русский: словоформы (FORMSOF INFLECTIONAL) и стоп-слова
+        EXEC('CREATE FULLTEXT INDEX ON zakupki (purchase_object LANGUAGE 1049, customer LANGUAGE 1049)
+              KEY INDEX ' + @key_index + ' ON ftc_zakupki
+              WITH CHANGE_TRACKING AUTO');
+END
@@ -0,0 +1,21 @@
+-- Рекомендуемые индексы MSSQL для запросов приложения
+-- Выполнять вручную в SSMS / sqlcmd на базе данных MSSQL_DATABASE:
+--   sqlcmd -S <server> -d <database> -i scripts/mssql_indexes.sql
+
+-- Keyset-пагинация get_companies с фильтрами: WHERE <фильтр> = @x AND id < @last ORDER BY id DESC
+-- превращается в поиск по индексу (фильтр, id) вместо сканирования всей таблицы
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_db_companies_city_id')
+    CREATE INDEX IX_db_companies_city_id ON db_companies (id_city, id DESC);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_db_companies_rubric_id')
+    CREATE INDEX IX_db_companies_rubric_id ON db_companies (id_rubric, id DESC);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_db_companies_subrubric_id')
+    CREATE INDEX IX_db_companies_subrubric_id ON db_companies (id_subrubric, id DESC);
+
+-- Поиск предприятий по ИНН / ОГРН: точное совпадение и начало номера (LIKE '7707%')
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_db_companies_inn')
+    CREATE INDEX IX_db_companies_inn ON db_companies (inn);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_db_companies_ogrn')
+    CREATE INDEX IX_db_companies_ogrn ON db_companies (ogrn);
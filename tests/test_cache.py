@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Тесты для LRU/TTL кэша и кэша результатов (без реального сервера)
+"""
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+
+from app.cache import TTLCache, WatermarkTracker
+from app.mssql_breaker import MSSQLUnavailable
+from app.result_cache import ResultCache, result_key
+
+
+def test_lru_eviction():
+    """При переполнении вытесняется давно не использованная запись"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.get_stats()['evictions'] == 1
+    print("✓ LRU вытеснение")
+
+
+def test_ttl_expiration():
+    """Запись перестает возвращаться после истечения TTL"""
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+
+    assert cache.get('a') is None
+    assert cache.get_stats()['expired'] == 1
+    print("✓ Истечение TTL")
+
+
+def test_weight_limit():
+    """Суммарный вес записей ограничен maxsize"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 'x', weight=6)
+    cache.set('b', 'y', weight=6)
+    cache.set('huge', 'z', weight=11)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 'y'
+    assert cache.get('huge') is None
+    assert cache.get_stats()['weight'] == 6
+    print("✓ Ограничение по весу")
+
+
+def test_watermark_tracker_throttles():
+    """MAX(id) запрашивается не чаще интервала"""
+    tracker = WatermarkTracker(interval=60)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return 100
+
+    assert tracker.get('zakupki', fetch) == 100
+    assert tracker.get('zakupki', fetch) == 100
+    assert len(calls) == 1
+    print("✓ Отметка MAX(id) проверяется с ограничением частоты")
+
+
+def test_watermark_tracker_single_flight():
+    """Пока один поток обновляет отметку, остальные сразу получают последнюю известную"""
+    tracker = WatermarkTracker(interval=0.01)
+    tracker.get('zakupki', lambda: 100)
+    time.sleep(0.02)
+    assert tracker.get('zakupki', lambda: 100, blocking=False) is None
+
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        release.wait(5)
+        return 101
+
+    thread = threading.Thread(target=tracker.get, args=('zakupki', slow_fetch))
+    thread.start()
+    for _ in range(100):
+        if calls:
+            break
+        time.sleep(0.01)
+
+    start = time.time()
+    assert tracker.get('zakupki', slow_fetch) == 100
+    assert time.time() - start < 0.5 and len(calls) == 1
+
+    release.set()
+    thread.join()
+    assert tracker.get('zakupki', slow_fetch) == 101
+    print("✓ Отметка MAX(id) обновляется одним потоком")
+
+
+class FakeMSSQL:
+    def __init__(self):
+        self.max_id = 100
+        self.max_id_delay = 0
+        self.loads = 0
+        self.down = False
+        self.release = None
+        # Как у MSSQLConnection; интервал 0 - отметка проверяется при каждом обращении
+        self.watermarks = WatermarkTracker(interval=0)
+
+    def get_max_id(self, table, blocking=True):
+        def fetch():
+            time.sleep(self.max_id_delay)
+            return None if self.down else self.max_id
+        return self.watermarks.get(table, fetch, blocking=blocking)
+
+    def get_zakupki(self, **params):
+        self.loads += 1
+        if self.down:
+            raise MSSQLUnavailable('MSSQL недоступен')
+        if self.release is not None:
+            # Медленный запрос - ждет, пока тест его не отпустит
+            self.release.wait()
+        return {'data': [{'id': self.max_id}], 'total': 1}
+
+
+def test_result_cache_read_through():
+    """Одинаковые параметры обслуживаются из кэша, новые записи сбрасывают его"""
+    source = FakeMSSQL()
+    cache = ResultCache(source, max_rows=100, ttl=60)
+
+    cache.get_zakupki(search_text='Бумага', limit=20, offset=0)
+    cache.get_zakupki(offset=0, limit=20, search_text='бумага ')
+    assert source.loads == 1
+
+    source.max_id = 101
+    result = cache.get_zakupki(search_text='Бумага', limit=20, offset=0)
+    assert source.loads == 2
+    assert result['data'][0]['id'] == 101
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    print("✓ Кэш результатов: read-through и сброс по MAX(id)")
+
+
+def test_stale_result_on_mssql_error():
+    """При недоступном MSSQL отдается последний результат с пометкой stale"""
+    source = FakeMSSQL()
+    cache = ResultCache(source, max_rows=100, ttl=60, stale_ttl=300, budget_ms=1000)
+    cache.get_zakupki(limit=20, offset=0)
+
+    source.down = True
+    result = cache.get_zakupki(limit=20, offset=0)
+    assert result['stale'] and result['stale_age'] >= 0
+    assert result['data'][0]['id'] == 100
+    assert cache.get_stats()['stale'] == 1
+
+    # Без сохраненной копии ошибка идет вызывающему коду (страница 503)
+    try:
+        cache.get_zakupki(limit=50, offset=0)
+        assert False, "ожидалась MSSQLUnavailable"
+    except MSSQLUnavailable:
+        pass
+    print("✓ Устаревший результат при недоступном MSSQL")
+
+
+def test_stale_result_over_budget_refreshed_in_background():
+    """Медленное обновление: запрос получает устаревшую копию, свежая сохраняется в фоне"""
+    source = FakeMSSQL()
+    cache = ResultCache(source, max_rows=100, ttl=60, stale_ttl=300, budget_ms=20)
+    cache.get_zakupki(limit=20, offset=0)
+
+    # Медленная проверка MAX(id) не задерживает запрос дольше бюджета
+    source.max_id_delay = 0.5
+    start = time.time()
+    result = cache.get_zakupki(limit=20, offset=0)
+    assert time.time() - start < 0.3
+    assert result['stale'] and result['data'][0]['id'] == 100
+    for _ in range(100):
+        if not cache._refreshing:
+            break
+        time.sleep(0.01)
+    source.max_id_delay = 0
+    assert source.loads == 1
+
+    source.max_id = 101
+    source.release = threading.Event()
+    result = cache.get_zakupki(limit=20, offset=0)
+    assert result['stale'] and result['data'][0]['id'] == 100
+
+    # Пока идет обновление, повторный запрос не запускает второе
+    cache.get_zakupki(limit=20, offset=0)
+    assert source.loads == 2
+
+    source.release.set()
+    for _ in range(100):
+        if not cache._refreshing:
+            break
+        time.sleep(0.01)
+    result = cache.get_zakupki(limit=20, offset=0)
+    assert 'stale' not in result and result['data'][0]['id'] == 101
+    assert source.loads == 2
+    print("✓ Обновление сверх бюджета идет в фоне")
+
+
+def test_result_key_normalization():
+    """Порядок параметров и регистр текста не влияют на ключ"""
+    assert result_key('z', {'a': 1, 'b': 'X'}) == result_key('z', {'b': 'x', 'a': 1})
+    assert result_key('z', {'ids': [1, 2]}) == result_key('z', {'ids': (1, 2)})
+    print("✓ Нормализация ключа кэша")
+
+
+if __name__ == '__main__':
+    print("=== Тесты кэшей ===\n")
+
+    try:
+        test_lru_eviction()
+        test_ttl_expiration()
+        test_weight_limit()
+        test_watermark_tracker_throttles()
+        test_watermark_tracker_single_flight()
+        test_result_cache_read_through()
+        test_stale_result_on_mssql_error()
+        test_stale_result_over_budget_refreshed_in_background()
+        test_result_key_normalization()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Тесты для сервиса подсчета количества записей (без реального сервера)
+"""
+import sys
+import os
+from datetime import datetime
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.count_service import CountService, filter_signature
+from app.mssql import MSSQLConnection
+
+
+class FakeCursor:
+    """Курсор, отвечающий на запросы CountService заранее заданными значениями"""
+
+    def __init__(self, max_id=100, total=42, catalog_rows=18702724):
+        self.max_id = max_id
+        self.total = total
+        self.catalog_rows = catalog_rows
+        self.queries = []
+        self._row = None
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        self.queries.append(query)
+        if 'MAX(id)' in query:
+            self._row = {'max_id': self.max_id}
+        elif 'sys.partitions' in query:
+            self._row = {'total': self.catalog_rows}
+        elif 'TOP (%s)' in query:
+            self._row = {'total': min(self.total, params[0])}
+        else:
+            self._row = {'total': self.total}
+
+    def fetchone(self):
+        return self._row
+
+    def count_queries(self):
+        return sum(1 for q in self.queries if 'MAX(id)' not in q)
+
+
+def test_count_is_cached():
+    """Повторный подсчет с тем же фильтром берется из кэша"""
+    service = CountService(cap=0, watermark_interval=60)
+    cursor = FakeCursor()
+
+    first = service.count(cursor, 'zakupki', 'z', ['z.created >= %s'], [datetime(2024, 1, 1)])
+    second = service.count(cursor, 'zakupki', 'z', ['z.created  >=  %s'], [datetime(2024, 1, 1)])
+
+    assert first == second == {'total': 42, 'approximate': False, 'capped': False}
+    assert cursor.count_queries() == 1
+    print("✓ Количество кэшируется по нормализованному фильтру")
+
+
+def test_cache_invalidated_by_watermark():
+    """При изменении MAX(id) количество пересчитывается"""
+    service = CountService(cap=0, watermark_interval=0)
+    cursor = FakeCursor()
+
+    service.count(cursor, 'zakupki', 'z', ['z.customer LIKE %s'], ['%x%'])
+    cursor.max_id = 101
+    cursor.total = 43
+    result = service.count(cursor, 'zakupki', 'z', ['z.customer LIKE %s'], ['%x%'])
+
+    assert result['total'] == 43
+    assert cursor.count_queries() == 2
+    print("✓ Новые записи сбрасывают кэш")
+
+
+def test_unfiltered_count_is_approximate():
+    """Без фильтров количество берется из каталога"""
+    service = CountService()
+    cursor = FakeCursor()
+
+    result = service.count(cursor, 'zakupki', 'z', [], [])
+
+    assert result == {'total': 18702724, 'approximate': True, 'capped': False}
+    assert any('sys.partitions' in q for q in cursor.queries)
+    assert not any(q.startswith('SELECT COUNT(*)') for q in cursor.queries)
+    print("✓ Количество без фильтров берется из sys.partitions")
+
+
+def test_filtered_count_is_capped():
+    """Дорогой подсчет с фильтром ограничен порогом"""
+    service = CountService(cap=10000)
+    cursor = FakeCursor(total=500000)
+
+    result = service.count(cursor, 'zakupki', 'z', ['z.customer LIKE %s'], ['%x%'])
+
+    assert result == {'total': 10000, 'approximate': False, 'capped': True}
+    print("✓ Подсчет с фильтром ограничен порогом")
+
+
+class FakePageCursor:
+    """Курсор страницы get_zakupki (без as_dict) - пустая выборка"""
+
+    description = [('id',)]
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    def __init__(self, count_cursor):
+        self.count_cursor = count_cursor
+
+    def cursor(self, as_dict=False):
+        return self.count_cursor if as_dict else FakePageCursor()
+
+    def close(self):
+        pass
+
+
+def test_exact_count_for_export_progress():
+    """exact_count - точный COUNT без порога (прогресс фоновой выгрузки)"""
+    cursor = FakeCursor(total=500000)
+    source = MSSQLConnection.__new__(MSSQLConnection)
+    source.counts = CountService(cap=10000)
+    source.get_connection = lambda route='primary': FakeConnection(cursor)
+
+    result = source.get_zakupki(date_from=datetime(2024, 1, 1), limit=1, offset=0, route='replica',
+                                exact_count=True)
+    assert result['total'] == 500000 and not result['total_capped']
+    assert cursor.queries[-1] == 'SELECT COUNT(*) as total FROM zakupki z WHERE z.created >= %s'
+
+    result = source.get_zakupki(date_from=datetime(2024, 1, 1), limit=1, offset=0, route='replica')
+    assert result['total'] == 10000 and result['total_capped']
+    print("✓ Точный подсчет для прогресса выгрузки")
+
+
+def test_filter_signature_normalization():
+    """Регистр и пробелы поискового текста не влияют на ключ кэша"""
+    a = filter_signature('zakupki', ['z.customer LIKE %s'], ['%Бумага %'])
+    b = filter_signature('zakupki', ['z.customer  LIKE %s'], ['%бумага %'])
+    assert a == b
+    print("✓ Сигнатура фильтра нормализуется")
+
+
+if __name__ == '__main__':
+    print("=== Тесты сервиса подсчета количества ===\n")
+
+    try:
+        test_count_is_cached()
+        test_cache_invalidated_by_watermark()
+        test_unfiltered_count_is_approximate()
+        test_filtered_count_is_capped()
+        test_exact_count_for_export_progress()
+        test_filter_signature_normalization()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Тесты кэша счетчиков навбара (без базы приложения)
+"""
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from markupsafe import escape
+
+from app.counters import NavbarCounters
+
+
+def make_counters(ttl=60):
+    calls = {'news': 0, 'ideas': 0}
+    values = {'news': 3, 'ideas': 5}
+
+    def loader(name):
+        def load():
+            calls[name] += 1
+            return values[name]
+        return load
+
+    counters = NavbarCounters({'news': loader('news'), 'ideas': loader('ideas')}, ttl=ttl)
+    return counters, calls, values
+
+
+def test_lazy_values_not_computed_unless_used():
+    """Ленивое значение не обращается к базе, пока шаблон его не выводит"""
+    counters, calls, _ = make_counters()
+    news = counters.lazy('news')
+    assert calls['news'] == 0
+
+    assert str(escape(news)) == '3'
+    assert news == 3 and news > 0
+    assert calls['news'] == 1
+    print("✓ Счетчики вычисляются лениво")
+
+
+def test_cached_until_invalidated():
+    """Значение берется из кэша до invalidate"""
+    counters, calls, values = make_counters()
+    assert counters.get('ideas') == 5
+    assert counters.get('ideas') == 5
+    assert calls['ideas'] == 1
+
+    values['ideas'] = 6
+    counters.invalidate('ideas')
+    assert counters.get('ideas') == 6
+    assert calls['ideas'] == 2
+
+    counters.get('news')
+    counters.invalidate()
+    counters.get('news')
+    assert calls['news'] == 2
+    print("✓ Сброс после изменения данных")
+
+
+def test_ttl_fallback():
+    """Без invalidate значение устаревает по TTL"""
+    counters, calls, _ = make_counters(ttl=0.05)
+    counters.get('news')
+    time.sleep(0.06)
+    counters.get('news')
+    assert calls['news'] == 2
+    print("✓ Устаревание по TTL")
+
+
+def test_invalidate_during_load_not_cached():
+    """Сброс во время подсчета не дает закэшировать старое значение"""
+    values = {'news': 1}
+    counters = None
+
+    def load():
+        value = values['news']
+        # Пока считали, новость удалили и сбросили счетчик
+        values['news'] = 0
+        counters.invalidate('news')
+        return value
+
+    counters = NavbarCounters({'news': load}, ttl=60)
+    assert counters.get('news') == 1
+    counters.loaders['news'] = lambda: values['news']
+    assert counters.get('news') == 0
+    print("✓ Гонка сброса и подсчета")
+
+
+if __name__ == '__main__':
+    print("=== Тесты счетчиков навбара ===\n")
+
+    try:
+        test_lazy_values_not_computed_unless_used()
+        test_cached_until_invalidated()
+        test_ttl_fallback()
+        test_invalidate_during_load_not_cached()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Тесты потокового экспорта (без реального сервера MSSQL)
+"""
+import sys
+import os
+import gzip
+import json
+import tempfile
+from datetime import datetime
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openpyxl import load_workbook
+
+from app.export import (ZAKUPKI_FIELDS, ZAKUPKI_HEADERS, companies_export_row, gzip_chunks, with_specifications,
+                        zakupki_export_columns, iter_csv, iter_file_chunks, iter_ndjson,
+                        write_xlsx, xlsx_response, zakupki_export_row)
+from app.mssql import MSSQLConnection
+
+
+def make_row(zakupki_id, start_cost_var=None):
+    return {
+        'id': zakupki_id,
+        'date_request': datetime(2024, 1, 15),
+        'purchase_object': f'Закупка {zakupki_id}',
+        'start_cost_var': start_cost_var,
+        'start_cost': 1500.5,
+        'customer': 'ГБУ Школа',
+        'email': 'buyer@school.ru',
+        'phone': '+79161234567',
+        'address': 'Москва',
+    }
+
+
+def test_export_row_mapping():
+    """Цена: start_cost_var, иначе start_cost; дата в формате ДД.ММ.ГГГГ"""
+    assert zakupki_export_row(make_row(1))[:3] == ['15.01.2024', 'Закупка 1', '1500.5']
+    assert zakupki_export_row(make_row(1, '1 500,50 руб.'))[2] == '1 500,50 руб.'
+    print("✓ Колонки экспорта")
+
+
+def test_write_xlsx_from_generator():
+    """Write-only книга пишется из генератора строк"""
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+
+    count = write_xlsx(path, "Закупки", ZAKUPKI_HEADERS, (make_row(i) for i in range(3, 0, -1)), zakupki_export_row)
+    assert count == 3
+
+    ws = load_workbook(path, read_only=True)["Закупки"]
+    values = list(ws.values)
+    assert list(values[0]) == ZAKUPKI_HEADERS
+    assert [row[1] for row in values[1:]] == ['Закупка 3', 'Закупка 2', 'Закупка 1']
+
+    chunks = list(iter_file_chunks(path, chunk_size=1024))
+    assert len(chunks) > 1 and b''.join(chunks) == open(path, 'rb').read()
+    os.remove(path)
+    print("✓ XLSX из генератора, отдача кусками")
+
+
+def test_xlsx_response_removes_temp_file():
+    """Временный файл XLSX удаляется при закрытии ответа, даже если тело не читалось"""
+    directory = tempfile.mkdtemp()
+    previous, tempfile.tempdir = tempfile.tempdir, directory
+    try:
+        # HEAD / обрыв соединения: тело не итерируется
+        response = xlsx_response("Закупки", ZAKUPKI_HEADERS, (make_row(i) for i in range(3)),
+                                 zakupki_export_row, 'export.xlsx')
+        assert len(os.listdir(directory)) == 1
+        response.close()
+        assert os.listdir(directory) == []
+
+        response = xlsx_response("Закупки", ZAKUPKI_HEADERS, (make_row(i) for i in range(3)),
+                                 zakupki_export_row, 'export.xlsx')
+        body = b''.join(response.response)
+        assert len(body) == int(response.headers['Content-Length'])
+        response.close()
+        assert os.listdir(directory) == []
+    finally:
+        tempfile.tempdir = previous
+    print("✓ Временный файл XLSX удаляется при закрытии ответа")
+
+
+def test_iter_zakupki_keyset_batches():
+    """iter_zakupki читает порциями по id, без offset"""
+    calls = []
+    ids = list(range(25, 0, -1))
+
+    def fake_get_zakupki(limit=100, offset=0, before_id=None, **kwargs):
+        calls.append(before_id)
+        rest = [i for i in ids if before_id is None or i < before_id]
+        return {'data': [make_row(i) for i in rest[:limit]], 'has_more': len(rest) > limit}
+
+    source = MSSQLConnection.__new__(MSSQLConnection)
+    source.get_zakupki = fake_get_zakupki
+
+    rows = list(source.iter_zakupki(batch_size=10))
+    assert [row['id'] for row in rows] == ids
+    assert calls == [None, 16, 6]
+    print("✓ Порции keyset-пагинацией")
+
+
+def test_csv_and_ndjson_streams():
+    """CSV и NDJSON отдаются порциями, gzip распаковывается в тот же поток"""
+    rows = [make_row(i) for i in range(5)]
+
+    chunks = list(iter_csv(ZAKUPKI_HEADERS, iter(rows), zakupki_export_row, batch_size=2))
+    assert len(chunks) == 3
+    lines = b''.join(chunks).decode('utf-8').splitlines()
+    assert lines[0] == ';'.join(ZAKUPKI_HEADERS)
+    assert lines[1].startswith('15.01.2024;Закупка 0;1500.5;')
+    assert len(lines) == 6
+
+    ndjson = b''.join(iter_ndjson(ZAKUPKI_FIELDS, iter(rows), zakupki_export_row, batch_size=2))
+    compressed = b''.join(gzip_chunks(iter([ndjson[:100], ndjson[100:]])))
+    records = [json.loads(line) for line in gzip.decompress(compressed).decode('utf-8').splitlines()]
+    assert len(records) == 5
+    assert records[0]['price'] == '1500.5' and records[0]['purchase_object'] == 'Закупка 0'
+    print("✓ CSV / NDJSON / gzip")
+
+
+def test_companies_export_masking():
+    """Без положительного баланса контакты предприятий в выгрузке замаскированы"""
+    row = {'id': 1, 'company': 'ООО Ромашка', 'rubric': 'Торговля', 'subrubric': 'Опт', 'city': 'Москва',
+           'phone': None, 'mobile_phone': '+79161234567', 'Email': 'info@romashka.ru', 'site': 'romashka.ru',
+           'inn': '7707083893', 'ogrn': '1027700132195', 'director': 'Иванов И.И.'}
+
+    full = companies_export_row(row)
+    assert full[4:7] == ['+79161234567', 'info@romashka.ru', 'romashka.ru']
+    assert full[7:] == ['7707083893', '1027700132195', 'Иванов И.И.']
+
+    masked = companies_export_row(row, masked=True)
+    assert all('*' in value for value in masked[4:7])
+    assert masked[0] == 'ООО Ромашка' and masked[7] == '7707083893'
+    print("✓ Маскировка выгрузки предприятий")
+
+
+def test_iter_companies_passes_filters():
+    """iter_companies передает фильтры get_companies в каждую порцию"""
+    calls = []
+
+    def fake_get_companies(limit=100, offset=0, before_id=None, **filters):
+        calls.append((before_id, filters))
+        rest = [i for i in range(5, 0, -1) if before_id is None or i < before_id]
+        return {'data': [{'id': i} for i in rest[:limit]], 'has_more': len(rest) > limit}
+
+    source = MSSQLConnection.__new__(MSSQLConnection)
+    source.get_companies = fake_get_companies
+
+    rows = list(source.iter_companies(id_city=7, search_text='7707', batch_size=2))
+    assert [row['id'] for row in rows] == [5, 4, 3, 2, 1]
+    assert [before_id for before_id, _ in calls] == [None, 4, 2]
+    assert all(f['id_city'] == 7 and f['search_text'] == '7707' for _, f in calls)
+    print("✓ Порции выгрузки предприятий")
+
+
+class FakeSpecCursor:
+    """Курсор, возвращающий спецификации для id_zakupki из параметров запроса
+
+    Как pymssql: без as_dict строки - кортежи, имена колонок - в description.
+    """
+
+    COLUMNS = ('id', 'id_zakupki', 'product', 'quantity', 'price_vat')
+
+    def __init__(self, queries, as_dict=False):
+        self.queries = queries
+        self.as_dict = as_dict
+        self.description = [(name,) for name in self.COLUMNS]
+        self.rows = []
+
+    def execute(self, query, params):
+        self.queries.append(params)
+        self.rows = [(i * 10, i, f'Товар {i}', '1', None) for i in params if i % 2 == 0]
+
+    def fetchall(self):
+        if self.as_dict:
+            return [dict(zip(self.COLUMNS, row)) for row in self.rows]
+        return self.rows
+
+
+class FakeSpecConnection:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def cursor(self, as_dict=False):
+        return FakeSpecCursor(self.queries, as_dict)
+
+    def close(self):
+        pass
+
+
+def test_specifications_batch():
+    """Спецификации многих закупок - запрос на порцию id, группировка по id_zakupki"""
+    queries = []
+    source = MSSQLConnection.__new__(MSSQLConnection)
+    source.get_connection = lambda route='primary': FakeSpecConnection(queries)
+
+    grouped = source.get_specifications_batch([1, 2, 3, 4, 5, 2], chunk_size=2)
+    assert queries == [(1, 2), (3, 4), (5,)]
+    assert list(grouped) == [1, 2, 3, 4, 5]
+    assert grouped[1] == [] and grouped[4][0]['product'] == 'Товар 4'
+    assert source.get_specifications(2)[0]['id'] == 20
+
+    headers, fields, convert = zakupki_export_columns(include_specifications=True)
+    rows = list(with_specifications((make_row(i) for i in range(1, 6)), source.get_specifications_batch, batch_size=3))
+    assert headers[-1] == 'Спецификация' and fields[-1] == 'specifications'
+    assert convert(rows[1])[-1] == 'Товар 2 - 1' and convert(rows[0])[-1] == ''
+    print("✓ Спецификации пакетом")
+
+
+if __name__ == '__main__':
+    print("=== Тесты экспорта ===\n")
+
+    try:
+        test_export_row_mapping()
+        test_write_xlsx_from_generator()
+        test_xlsx_response_removes_temp_file()
+        test_iter_zakupki_keyset_batches()
+        test_csv_and_ndjson_streams()
+        test_companies_export_masking()
+        test_iter_companies_passes_filters()
+        test_specifications_batch()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Тесты фоновых заданий экспорта (очередь, прогресс, срок хранения файлов)
+"""
+import sys
+import os
+import tempfile
+import threading
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.export_jobs import ExportJobManager, ExportQueueFull
+
+
+HEADERS = ['ID', 'Название']
+FIELDS = ['id', 'name']
+
+
+def convert(row):
+    return [row['id'], row['name']]
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def submit(manager, rows_factory, export_format='csv', count=None):
+    return manager.submit(1, export_format, "Тест", HEADERS, FIELDS, convert, rows_factory,
+                          count_factory=(lambda: (count, False)) if count is not None else None)
+
+
+def test_job_writes_file_and_reports_progress():
+    """Задание пишет файл на диск, статус содержит количество строк"""
+    manager = ExportJobManager(tempfile.mkdtemp(), workers=1)
+    job = wait_for(submit(manager, lambda: ({'id': i, 'name': f'Строка {i}'} for i in range(250)), count=250))
+
+    status = job.to_dict()
+    assert status['status'] == 'done', status
+    assert status['rows'] == 250 and status['progress'] == 100
+    with open(job.path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'ID;Название' and len(lines) == 251
+    print("✓ Задание экспорта выполнено")
+
+
+def test_failed_job_and_queue_limit():
+    """Ошибка выборки не роняет пул, очередь ограничена max_pending"""
+    manager = ExportJobManager(tempfile.mkdtemp(), workers=1, max_pending=1)
+
+    def broken():
+        raise RuntimeError('MSSQL недоступен')
+
+    job = wait_for(submit(manager, broken))
+    assert job.status == 'failed' and 'MSSQL' in job.error
+
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return iter([])
+
+    slow_job = submit(manager, slow)
+    try:
+        submit(manager, slow)
+        assert False, "ожидалось ExportQueueFull"
+    except ExportQueueFull:
+        pass
+    release.set()
+    assert wait_for(slow_job).status == 'done'
+    print("✓ Ошибки и ограничение очереди")
+
+
+def test_count_error_keeps_job_running():
+    """Ошибка подсчета количества не роняет задание: файл пишется без процента и ETA"""
+    manager = ExportJobManager(tempfile.mkdtemp(), workers=1)
+
+    def broken_count():
+        raise RuntimeError('MSSQL query timeout')
+
+    job = manager.submit(1, 'csv', "Тест", HEADERS, FIELDS, convert,
+                         lambda: ({'id': i, 'name': f'Строка {i}'} for i in range(10)),
+                         count_factory=broken_count)
+    status = wait_for(job).to_dict()
+    assert status['status'] == 'done' and status['error'] is None, status
+    assert status['rows'] == 10 and status['total'] is None
+    assert os.path.exists(job.path)
+    print("✓ Ошибка подсчета не прерывает экспорт")
+
+
+def test_retention_cleanup():
+    """Готовые файлы удаляются по истечении срока хранения"""
+    directory = tempfile.mkdtemp()
+    manager = ExportJobManager(directory, workers=1, retention=60)
+    job = wait_for(submit(manager, lambda: iter([{'id': 1, 'name': 'x'}]), export_format='ndjson'))
+    assert os.path.exists(job.path)
+
+    # Файл от прошлого запуска приложения
+    orphan = os.path.join(directory, 'old.csv')
+    open(orphan, 'w').close()
+    os.utime(orphan, (time.time() - 120, time.time() - 120))
+
+    manager.cleanup()
+    assert os.path.exists(job.path) and not os.path.exists(orphan)
+
+    job.finished_at -= 120
+    manager.cleanup()
+    assert manager.get(job.id) is None and not os.path.exists(job.path)
+    print("✓ Очистка по сроку хранения")
+
+
+def test_periodic_cleanup_without_new_jobs():
+    """Файлы удаляются по сроку хранения, даже если новых заданий не ставят"""
+    manager = ExportJobManager(tempfile.mkdtemp(), workers=1, retention=0.05, cleanup_interval=0.02)
+    job = wait_for(submit(manager, lambda: iter([{'id': 1, 'name': 'x'}])))
+    assert job.status == 'done'
+
+    for _ in range(100):
+        if not os.path.exists(job.path):
+            break
+        time.sleep(0.01)
+    assert not os.path.exists(job.path) and manager.get(job.id) is None
+    print("✓ Периодическая очистка")
+
+
+if __name__ == '__main__':
+    print("=== Тесты фоновых заданий экспорта ===\n")
+
+    try:
+        test_job_writes_file_and_reports_progress()
+        test_failed_job_and_queue_limit()
+        test_count_error_keeps_job_running()
+        test_retention_cleanup()
+        test_periodic_cleanup_without_new_jobs()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
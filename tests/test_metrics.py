@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Тесты метрик запросов MSSQL (гистограммы по методам и фазам)
+"""
+import sys
+import os
+import threading
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.metrics import LatencyHistogram, Metrics
+
+
+def test_histogram_percentiles():
+    """Перцентили оцениваются по корзинам и не превышают максимум"""
+    hist = LatencyHistogram()
+    for _ in range(90):
+        hist.observe(3)
+    for _ in range(10):
+        hist.observe(400)
+
+    assert hist.count == 100
+    assert 2 <= hist.percentile(50) <= 5
+    assert 200 <= hist.percentile(95) <= 400
+    assert hist.percentile(99) <= hist.max == 400
+    assert LatencyHistogram().percentile(95) == 0.0
+    print("✓ Перцентили гистограммы")
+
+
+def test_timed_phases_rows_and_errors():
+    """Декоратор пишет total со строками, фазы относятся к текущему методу"""
+    metrics = Metrics()
+
+    @metrics.timed('get_items')
+    def get_items(fail=False):
+        with metrics.phase('connect'):
+            pass
+        with metrics.phase('fetch'):
+            if fail:
+                raise RuntimeError('boom')
+        return {'data': [1, 2, 3], 'total': 3}
+
+    @metrics.timed('execute_query')
+    def execute_query():
+        return {'success': False, 'data': [], 'rowcount': 0}
+
+    get_items()
+    get_items()
+    try:
+        get_items(fail=True)
+    except RuntimeError:
+        pass
+    execute_query()
+
+    methods = {item['method']: item for item in metrics.snapshot()}
+    phases = dict(methods['get_items']['phases'])
+    assert [phase for phase, _ in methods['get_items']['phases']] == ['total', 'connect', 'fetch']
+    assert phases['total']['count'] == 3 and phases['total']['errors'] == 1
+    assert phases['total']['rows'] == 6
+    assert phases['fetch']['errors'] == 1
+    assert methods['execute_query']['errors'] == 1
+    assert metrics.summary()['total_queries'] == 4
+    print("✓ Фазы, строки и ошибки по методам")
+
+
+def test_nested_calls_counted_once_in_summary():
+    """Вложенный вызов пишется в свою серию, но в сводке считается один запрос"""
+    metrics = Metrics()
+
+    @metrics.timed('inner')
+    def inner():
+        with metrics.phase('connect'):
+            pass
+        return [1]
+
+    @metrics.timed('outer')
+    def outer():
+        return inner()
+
+    outer()
+    methods = {item['method']: item for item in metrics.snapshot()}
+    assert methods['outer']['calls'] == 1 and methods['inner']['calls'] == 1
+    assert dict(methods['inner']['phases'])['connect']['count'] == 1
+    assert 'connect' not in dict(methods['outer']['phases'])
+    assert metrics.summary()['total_queries'] == 1
+    print("✓ Вложенные вызовы")
+
+
+def test_thread_safety():
+    """Параллельные потоки не теряют наблюдения"""
+    metrics = Metrics()
+
+    @metrics.timed('method')
+    def method():
+        return []
+
+    def worker():
+        for _ in range(500):
+            method()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert metrics.snapshot()[0]['calls'] == 4000
+    assert metrics.summary()['total_queries'] == 4000
+    metrics.reset()
+    assert metrics.snapshot() == [] and metrics.summary()['total_queries'] == 0
+    print("✓ Потокобезопасность и сброс")
+
+
+if __name__ == '__main__':
+    print("=== Тесты метрик MSSQL ===\n")
+
+    try:
+        test_histogram_percentiles()
+        test_timed_phases_rows_and_errors()
+        test_nested_calls_counted_once_in_summary()
+        test_thread_safety()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Тесты автомата отключения MSSQL и типизированных ошибок (без реального сервера)
+"""
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pymssql
+
+from app.mssql import MSSQLConnection, MSSQLError, MSSQLTimeout, MSSQLUnavailable, is_connection_error
+from app.mssql_breaker import CircuitBreaker, GuardedConnection
+from app.mssql_pool import ConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self.server = server
+
+    def execute(self, query, params=None):
+        if self.server.error is not None:
+            raise self.server.error
+
+    def fetchall(self):
+        return [{'id': 1}]
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.server)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    def __init__(self):
+        self.down = False
+        self.error = None
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        if self.down:
+            raise pymssql.OperationalError(20009, b'Unable to connect: Adaptive Server is unavailable')
+        return FakeConnection(self)
+
+
+def make_mssql(server, threshold=2, reset=30.0):
+    mssql = MSSQLConnection()
+    mssql.pool = ConnectionPool(server.connect, name='utf16', ping_after=3600)
+    mssql.console_pool = ConnectionPool(server.connect, name='console', ping_after=3600)
+    mssql.breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=reset)
+    return mssql
+
+
+def test_breaker_opens_and_fails_fast():
+    """После серии сбоев подключения запросы отклоняются без обращения к серверу"""
+    server = FakeServer()
+    server.down = True
+    mssql = make_mssql(server, threshold=2)
+
+    for _ in range(2):
+        try:
+            mssql.get_connection()
+            assert False, "ожидалась MSSQLUnavailable"
+        except MSSQLUnavailable:
+            pass
+    assert mssql.breaker.state == 'open'
+    assert server.connects == 2
+
+    try:
+        mssql.get_connection()
+        assert False, "ожидалась MSSQLUnavailable"
+    except MSSQLUnavailable as e:
+        assert e.retry_after and e.retry_after <= 30
+    assert server.connects == 2
+    assert mssql.breaker.get_stats()['rejected'] == 1
+    print("✓ Автомат размыкается и отклоняет запросы сразу")
+
+
+def test_probe_closes_breaker():
+    """После reset_timeout пропускается один пробный запрос; удачный замыкает автомат"""
+    server = FakeServer()
+    server.down = True
+    mssql = make_mssql(server, threshold=1, reset=0.05)
+
+    try:
+        mssql.get_connection()
+    except MSSQLUnavailable:
+        pass
+    assert mssql.breaker.state == 'open'
+
+    time.sleep(0.06)
+    server.down = False
+    conn = mssql.get_connection()
+    assert mssql.breaker.state == 'half_open'
+    try:
+        mssql.get_connection()
+        assert False, "во время пробы остальные запросы отклоняются"
+    except MSSQLUnavailable:
+        pass
+
+    cursor = conn.cursor(as_dict=True)
+    cursor.execute("SELECT 1")
+    assert cursor.fetchall() == [{'id': 1}]
+    conn.close()
+    assert mssql.breaker.state == 'closed' and mssql.breaker.failures == 0
+    print("✓ Пробный запрос замыкает автомат")
+
+
+def test_query_timeout_is_typed():
+    """Таймаут запроса -> MSSQLTimeout, подключение не возвращается в пул, сбой учитывается"""
+    server = FakeServer()
+    mssql = make_mssql(server, threshold=5)
+
+    conn = mssql.get_connection()
+    server.error = pymssql.OperationalError(20003, b'Adaptive Server connection timed out')
+    try:
+        conn.cursor(as_dict=True).execute("SELECT 1")
+        assert False, "ожидалась MSSQLTimeout"
+    except MSSQLTimeout as e:
+        assert isinstance(e, MSSQLError)
+    conn.close()
+    assert mssql.pool.get_stats()['idle'] == 0
+    assert mssql.breaker.failures == 1
+
+    # Ошибка в тексте запроса - не сбой сервера: сервер ответил, серия сбоев прерывается
+    server.error = pymssql.ProgrammingError(102, b"Incorrect syntax near 'SELEC'")
+    conn = mssql.get_connection()
+    try:
+        conn.cursor().execute("SELEC 1")
+        assert False, "ожидалась ProgrammingError"
+    except pymssql.ProgrammingError:
+        pass
+    conn.close()
+    assert mssql.breaker.failures == 0
+    print("✓ Таймаут запроса - MSSQLTimeout, ошибки SQL не считаются сбоем")
+
+
+def test_statement_errors_keep_breaker_closed():
+    """Повторяющиеся ошибки выполнения запроса (OperationalError сервера) не размыкают автомат"""
+    server = FakeServer()
+    mssql = make_mssql(server, threshold=2)
+
+    server.error = pymssql.OperationalError(8134, b'Divide by zero error encountered.DB-Lib error message '
+                                                  b'20018, severity 16:\nGeneral SQL Server error')
+    assert not is_connection_error(server.error)
+    for _ in range(5):
+        conn = mssql.get_connection()
+        try:
+            conn.cursor().execute("SELECT 1/0")
+            assert False, "ожидалась OperationalError"
+        except pymssql.OperationalError as e:
+            assert not isinstance(e, MSSQLError)
+        conn.close()
+    assert mssql.breaker.state == 'closed' and mssql.breaker.failures == 0
+    # Подключение исправно - возвращается в пул
+    assert mssql.pool.get_stats()['idle'] == 1
+
+    # Консоль SQL: даже сбой подключения на ее запросе не учитывается автоматом
+    server.error = pymssql.OperationalError(20047, b'DBPROCESS is dead or not enabled')
+    for _ in range(3):
+        conn = mssql.get_console_connection()
+        try:
+            conn.cursor().execute("SELECT 1")
+            assert False, "ожидалась MSSQLUnavailable"
+        except MSSQLUnavailable:
+            pass
+        conn.close()
+    assert mssql.breaker.state == 'closed' and mssql.breaker.failures == 0
+    print("✓ Ошибки запросов и консоли не размыкают автомат")
+
+
+def test_replica_connection_without_breaker():
+    """Подключение реплики переводит ошибки, но не влияет на автомат основного сервера"""
+    server = FakeServer()
+    pool = ConnectionPool(server.connect, name='replica', ping_after=3600)
+    conn = GuardedConnection(pool.acquire(), pymssql.Error, is_connection_error)
+    server.error = pymssql.OperationalError(20047, b'DBPROCESS is dead or not enabled')
+    try:
+        conn.cursor().execute("SELECT 1")
+        assert False, "ожидалась MSSQLUnavailable"
+    except MSSQLUnavailable:
+        pass
+    conn.close()
+    assert pool.get_stats()['idle'] == 0
+    print("✓ Ошибки реплики переводятся без автомата")
+
+
+if __name__ == '__main__':
+    print("=== Тесты автомата отключения MSSQL ===\n")
+
+    try:
+        test_breaker_opens_and_fails_fast()
+        test_probe_closes_breaker()
+        test_query_timeout_is_typed()
+        test_statement_errors_keep_breaker_closed()
+        test_replica_connection_without_breaker()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Тесты для пула подключений MSSQL (без реального сервера)
+"""
+import sys
+import os
+import threading
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.mssql_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.dead:
+            raise RuntimeError("connection is dead")
+
+    def fetchall(self):
+        return [(1,)]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.dead = False
+        self.rollbacks = 0
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.dead:
+            raise RuntimeError("connection is dead")
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    return ConnectionPool(connect, name='test', **kwargs), created
+
+
+def test_connection_is_reused():
+    """close() возвращает подключение в пул, повторный запрос получает его же"""
+    pool, created = make_pool(size=2, max_overflow=0)
+
+    conn = pool.acquire()
+    conn.close()
+    conn2 = pool.acquire()
+    conn2.close()
+
+    assert len(created) == 1
+    assert created[0].rollbacks == 2
+    stats = pool.get_stats()
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+    print("✓ Подключение переиспользуется")
+
+
+def test_overflow_connections_are_closed():
+    """Подключения сверх size закрываются при возврате"""
+    pool, created = make_pool(size=1, max_overflow=1)
+
+    conn1 = pool.acquire()
+    conn2 = pool.acquire()
+    conn1.close()
+    conn2.close()
+
+    assert len(created) == 2
+    assert sum(1 for c in created if c.closed) == 1
+    assert pool.get_stats()['open'] == 1
+    print("✓ Overflow подключения закрываются")
+
+
+def test_timeout_when_exhausted():
+    """При исчерпании пула ожидание ограничено timeout"""
+    pool, _ = make_pool(size=1, max_overflow=0, timeout=0.05)
+
+    conn = pool.acquire()
+    try:
+        pool.acquire()
+        raise AssertionError("Ожидался PoolTimeout")
+    except PoolTimeout:
+        pass
+    conn.close()
+
+    stats = pool.get_stats()
+    assert stats['waits'] == 1
+    assert stats['timeouts'] == 1
+    print("✓ Таймаут ожидания работает")
+
+
+def test_waiter_gets_released_connection():
+    """Поток, ожидающий подключение, получает его после возврата"""
+    pool, created = make_pool(size=1, max_overflow=0, timeout=2)
+    conn = pool.acquire()
+    got = []
+
+    def worker():
+        c = pool.acquire()
+        got.append(c.raw)
+        c.close()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.05)
+    conn.close()
+    thread.join(2)
+
+    assert got == [created[0]]
+    print("✓ Ожидающий поток получает освобожденное подключение")
+
+
+def test_dead_connection_is_replaced():
+    """Подключение, не прошедшее проверку при выдаче, заменяется новым"""
+    pool, created = make_pool(size=1, max_overflow=0, ping_after=0)
+
+    conn = pool.acquire()
+    conn.close()
+    created[0].dead = True
+
+    conn = pool.acquire()
+    assert conn.raw is created[1]
+    assert created[0].closed
+    conn.close()
+    assert pool.get_stats()['failed_pings'] == 1
+    print("✓ Мертвое подключение заменяется")
+
+
+def test_idle_connections_expire():
+    """Подключения, простаивающие дольше max_idle, закрываются"""
+    pool, created = make_pool(size=1, max_overflow=0, max_idle=0.01)
+
+    conn = pool.acquire()
+    conn.close()
+    time.sleep(0.02)
+    conn = pool.acquire()
+    conn.close()
+
+    assert len(created) == 2
+    assert created[0].closed
+    print("✓ Простаивающие подключения закрываются")
+
+
+def test_invalidated_connection_is_discarded():
+    """Подключение, помеченное как сломанное, не возвращается в пул"""
+    pool, created = make_pool(size=1, max_overflow=0)
+
+    conn = pool.acquire()
+    conn.invalidate()
+    conn.close()
+
+    assert created[0].closed
+    assert pool.get_stats()['open'] == 0
+    print("✓ Сломанное подключение выбрасывается")
+
+
+if __name__ == '__main__':
+    print("=== Тесты пула подключений MSSQL ===\n")
+
+    try:
+        test_connection_is_reused()
+        test_overflow_connections_are_closed()
+        test_timeout_when_exhausted()
+        test_waiter_gets_released_connection()
+        test_dead_connection_is_replaced()
+        test_idle_connections_expire()
+        test_invalidated_connection_is_discarded()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
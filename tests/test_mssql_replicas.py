@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Тесты выбора реплики MSSQL для чтения (без реального сервера)
+"""
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pymssql
+
+from app.mssql import MSSQLConnection, MSSQLUnavailable, is_connection_error
+from app.mssql_breaker import GuardedConnection
+from app.mssql_pool import ConnectionPool
+from app.mssql_replicas import Replica, ReplicaSet
+
+
+class FakeCursor:
+    """Запрос отставания (колонка lag) или выборка закупок по id"""
+
+    description = [('id',)]
+
+    def __init__(self, server):
+        self.server = server
+
+    def execute(self, query, params=None):
+        if self.server.down:
+            raise RuntimeError(f"{self.server.name} is down")
+        if 'lag' in query:
+            time.sleep(self.server.delay)
+            return
+        self.server.queries += 1
+        if self.server.error is not None:
+            raise self.server.error
+        self.params = params
+
+    def fetchone(self):
+        return {'lag': self.server.lag}
+
+    def fetchall(self):
+        return [(zakupki_id,) for zakupki_id in self.params]
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.server)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    def __init__(self, name, lag=0, down=False, refuse=False, delay=0):
+        self.name = name
+        self.lag = lag
+        self.down = down
+        self.refuse = refuse
+        self.delay = delay
+        self.error = None
+        self.queries = 0
+
+    def connect(self):
+        if self.refuse:
+            raise RuntimeError(f"{self.name} refused connection")
+        return FakeConnection(self)
+
+
+def make_replica(server):
+    return Replica(
+        server.name,
+        ConnectionPool(server.connect, name=f'{server.name} utf16', ping_after=3600),
+        ConnectionPool(server.connect, name=f'{server.name} cp1251', ping_after=3600),
+    )
+
+
+def test_no_replicas_means_primary():
+    """Без реплик acquire возвращает None - чтение идет с основного сервера"""
+    replicas = ReplicaSet([])
+    assert not replicas.enabled
+    assert replicas.acquire() is None
+    print("✓ Без реплик - основной сервер")
+
+
+def test_lagging_replica_skipped():
+    """Реплика с отставанием больше max_lag не используется"""
+    fresh = FakeServer('fresh', lag=2)
+    stale = FakeServer('stale', lag=120)
+    replicas = ReplicaSet([make_replica(stale), make_replica(fresh)], max_lag=30, check_interval=3600)
+    for replica in replicas.replicas:
+        replicas.check(replica)
+
+    conn = replicas.acquire()
+    assert conn.raw.server is fresh
+    conn.close()
+
+    fresh.lag = 90
+    replicas.check(replicas.replicas[1])
+    assert replicas.acquire() is None
+    assert replicas.stats['fallbacks'] == 1
+    stats = {item['name']: item for item in replicas.get_stats()}
+    assert not stats['stale']['usable'] and stats['stale']['healthy']
+    print("✓ Отстающая реплика пропускается")
+
+
+def test_failover_and_recovery():
+    """Недоступная реплика исключается до следующей проверки, затем возвращается"""
+    first = FakeServer('first', refuse=True)
+    second = FakeServer('second')
+    replicas = ReplicaSet([make_replica(first), make_replica(second)], check_interval=3600)
+    replicas.replicas[0].checked_at = replicas.replicas[1].checked_at = 1e12  # не проверять в этом тесте
+
+    conn = replicas.acquire()
+    assert conn.raw.server is second
+    conn.close()
+    assert not replicas.replicas[0].healthy
+
+    first.refuse = False
+    replicas.check(replicas.replicas[0])
+    assert replicas.replicas[0].healthy
+
+    second.down = True
+    replicas.check(replicas.replicas[1])
+    assert not replicas.replicas[1].healthy
+    conn = replicas.acquire(cp1251=True)
+    assert conn.raw.server is first
+    print("✓ Переключение при отказе и возврат реплики")
+
+
+def test_lag_check_in_background():
+    """Отставание проверяется в фоновом потоке: запрос не ждет реплику и берет последний результат"""
+    server = FakeServer('slow', delay=0.5)
+    replicas = ReplicaSet([make_replica(server)], check_interval=0)
+
+    started = time.time()
+    # До первой проверки отставание неизвестно - читаем с основного сервера
+    assert replicas.acquire() is None
+    assert time.time() - started < 0.2
+
+    deadline = time.time() + 5
+    while replicas.replicas[0].checked_at == 0 and time.time() < deadline:
+        time.sleep(0.05)
+    assert replicas.replicas[0].healthy
+
+    started = time.time()
+    conn = replicas.acquire()
+    assert conn.raw.server is server and time.time() - started < 0.2
+    conn.close()
+    print("✓ Проверка отставания вне потока запроса")
+
+
+def test_only_connection_errors_count():
+    """Занятый пул и ошибка запроса не исключают реплику, сбой соединения посреди запроса - исключает"""
+    server = FakeServer('busy')
+    replica = Replica('busy', ConnectionPool(server.connect, name='busy utf16', size=1, max_overflow=0,
+                                             timeout=0.01, ping_after=3600),
+                      ConnectionPool(server.connect, name='busy cp1251', ping_after=3600))
+    replicas = ReplicaSet([replica], check_interval=3600, is_failure=is_connection_error)
+    replicas.check(replica)
+
+    held = replicas.acquire()
+    assert replicas.acquire() is None  # PoolTimeout - читаем с основного сервера
+    assert replica.healthy and replica.failures == 0
+    held.close()
+
+    _, conn = replicas.checkout()
+    conn = GuardedConnection(conn, pymssql.Error, is_connection_error, replica=replica)
+    server.error = pymssql.ProgrammingError(102, b"Incorrect syntax near 'SELEC'")
+    try:
+        conn.cursor().execute('SELEC 1')
+        assert False, "ожидалась ProgrammingError"
+    except pymssql.ProgrammingError:
+        pass
+    assert replica.healthy
+
+    server.error = pymssql.OperationalError(20047, b'DBPROCESS is dead or not enabled')
+    try:
+        conn.cursor().execute('SELECT 1')
+        assert False, "ожидалась MSSQLUnavailable"
+    except MSSQLUnavailable as e:
+        assert e.replica == 'busy'
+    conn.close()
+    assert not replica.healthy and replica.failures == 1
+    assert replicas.acquire() is None
+    print("✓ Реплику исключают только сбои соединения")
+
+
+def test_replica_failure_retried_on_primary():
+    """Чтение, на котором отказала реплика, один раз повторяется на основном сервере"""
+    primary = FakeServer('primary')
+    server = FakeServer('replica')
+    mssql = MSSQLConnection()
+    mssql.pool = ConnectionPool(primary.connect, name='utf16', ping_after=3600)
+    mssql.replicas = ReplicaSet([make_replica(server)], check_interval=3600, is_failure=is_connection_error)
+    mssql.replicas.check(mssql.replicas.replicas[0])
+
+    assert [row['id'] for row in mssql.get_zakupki_by_ids([2, 1], route='replica')] == [2, 1]
+    assert (server.queries, primary.queries) == (1, 0)
+
+    server.error = pymssql.OperationalError(20047, b'DBPROCESS is dead or not enabled')
+    assert [row['id'] for row in mssql.get_zakupki_by_ids([2, 1], route='replica')] == [2, 1]
+    assert (server.queries, primary.queries) == (2, 1)
+    assert not mssql.replicas.replicas[0].healthy
+
+    # Сбой основного сервера не повторяется
+    primary.error = pymssql.OperationalError(20047, b'DBPROCESS is dead or not enabled')
+    try:
+        mssql.get_zakupki_by_ids([3], route='replica')
+        assert False, "ожидалась MSSQLUnavailable"
+    except MSSQLUnavailable as e:
+        assert e.replica is None
+    assert (server.queries, primary.queries) == (2, 2)
+    print("✓ Повтор чтения на основном сервере")
+
+
+if __name__ == '__main__':
+    print("=== Тесты реплик MSSQL ===\n")
+
+    try:
+        test_no_replicas_means_primary()
+        test_lagging_replica_skipped()
+        test_failover_and_recovery()
+        test_lag_check_in_background()
+        test_only_connection_errors_count()
+        test_replica_failure_retried_on_primary()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
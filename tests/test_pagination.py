@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Тесты keyset-пагинации: курсор страницы, запросы get_zakupki / get_companies
+и ссылки списка предприятий (без реального сервера)
+"""
+import base64
+import sys
+import os
+from datetime import datetime
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.count_service import CountService
+from app.mssql import MSSQLConnection
+from app.utils import encode_page_cursor, decode_page_cursor
+
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeServer:
+    """Таблица с id 1..rows: отвечает на keyset-запросы страницы и на подсчет"""
+
+    def __init__(self, rows=50):
+        self.ids = list(range(1, rows + 1))
+        self.queries = []
+
+    def page(self, query, params):
+        """Строки страницы по условию z.id < / > %s (последний параметр) и TOP (первый)"""
+        query = ' '.join(query.split())
+        self.queries.append((query, params))
+        limit, seek_id = params[0], params[-1]
+        if ' z.id < %s' in query or ' c.id < %s' in query:
+            ids = sorted((i for i in self.ids if i < seek_id), reverse=True)
+        else:
+            ids = sorted(i for i in self.ids if i > seek_id)
+        return [(i,) for i in ids[:limit]]
+
+
+class FakeCountCursor:
+    """Курсор as_dict для CountService: MAX(id) и COUNT"""
+
+    def __init__(self, server):
+        self.server = server
+        self._row = None
+
+    def execute(self, query, params=None):
+        if 'MAX(id)' in query:
+            self._row = {'max_id': max(self.server.ids)}
+        else:
+            self._row = {'total': len(self.server.ids)}
+
+    def fetchone(self):
+        return self._row
+
+
+class FakePageCursor:
+    """Курсор страницы (без as_dict): кортежи и description"""
+
+    description = [('id',)]
+
+    def __init__(self, server):
+        self.server = server
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self._rows = self.server.page(query, params)
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, as_dict=False):
+        return FakeCountCursor(self.server) if as_dict else FakePageCursor(self.server)
+
+    def close(self):
+        pass
+
+
+class FakeReplicas:
+    enabled = False
+
+
+def make_source(server):
+    source = MSSQLConnection.__new__(MSSQLConnection)
+    source.counts = CountService(cap=0, watermark_interval=60)
+    source.replicas = FakeReplicas()
+    source.get_connection = lambda route='primary': FakeConnection(server)
+    source.get_connection_cp1251 = lambda route='primary': FakeConnection(server)
+    return source
+
+
+def test_page_cursor_round_trip():
+    """Курсор кодируется в непрозрачную строку и декодируется обратно"""
+    token = encode_page_cursor('next', 12345)
+    assert token.isascii() and '12345' not in token
+    assert decode_page_cursor(token) == ('next', 12345)
+    assert decode_page_cursor(encode_page_cursor('prev', 7)) == ('prev', 7)
+    print("✓ Курсор страницы: кодирование и декодирование")
+
+
+def test_invalid_page_cursor():
+    """Поврежденный или подделанный курсор - None (обычная пагинация по offset)"""
+    def forge(raw):
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    for token in (None, '', 'not base64!', forge('x:10'), forge('n:abc'), forge('n10'),
+                  base64.urlsafe_b64encode(b'\xff\xfe').decode()):
+        assert decode_page_cursor(token) is None, token
+    # Подмена id внутри корректного формата декодируется - это обычный параметр запроса
+    assert decode_page_cursor(forge('p:999')) == ('prev', 999)
+    print("✓ Поврежденный курсор игнорируется")
+
+
+def test_next_page_top_limit_plus_one():
+    """Следующая страница: TOP (limit + 1), z.id < before_id, has_more по лишней строке"""
+    server = FakeServer(rows=50)
+    source = make_source(server)
+
+    result = source.get_zakupki(limit=10, before_id=41)
+    query, params = server.queries[-1]
+    assert 'SELECT TOP (%s)' in query and 'ORDER BY z.id DESC' in query and 'OFFSET' not in query
+    assert params == (11, 41)
+    assert [row['id'] for row in result['data']] == list(range(40, 30, -1))
+    assert result['has_more'] and result['total'] == 50
+
+    result = source.get_zakupki(limit=10, before_id=6)
+    assert [row['id'] for row in result['data']] == [5, 4, 3, 2, 1]
+    assert not result['has_more']
+    print("✓ Следующая страница: TOP (limit + 1) и has_more")
+
+
+def test_keyset_params_order_with_filters():
+    """Параметры: limit + 1, затем фильтры, затем граница keyset"""
+    server = FakeServer(rows=50)
+    source = make_source(server)
+    date_from, date_to = datetime(2024, 1, 1), datetime(2024, 12, 31)
+
+    source.get_zakupki(date_from=date_from, date_to=date_to, limit=5, before_id=30)
+    query, params = server.queries[-1]
+    assert params == (6, date_from, date_to, 30)
+    assert query.index('z.created >= %s') < query.index('z.created <= %s') < query.index('z.id < %s')
+
+    source.get_zakupki(date_from=date_from, limit=5, after_id=20)
+    query, params = server.queries[-1]
+    assert params == (6, date_from, 20)
+    assert 'z.id > %s' in query and 'ORDER BY z.id ASC' in query
+    print("✓ Порядок параметров keyset-запроса")
+
+
+def test_previous_page_reversed_to_desc():
+    """Предыдущая страница читается по возрастанию id, возвращается новыми сверху"""
+    server = FakeServer(rows=50)
+    source = make_source(server)
+
+    result = source.get_zakupki(limit=10, after_id=20)
+    assert [row['id'] for row in result['data']] == list(range(30, 20, -1))
+    assert result['has_more']
+
+    result = source.get_zakupki(limit=10, after_id=45)
+    assert [row['id'] for row in result['data']] == [50, 49, 48, 47, 46]
+    assert not result['has_more']
+    print("✓ Предыдущая страница в порядке DESC")
+
+
+def test_companies_keyset_query():
+    """Предприятия: id страницы выбираются в CTE по фильтрам и границе keyset, справочники - JOIN к ним"""
+    server = FakeServer(rows=50)
+    source = make_source(server)
+
+    result = source.get_companies(id_rubric=3, id_city=7, limit=10, before_id=41)
+    query, params = server.queries[-1]
+    assert params == (11, 3, 7, 41)
+    assert ('WITH page_ids AS ( SELECT TOP (%s) c.id FROM db_companies c '
+            'WHERE c.id_rubric = %s AND c.id_city = %s AND c.id < %s ORDER BY c.id DESC )') in query
+    assert 'FROM page_ids p JOIN db_companies c ON c.id = p.id' in query
+    for join in ('LEFT JOIN db_rubrics r', 'LEFT JOIN db_subrubrics sr', 'LEFT JOIN db_cities ct'):
+        assert join in query
+    assert query.endswith('ORDER BY c.id DESC')
+    assert [row['id'] for row in result['data']] == list(range(40, 30, -1)) and result['has_more']
+
+    source.get_companies(id_subrubric=5, search_text='7707083893', limit=10, before_id=41)
+    query, params = server.queries[-1]
+    assert params == (11, 5, '7707083893', 41)
+    assert 'c.inn = CAST(%s AS varchar(12)) AND c.id < %s' in query
+    print("✓ Предприятия: CTE id страницы с фильтрами и keyset")
+
+
+def test_companies_previous_page():
+    """Предприятия: предыдущая страница по возрастанию id, возвращается новыми сверху"""
+    server = FakeServer(rows=50)
+    source = make_source(server)
+
+    result = source.get_companies(id_city=7, limit=10, after_id=20)
+    query, params = server.queries[-1]
+    assert params == (11, 7, 20)
+    assert 'c.id > %s ORDER BY c.id ASC )' in query and query.endswith('ORDER BY c.id ASC')
+    assert [row['id'] for row in result['data']] == list(range(30, 20, -1)) and result['has_more']
+
+    result = source.get_companies(limit=10, after_id=45)
+    assert [row['id'] for row in result['data']] == [50, 49, 48, 47, 46] and not result['has_more']
+    print("✓ Предприятия: предыдущая страница в порядке DESC")
+
+
+def make_app():
+    from app import create_app
+    from app.models import db, User
+
+    previous = os.environ.get('DATABASE_URL')
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    try:
+        app = create_app()
+    finally:
+        if previous is None:
+            del os.environ['DATABASE_URL']
+        else:
+            os.environ['DATABASE_URL'] = previous
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', role='admin', email_verified=True)
+        admin.set_password('secret')
+        db.session.add(admin)
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def link_params(html, endpoint_path):
+    """Параметры ссылок на endpoint_path из HTML страницы"""
+    import re
+    links = []
+    for href in re.findall(r"(?:href=\"|window.location=')([^\"']+)", html):
+        href = href.replace('&amp;', '&')
+        parts = urlsplit(href)
+        if parts.path == endpoint_path:
+            links.append({key: values[0] for key, values in parse_qs(parts.query).items()})
+    return links
+
+
+def test_companies_links_keep_cursor():
+    """Список предприятий и карточка передают курсор страницы в ссылках"""
+    from app.reference_cache import reference_cache
+    from app.result_cache import result_cache
+
+    server = FakeServer(rows=50)
+    source = make_source(server)
+    patched = {
+        (result_cache, 'get_companies'): lambda **params: source.get_companies(**params),
+        (result_cache, 'get_company'): lambda company_id: {'data': [{'id': company_id, 'company': 'Ромашка'}]},
+        (reference_cache, 'get_rubrics'): lambda: [],
+        (reference_cache, 'get_subrubrics'): lambda id_rubric=None: [],
+        (reference_cache, 'get_cities'): lambda: [],
+    }
+    for (obj, name), func in patched.items():
+        setattr(obj, name, func)
+    try:
+        client = make_app()
+        token = encode_page_cursor('next', 41)
+        response = client.get(f'/?db_type=companies&page=3&per_page=20&id_city=7&cursor={token}')
+        assert response.status_code == 200
+        assert server.queries[-1][1] == (21, 7, 41)
+
+        html = response.get_data(as_text=True)
+        rows = link_params(html, '/companies/40')
+        assert rows and rows[0]['cursor'] == token and rows[0]['page'] == '3'
+        # Кнопки "назад" / "вперед" несут курсор соседней страницы, номера страниц - без курсора
+        pages = {link['page']: link['cursor'] for link in link_params(html, '/') if 'cursor' in link}
+        assert {page: decode_page_cursor(token) for page, token in pages.items()} == {
+            '2': ('prev', 40), '4': ('next', 21)}
+
+        response = client.get(f'/companies/40?page=3&per_page=20&id_city=7&cursor={token}')
+        back = [link for link in link_params(response.get_data(as_text=True), '/')
+                if link.get('db_type') == 'companies' and 'page' in link]
+        assert back and all(link['cursor'] == token and link['page'] == '3' for link in back)
+    finally:
+        for obj, name in patched:
+            delattr(obj, name)
+    print("✓ Ссылки списка предприятий сохраняют курсор")
+
+
+if __name__ == '__main__':
+    print("=== Тесты keyset-пагинации ===\n")
+
+    try:
+        test_page_cursor_round_trip()
+        test_invalid_page_cursor()
+        test_next_page_top_limit_plus_one()
+        test_keyset_params_order_with_filters()
+        test_previous_page_reversed_to_desc()
+        test_companies_keyset_query()
+        test_companies_previous_page()
+        test_companies_links_keep_cursor()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Тесты для окна предпросмотра закупок (гостевой доступ, без реального сервера)
+"""
+import sys
+import os
+import time
+from datetime import datetime
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.mssql import MSSQLUnavailable
+from app.preview_window import PreviewWindow
+
+
+class FakeMSSQL:
+    """Последние закупки; down - сервер недоступен, counts - вызовы с фильтром (подсчет)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.down = False
+        self.counts = []
+
+    def get_zakupki(self, limit=100, offset=0, **kwargs):
+        if self.down:
+            raise MSSQLUnavailable('MSSQL недоступен')
+        self.calls += 1
+        if any(kwargs.values()):
+            self.counts.append(kwargs)
+            return {'data': [], 'total': 4321, 'total_approximate': False, 'total_capped': False}
+        data = [
+            {
+                'id': 100 - i,
+                'date_request': datetime(2024, 1, 1 + i),
+                'purchase_object': 'Поставка бумаги' if i % 2 else 'Ремонт кровли',
+                'customer': 'ГБУ Школа',
+                'email': 'buyer@school.ru',
+                'phone': '+79161234567',
+            }
+            for i in range(limit)
+        ]
+        return {'data': data, 'total': 18702724, 'total_approximate': True}
+
+
+def test_window_served_from_memory():
+    """Повторные гостевые страницы не обращаются к MSSQL"""
+    source = FakeMSSQL()
+    window = PreviewWindow(source, size=10, refresh_interval=3600)
+    window.refresh()
+
+    first = window.get_page(0, 5)
+    second = window.get_page(5, 5)
+
+    assert source.calls == 1
+    assert [r['id'] for r in first['data']] == [100, 99, 98, 97, 96]
+    assert [r['id'] for r in second['data']] == [95, 94, 93, 92, 91]
+    assert first['total'] == 18702724
+    print("✓ Страницы окна отдаются из памяти")
+
+
+def test_contacts_are_masked():
+    """Контакты в окне замаскированы заранее"""
+    window = PreviewWindow(FakeMSSQL(), size=3, refresh_interval=3600)
+    window.refresh()
+    row = window.get_page(0, 1)['data'][0]
+
+    assert row['email'] != 'buyer@school.ru' and '*' in row['email']
+    assert row['phone'] != '+79161234567' and '*' in row['phone']
+    print("✓ Контакты замаскированы")
+
+
+def test_filters_applied_in_memory():
+    """Фильтр по тексту и датам применяется к окну в памяти"""
+    source = FakeMSSQL()
+    window = PreviewWindow(source, size=10, refresh_interval=3600)
+    window.refresh()
+
+    result = window.get_page(0, 50, search_text='БУМАГ')
+    assert len(result['data']) == 5
+    assert all('бумаги' in r['purchase_object'] for r in result['data'])
+
+    result = window.get_page(0, 50, date_from=datetime(2024, 1, 3), date_to=datetime(2024, 1, 5))
+    assert [r['id'] for r in result['data']] == [98, 97, 96]
+    print("✓ Фильтры применяются в памяти")
+
+
+def test_filtered_total_from_whole_table():
+    """С фильтром показывается количество по всей таблице, без MSSQL - по окну (приблизительно)"""
+    source = FakeMSSQL()
+    window = PreviewWindow(source, size=10, refresh_interval=3600)
+    window.refresh()
+
+    result = window.get_page(0, 50, search_text='бумаг', date_from=datetime(2024, 1, 1))
+    assert result['total'] == 4321 and not result['total_approximate']
+    assert source.counts == [{'date_from': datetime(2024, 1, 1), 'date_to': None, 'search_text': 'бумаг'}]
+
+    source.down = True
+    result = window.get_page(0, 50, search_text='бумаг')
+    assert result['total'] == 5 and result['total_approximate']
+    print("✓ Количество с фильтром по всей таблице")
+
+
+def test_first_request_does_not_wait_for_mssql():
+    """До первого обновления гость получает пустую страницу, окно заполняется в фоне"""
+    source = FakeMSSQL()
+    source.down = True
+    window = PreviewWindow(source, size=10, refresh_interval=0.05)
+
+    result = window.get_page(0, 5)
+    assert result['data'] == [] and result['total'] == 0
+
+    source.down = False
+    deadline = time.time() + 5
+    while not window.get_page(0, 5)['data'] and time.time() < deadline:
+        time.sleep(0.02)
+    assert [r['id'] for r in window.get_page(0, 5)['data']] == [100, 99, 98, 97, 96]
+    print("✓ Первое обращение не ждет MSSQL")
+
+
+if __name__ == '__main__':
+    print("=== Тесты окна предпросмотра ===\n")
+
+    try:
+        test_window_served_from_memory()
+        test_contacts_are_masked()
+        test_filters_applied_in_memory()
+        test_filtered_total_from_whole_table()
+        test_first_request_does_not_wait_for_mssql()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Тесты для кэша справочников MSSQL (без реального сервера)
+"""
+import sys
+import os
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.reference_cache import ReferenceDataCache
+
+
+class FakeMSSQL:
+    """Источник справочников с подсчетом обращений"""
+
+    def __init__(self):
+        self.checksum = (1, 2, 3)
+        self.loads = 0
+        self.checksum_calls = 0
+
+    def get_reference_checksum(self):
+        self.checksum_calls += 1
+        return self.checksum
+
+    def get_rubrics(self):
+        self.loads += 1
+        return [{'id': 1, 'rubric': 'Строительство'}, {'id': 2, 'rubric': 'Торговля'}]
+
+    def get_subrubrics(self, id_rubric=None):
+        return [
+            {'id': 10, 'id_rubric': 1, 'subrubric': 'Бетон'},
+            {'id': 11, 'id_rubric': 1, 'subrubric': 'Кирпич'},
+            {'id': 20, 'id_rubric': 2, 'subrubric': 'Опт'},
+        ]
+
+    def get_cities(self):
+        return [{'id': 5, 'city': 'Москва'}]
+
+
+def test_reference_data_loaded_once():
+    """Повторные обращения не перечитывают таблицы"""
+    source = FakeMSSQL()
+    cache = ReferenceDataCache(source, ttl=600)
+
+    for _ in range(3):
+        cache.get_rubrics()
+        cache.get_cities()
+        cache.get_subrubrics(1)
+
+    assert source.loads == 1
+    print("✓ Справочники загружаются один раз")
+
+
+def test_subrubrics_filtered_in_memory():
+    """Подрубрики рубрики выбираются по индексу в памяти"""
+    cache = ReferenceDataCache(FakeMSSQL())
+
+    assert [s['id'] for s in cache.get_subrubrics(1)] == [10, 11]
+    assert [s['id'] for s in cache.get_subrubrics(2)] == [20]
+    assert cache.get_subrubrics(99) == []
+    assert len(cache.get_subrubrics()) == 3
+    print("✓ Подрубрики фильтруются в памяти")
+
+
+def test_refresh_only_when_checksum_changes():
+    """По истечении TTL таблицы перечитываются только при изменении контрольной суммы"""
+    source = FakeMSSQL()
+    cache = ReferenceDataCache(source, ttl=0)
+
+    cache.get_rubrics()
+    cache.get_rubrics()
+    assert source.loads == 1
+    assert cache.get_stats()['version'] == 1
+
+    source.checksum = (1, 2, 4)
+    cache.get_rubrics()
+    assert source.loads == 2
+    assert cache.get_stats()['version'] == 2
+    print("✓ Обновление по контрольной сумме")
+
+
+if __name__ == '__main__':
+    print("=== Тесты кэша справочников ===\n")
+
+    try:
+        test_reference_data_loaded_once()
+        test_subrubrics_filtered_in_memory()
+        test_refresh_only_when_checksum_changes()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Тесты компактных строк выборки MSSQL (app/rows.py)
+"""
+import sys
+import os
+import pickle
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from jinja2 import Environment
+
+from app import rows
+from app.rows import Row, row_type
+
+
+class FakeCursor:
+    """Курсор без as_dict, как у pymssql: кортежи значений и description"""
+
+    def __init__(self, columns, data):
+        self.description = [(name, 1, None, None, None, None, None) for name in columns]
+        self.data = list(data)
+
+    def fetchall(self):
+        return self.data
+
+    def fetchone(self):
+        return self.data[0] if self.data else None
+
+
+def test_dict_like_access():
+    """Доступ по ключу, атрибуту, get, in и dict(row) - как у строки as_dict"""
+    ZakupkaRow = row_type(('id', 'date_request', 'email'))
+    row = ZakupkaRow((7, '2024-01-01', 'a@b.ru'))
+
+    assert isinstance(row, Row) and isinstance(row, tuple)
+    assert row['date_request'] == '2024-01-01' and row.email == 'a@b.ru' and row[0] == 7
+    assert row.get('phone') is None and row.get('phone', '-') == '-' and row.get('id') == 7
+    assert 'email' in row and 'phone' not in row
+    assert dict(row) == {'id': 7, 'date_request': '2024-01-01', 'email': 'a@b.ru'}
+    assert list(row.keys()) == ['id', 'date_request', 'email'] and row.values() == (7, '2024-01-01', 'a@b.ru')
+
+    try:
+        row['phone']
+        assert False, "ожидалась KeyError"
+    except KeyError:
+        pass
+    try:
+        row.phone
+        assert False, "ожидалась AttributeError"
+    except AttributeError:
+        pass
+    print("✓ Доступ как у dict")
+
+
+def test_row_type_cache_and_special_columns():
+    """Класс строки общий для одинакового набора колонок; имена методов не перекрываются"""
+    assert row_type(('id', 'email')) is row_type([('id',), ('email',)])
+    assert row_type(('id', 'email')) is not row_type(('id', 'phone'))
+
+    row = row_type(('id', 'count', 'id'))((1, 5, 2))
+    # Повторяющаяся колонка - значение последней, как у as_dict
+    assert row['id'] == 2 and row.id == 2
+    assert row['count'] == 5 and row.count(5) == 1
+    assert row.__sizeof__() == (1, 5, 2).__sizeof__()
+    print("✓ Кэш классов и особые имена колонок")
+
+
+def test_template_access():
+    """Шаблон читает item.email и item['date_request'] так же, как у dict"""
+    template = Environment().from_string(
+        "{% for item in items %}{{ item.id }}:{{ item.email }}:{{ item['date_request'] }};{% endfor %}"
+        "{{ items[0].missing is undefined }}"
+    )
+    data = [(1, '2024-01-01', 'a@b.ru'), (2, '2024-01-02', None)]
+    ZakupkaRow = row_type(('id', 'date_request', 'email'))
+    html = template.render(items=[ZakupkaRow(values) for values in data])
+    assert html == "1:a@b.ru:2024-01-01;2:None:2024-01-02;True"
+    print("✓ Доступ из шаблона")
+
+
+def test_fetch_helpers_and_pickle():
+    """fetchall / fetchone строят Row по description курсора, Row переживает pickle"""
+    cursor = FakeCursor(('id', 'city'), [(1, 'Москва'), (2, 'Казань')])
+    result = rows.fetchall(cursor)
+    assert [row.city for row in result] == ['Москва', 'Казань']
+    assert rows.fetchone(cursor)['id'] == 1
+    assert rows.fetchall(FakeCursor(('id',), [])) == []
+    assert rows.fetchone(FakeCursor(('id',), [])) is None
+
+    restored = pickle.loads(pickle.dumps(result))
+    assert restored == result and restored[1].city == 'Казань'
+    print("✓ fetchall / fetchone и pickle")
+
+
+if __name__ == '__main__':
+    print("=== Тесты компактных строк выборки ===\n")
+
+    try:
+        test_dict_like_access()
+        test_row_type_cache_and_special_columns()
+        test_template_access()
+        test_fetch_helpers_and_pickle()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Тесты поиска по закупкам: стемминг, локальный инвертированный индекс, условия SQL
+"""
+import sys
+import os
+from datetime import datetime
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.search import InvertedIndex, ZakupkiSearch, build_fulltext_query, classify_company_search, tokenize
+
+
+ROWS = [
+    {'id': 1, 'created': datetime(2020, 3, 1), 'purchase_object': 'Поставка офисной бумаги', 'customer': 'ГБУ Школа №5'},
+    {'id': 2, 'created': datetime(2021, 6, 1), 'purchase_object': 'Ремонт кровли здания', 'customer': 'Администрация'},
+    {'id': 3, 'created': datetime(2023, 1, 10), 'purchase_object': 'Бумага для принтеров, бумага А4', 'customer': 'МБОУ Лицей'},
+    {'id': 4, 'created': datetime(2024, 5, 20), 'purchase_object': 'Поставки бумаги и канцтоваров', 'customer': 'Больница'},
+]
+
+
+def fake_fetch_batch(rows):
+    """Источник строк для индекса: id > after_id по возрастанию"""
+    def fetch(after_id, limit):
+        return [row for row in rows if row['id'] > after_id][:limit]
+    return fetch
+
+
+def test_tokenize_russian():
+    """Словоформы приводятся к одной основе, служебные слова отбрасываются"""
+    assert tokenize('Поставка бумаги') == tokenize('поставки бумага')
+    assert tokenize('Ремонт кровли и фасада') == tokenize('ремонта кровля фасад')
+    assert 'и' not in tokenize('бумага и картон', stemmed=False)
+    print("✓ Токенизация и стемминг")
+
+
+def test_search_all_terms_and_dates():
+    """Найдены только документы со всеми словами, фильтр по датам работает"""
+    search = ZakupkiSearch(backend='local', fetch_batch=fake_fetch_batch(ROWS), batch_size=2)
+    assert search.sync() == 4
+    assert search.indexed
+
+    result = search.index.search('поставка бумаги')
+    assert result['ids'] == [4, 1]
+    assert result['total'] == 2
+
+    result = search.index.search('бумага', date_from=datetime(2022, 1, 1))
+    assert result['ids'] == [4, 3]
+
+    assert search.index.search('бумага асфальт')['total'] == 0
+    print("✓ Поиск по всем словам и датам")
+
+
+def test_relevance_and_keyset():
+    """Ранжирование BM25 и keyset-страницы по id"""
+    index = InvertedIndex()
+    for row in ROWS:
+        index.add(row['id'], f"{row['purchase_object']} {row['customer']}", row['created'])
+
+    # В закупке 3 слово "бумага" встречается дважды в коротком тексте
+    assert index.search('бумага', order='relevance', limit=1)['ids'] == [3]
+
+    first = index.search('бумага', limit=2)
+    assert first['ids'] == [4, 3] and first['has_more']
+    second = index.search('бумага', limit=2, before_id=3)
+    assert second['ids'] == [1] and not second['has_more']
+    back = index.search('бумага', limit=2, after_id=1)
+    assert back['ids'] == [4, 3]
+    print("✓ Релевантность и keyset-пагинация")
+
+
+def test_incremental_sync():
+    """Новые закупки дозагружаются по id, повторная синхронизация ничего не читает"""
+    rows = list(ROWS[:2])
+    search = ZakupkiSearch(backend='local', fetch_batch=fake_fetch_batch(rows))
+    search.sync()
+    assert search.index.max_id == 2
+
+    rows.extend(ROWS[2:])
+    assert search.sync() == 2
+    assert search.sync() == 0
+    assert search.index.search('бумага')['total'] == 3
+
+    search.index.remove(3)
+    assert search.index.search('бумага')['ids'] == [4, 1]
+    print("✓ Инкрементальная дозагрузка индекса")
+
+
+def test_fulltext_where_clause():
+    """Условие CONTAINS для SQL Server и прежний LIKE"""
+    assert build_fulltext_query('Поставка "бумаги"') == \
+        'FORMSOF(INFLECTIONAL, "поставка") AND FORMSOF(INFLECTIONAL, "бумаги")'
+
+    clause, params = ZakupkiSearch(backend='fulltext').where_clause('бумага')
+    assert clause.startswith('CONTAINS(') and params == ['FORMSOF(INFLECTIONAL, "бумага")']
+
+    clause, params = ZakupkiSearch(backend='like').where_clause('бумага')
+    assert 'LIKE' in clause and params == ['%бумага%', '%бумага%']
+    assert not ZakupkiSearch(backend='like').indexed
+    print("✓ Условия поиска SQL")
+
+
+def test_classify_company_search():
+    """ИНН / ОГРН / начало номера отделяются от поиска по названию"""
+    assert classify_company_search('7707083893') == ('inn', '7707083893')
+    assert classify_company_search('ИНН 7707 083-893') == ('inn', '7707083893')
+    assert classify_company_search('500100732259') == ('inn', '500100732259')
+    assert classify_company_search('огрн: 1027700132195') == ('ogrn', '1027700132195')
+    assert classify_company_search('304500116000157') == ('ogrn', '304500116000157')
+    assert classify_company_search('77070') == ('digits', '77070')
+    assert classify_company_search(' Ромашка ') == ('text', 'Ромашка')
+    assert classify_company_search('Школа 5') == ('text', 'Школа 5')
+    print("✓ Разбор поиска предприятий")
+
+
+if __name__ == '__main__':
+    print("=== Тесты поиска по закупкам ===\n")
+
+    try:
+        test_tokenize_russian()
+        test_search_all_terms_and_dates()
+        test_relevance_and_keyset()
+        test_incremental_sync()
+        test_fulltext_where_clause()
+        test_classify_company_search()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Тесты заголовка Server-Timing (отдельное Flask приложение, без MSSQL)
+"""
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, render_template_string
+from sqlalchemy import create_engine, text
+
+from app import server_timing
+from app.metrics import metrics
+
+
+def make_app():
+    app = Flask(__name__)
+    server_timing.init_app(app)
+    engine = create_engine('sqlite://')
+
+    @app.route('/page')
+    def page():
+        with metrics.phase('connect'):
+            pass
+        with metrics.phase('count'):
+            pass
+        with metrics.phase('fetch'):
+            pass
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        return render_template_string('{{ value }}', value='ok')
+
+    @app.after_request
+    def after_request(response):
+        return server_timing.apply(response)
+
+    return app
+
+
+def parse(header):
+    timings = {}
+    for part in header.split(', '):
+        name = part.split(';')[0]
+        dur = [p for p in part.split(';') if p.startswith('dur=')][0]
+        timings[name] = float(dur[4:])
+    return timings
+
+
+def test_header_contains_phases():
+    """Ответ содержит фазы MSSQL, базы приложения, рендера и total"""
+    client = make_app().test_client()
+    response = client.get('/page')
+
+    timings = parse(response.headers['Server-Timing'])
+    assert set(timings) == {'mssql-connect', 'mssql-count', 'mssql-page', 'app-db', 'render', 'total'}
+    assert timings['total'] >= timings['render']
+    print("✓ Фазы в заголовке Server-Timing")
+
+
+def test_route_aggregate():
+    """Фазы копятся в агрегате по маршруту"""
+    server_timing.route_metrics.reset()
+    client = make_app().test_client()
+    client.get('/page')
+    client.get('/page')
+    client.get('/missing')
+
+    routes = {item['method']: item for item in server_timing.route_metrics.snapshot()}
+    assert list(routes) == ['page']
+    phases = dict(routes['page']['phases'])
+    assert phases['total']['count'] == 2 and phases['render']['count'] == 2
+    print("✓ Агрегаты по маршрутам")
+
+
+def test_failed_statement_does_not_leak_start():
+    """Упавший запрос учитывается и не сбивает время следующих запросов на том же подключении"""
+    app = Flask(__name__)
+    server_timing.init_app(app)
+    engine = create_engine('sqlite://')
+    connection = engine.connect()
+
+    @app.route('/fail')
+    def fail():
+        try:
+            connection.execute(text('SELECT * FROM missing_table'))
+        except Exception:
+            connection.rollback()
+        return 'ok'
+
+    @app.route('/ok')
+    def ok():
+        connection.execute(text('SELECT 1'))
+        return 'ok'
+
+    @app.after_request
+    def after_request(response):
+        return server_timing.apply(response)
+
+    client = app.test_client()
+    assert 'app-db' in parse(client.get('/fail').headers['Server-Timing'])
+    time.sleep(0.2)
+    # Со старой отметкой в conn.info запрос получил бы ~200 мс от упавшего
+    assert parse(client.get('/ok').headers['Server-Timing'])['app-db'] < 100
+    assert not connection.connection.info.get('_server_timing_start')
+    connection.close()
+    print("✓ Упавший запрос не сбивает время")
+
+
+def test_no_timings_outside_request():
+    """Фазы вне запроса (фоновые потоки) не ломают сбор и никуда не попадают"""
+    with metrics.phase('fetch'):
+        pass
+    assert server_timing._current() is None
+    print("✓ Вне запроса фазы игнорируются")
+
+
+if __name__ == '__main__':
+    print("=== Тесты Server-Timing ===\n")
+
+    try:
+        test_header_contains_phases()
+        test_route_aggregate()
+        test_failed_statement_does_not_leak_start()
+        test_no_timings_outside_request()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Тесты журнала медленных запросов MSSQL (без реального сервера)
+"""
+import sys
+import os
+import json
+import tempfile
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.slow_query_log import SlowQueryLog
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = 0
+        self._rows = []
+        self._showplan = False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(query)
+        if query == "SET SHOWPLAN_XML ON":
+            self._showplan = True
+            return
+        if query == "SET SHOWPLAN_XML OFF":
+            self._showplan = False
+            return
+        if self._showplan:
+            self.description = [('plan',)]
+            self._rows = [('<ShowPlanXML/>',)]
+            return
+        if query.startswith('SELECT'):
+            time.sleep(self.conn.delay)
+            self.description = [('id',)]
+            self._rows = [(1,), (2,), (3,)]
+        elif query.startswith('UPDATE'):
+            self.description = None
+            self.rowcount = 7
+        else:
+            raise RuntimeError('syntax error')
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def nextset(self):
+        return None
+
+
+class FakeConnection:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.executed = []
+        self.invalidated = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    @property
+    def raw(self):
+        return self
+
+    def invalidate(self):
+        self.invalidated = True
+
+    def close(self):
+        pass
+
+
+def test_disabled_by_default():
+    """Без порога подключение не оборачивается"""
+    log = SlowQueryLog()
+    conn = FakeConnection()
+    assert not log.enabled
+    assert log.wrap(conn) is conn
+    print("✓ По умолчанию журнал выключен")
+
+
+def test_slow_statement_recorded_with_params_and_rows():
+    """Медленный оператор попадает в журнал с параметрами и количеством строк, быстрый - нет"""
+    log = SlowQueryLog(threshold_ms=20)
+
+    cursor = log.wrap(FakeConnection(delay=0.0)).cursor()
+    cursor.execute("SELECT id FROM zakupki WHERE id > %s", (10,))
+    cursor.fetchall()
+    assert log.entries() == []
+
+    cursor = log.wrap(FakeConnection(delay=0.03)).cursor()
+    cursor.execute("SELECT id FROM zakupki WHERE id > %s", (10,))
+    assert cursor.fetchall() == [(1,), (2,), (3,)]
+
+    entries = log.entries()
+    assert len(entries) == 1
+    entry = entries[0]
+    assert entry['params'] == [10] and entry['rows'] == 3
+    assert entry['duration_ms'] >= 20 and entry['plan'] is None
+    assert log.get(entry['id']) is entry
+    print("✓ Медленный оператор записан")
+
+
+def test_plan_captured_and_file_written():
+    """План снимается через SHOWPLAN_XML, запись дублируется в файл"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'slow.log')
+        log = SlowQueryLog(threshold_ms=0.001, path=path, capture_plan=True)
+        conn = FakeConnection(delay=0.001)
+
+        cursor = log.wrap(conn).cursor()
+        cursor.execute("SELECT id FROM zakupki")
+        cursor.fetchall()
+
+        entry = log.entries()[0]
+        assert entry['plan'] == '<ShowPlanXML/>'
+        assert conn.executed[-1] == "SET SHOWPLAN_XML OFF"
+        assert not conn.invalidated
+
+        for handler in log._logger.handlers:
+            handler.flush()
+        with open(path, encoding='utf-8') as f:
+            line = json.loads(f.readline())
+        assert line['sql'] == "SELECT id FROM zakupki" and line['rows'] == 3
+
+        for handler in list(log._logger.handlers):
+            handler.close()
+            log._logger.removeHandler(handler)
+    print("✓ План и файл журнала")
+
+
+def test_dml_and_errors():
+    """DML записывается сразу после execute, ошибки - с текстом ошибки"""
+    log = SlowQueryLog(threshold_ms=0.0001, size=2)
+    cursor = log.wrap(FakeConnection()).cursor()
+
+    cursor.execute("UPDATE zakupki SET status = 1")
+    assert log.entries()[0]['rows'] == 7
+
+    try:
+        cursor.execute("BROKEN")
+    except RuntimeError:
+        pass
+    assert log.entries()[0]['error'] == 'syntax error'
+
+    cursor.execute("UPDATE zakupki SET status = 2")
+    assert len(log.entries()) == 2  # кольцевой буфер
+    log.clear()
+    assert log.entries() == []
+    print("✓ DML, ошибки и размер буфера")
+
+
+if __name__ == '__main__':
+    print("=== Тесты журнала медленных запросов ===\n")
+
+    try:
+        test_disabled_by_default()
+        test_slow_statement_recorded_with_params_and_rows()
+        test_plan_captured_and_file_written()
+        test_dml_and_errors()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Тесты консоли SQL: постраничное чтение, лимит строк, выгрузка (без реального сервера)
+"""
+import sys
+import os
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import mssql as mssql_module
+from app.metrics import metrics
+from app.mssql_pool import ConnectionPool
+from app.sql_console import SQLConsole
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self.server = server
+        self.description = None
+        self.rowcount = -1
+        self._rows = iter(())
+
+    def execute(self, query, params=None):
+        if query.startswith('SELECT'):
+            self.description = [('id',), ('name',)]
+            self._rows = iter([(i, f'row {i}') for i in range(self.server.rows)])
+        else:
+            self.description = None
+            self.rowcount = 3
+
+    def fetchmany(self, size=None):
+        batch = []
+        for row in self._rows:
+            batch.append(row)
+            self.server.fetched += 1
+            if len(batch) >= size:
+                break
+        return batch
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.server)
+
+    def commit(self):
+        self.server.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetched = 0
+        self.commits = 0
+
+
+class FakeCounts:
+    def invalidate(self):
+        pass
+
+
+class FakeMSSQL:
+    def __init__(self, server):
+        self.pool = ConnectionPool(lambda: FakeConnection(server), name='utf16', ping_after=3600)
+        self.counts = FakeCounts()
+
+    def get_console_connection(self):
+        return self.pool.acquire()
+
+
+def test_pages_from_open_cursor():
+    """Страницы читаются из открытого курсора, строки не выбираются наперед"""
+    server = FakeServer(rows=25)
+    mssql = FakeMSSQL(server)
+    console = SQLConsole(mssql, page_size=10, max_rows=100)
+
+    result = console.execute('SELECT * FROM zakupki')
+    assert result['columns'] == ['id', 'name']
+    assert result['data'][0] == (0, 'row 0') and result['rowcount'] == 10
+    assert result['has_more'] and result['cursor_id']
+    assert server.fetched == 11
+    assert mssql.pool.get_stats()['in_use'] == 1
+
+    result = console.fetch_next(result['cursor_id'])
+    assert result['offset'] == 10 and result['data'][0][0] == 10
+    result = console.fetch_next(result['cursor_id'])
+    assert result['rowcount'] == 5 and not result['has_more'] and result['cursor_id'] is None
+    assert not result['truncated']
+    # Выборка дочитана - подключение вернулось в пул
+    assert mssql.pool.get_stats()['in_use'] == 0 and mssql.pool.get_stats()['idle'] == 1
+    print("✓ Постраничное чтение из открытого курсора")
+
+
+def test_row_cap_truncates():
+    """После max_rows выборка закрывается с пометкой truncated, подключение не возвращается в пул"""
+    server = FakeServer(rows=1000000)
+    mssql = FakeMSSQL(server)
+    console = SQLConsole(mssql, page_size=10, max_rows=15)
+
+    result = console.execute('SELECT * FROM zakupki')
+    result = console.fetch_next(result['cursor_id'])
+    assert result['rowcount'] == 5 and result['truncated'] and not result['has_more']
+    assert server.fetched == 16
+    assert mssql.pool.get_stats()['in_use'] == 0 and mssql.pool.get_stats()['idle'] == 0
+    print("✓ Лимит строк и пометка обрезки")
+
+
+def test_cursor_registry_limit():
+    """Открытых выборок не больше max_cursors - самая давняя закрывается"""
+    server = FakeServer(rows=100)
+    mssql = FakeMSSQL(server)
+    console = SQLConsole(mssql, page_size=10, max_rows=100, max_cursors=1)
+
+    first = console.execute('SELECT * FROM zakupki')
+    second = console.execute('SELECT * FROM zakupki')
+    assert console.fetch_next(first['cursor_id']) is None
+    assert console.fetch_next(second['cursor_id'])['offset'] == 10
+    assert console.get_stats()['open_cursors'] == 1
+    assert mssql.pool.get_stats()['in_use'] == 1
+    print("✓ Ограничение открытых выборок")
+
+
+def test_csv_rows_and_dml():
+    """Выгрузка читает строки порциями; DML выполняется с commit"""
+    server = FakeServer(rows=25)
+    mssql = FakeMSSQL(server)
+    console = SQLConsole(mssql, page_size=10)
+
+    columns, rows = console.iter_rows('SELECT * FROM zakupki', batch_size=10)
+    assert columns == ['id', 'name'] and server.fetched == 0
+    assert len(list(rows)) == 25
+    assert mssql.pool.get_stats()['in_use'] == 0
+
+    result = console.execute('UPDATE zakupki SET customer = NULL')
+    assert result['success'] and result['rowcount'] == 3 and server.commits == 1
+    print("✓ Выгрузка порциями и DML")
+
+
+def test_console_metrics():
+    """Запросы консоли пишутся в метрики: total и фаза fetch"""
+    server = FakeServer(rows=25)
+    console = SQLConsole(FakeMSSQL(server), page_size=10)
+
+    def counts():
+        methods = {item['method']: dict(item['phases']) for item in metrics.snapshot()}
+        return {name: methods.get(name, {}).get(phase, {}).get('count', 0)
+                for name, phase in (('execute_query', 'total'), ('execute_query', 'fetch'),
+                                    ('execute_query_next', 'fetch'), ('execute_query_csv', 'total'))}
+
+    before = counts()
+    result = console.execute('SELECT * FROM zakupki')
+    console.fetch_next(result['cursor_id'])
+    console.iter_rows('SELECT * FROM zakupki')
+    after = counts()
+    assert all(after[key] == before[key] + 1 for key in after), (before, after)
+    print("✓ Метрики консоли")
+
+
+def test_console_connection_timeout():
+    """Подключение консоли открывается без таймаута запросов страниц (MSSQL_QUERY_TIMEOUT)"""
+    opened = []
+
+    def connect(**params):
+        opened.append(params['timeout'])
+        return FakeConnection(FakeServer(rows=1))
+
+    source = mssql_module.MSSQLConnection()
+    source.query_timeout, source.console_query_timeout = 30, 0
+    original = mssql_module.pymssql.connect
+    mssql_module.pymssql.connect = connect
+    try:
+        source.get_console_connection().close()
+        source.get_connection().close()
+    finally:
+        mssql_module.pymssql.connect = original
+    assert opened == [0, 30]
+    assert source.console_pool.get_stats()['idle'] == 1 and source.pool.get_stats()['idle'] == 1
+    print("✓ Отдельный пул консоли без таймаута запроса")
+
+
+if __name__ == '__main__':
+    print("=== Тесты консоли SQL ===\n")
+
+    try:
+        test_pages_from_open_cursor()
+        test_row_cap_truncates()
+        test_cursor_registry_limit()
+        test_csv_rows_and_dml()
+        test_console_metrics()
+        test_console_connection_timeout()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Тесты фонового выполнения запросов консоли SQL: история, отмена через KILL
+"""
+import sys
+import os
+import threading
+import time
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+from app.models import db, User, SQLQueryHistory
+from app.sql_jobs import SQLJobManager, SQLJobQueueFull
+
+
+class FakeKillConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def autocommit(self, value):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, query):
+        self.server.killed.append(query)
+        self.server.release.set()
+
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeMSSQL:
+    def __init__(self):
+        self.killed = []
+        self.release = threading.Event()
+
+    def get_console_connection(self):
+        return FakeKillConnection(self)
+
+
+class FakeConsole:
+    """Консоль: SELECT возвращает страницу, WAITFOR ждет KILL, UPDATE изменяет строки
+
+    before_spid - событие, до которого запрос ждет перед чтением @@SPID;
+    after_execute - функция, вызываемая после выполнения запроса.
+    """
+
+    def __init__(self):
+        self.mssql = FakeMSSQL()
+        self.closed = []
+        self.executed = []
+        self.before_spid = None
+        self.after_execute = None
+
+    def execute(self, query, on_spid=None):
+        if self.before_spid is not None:
+            self.before_spid.wait(5)
+        try:
+            on_spid(57)
+        except Exception as e:
+            # Как SQLConsole: исключение из on_spid - ошибка, запрос не выполняется
+            return {'success': False, 'error': str(e), 'columns': [], 'data': [], 'rowcount': 0,
+                    'has_more': False, 'cursor_id': None}
+        self.executed.append(query)
+        if self.after_execute is not None:
+            self.after_execute()
+        if query.startswith('UPDATE'):
+            return {'success': True, 'columns': [], 'data': [], 'rowcount': 3, 'has_more': False,
+                    'cursor_id': None, 'query_time': 1.0, 'error': None}
+        if query.startswith('WAITFOR'):
+            self.mssql.release.wait(5)
+            return {'success': False, 'error': 'DBPROCESS is dead', 'columns': [], 'data': [], 'rowcount': 0,
+                    'has_more': False, 'cursor_id': None}
+        return {'success': True, 'columns': ['id'], 'data': [(1,), (2,)], 'rowcount': 2, 'has_more': True,
+                'cursor_id': 'c1', 'query_time': 1.0, 'error': None}
+
+    def close(self, cursor_id):
+        self.closed.append(cursor_id)
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', role='admin')
+        admin.set_password('secret')
+        db.session.add(admin)
+        db.session.commit()
+    return app
+
+
+def wait_finished(job):
+    for _ in range(200):
+        if job.finished:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"запрос не завершился: {job.status}")
+
+
+def test_job_result_and_history():
+    """Запрос выполняется в фоне, история хранит статус, длительность и строки"""
+    app = make_app()
+    manager = SQLJobManager(FakeConsole())
+
+    with app.app_context():
+        job = manager.submit(app, 1, 'SELECT id FROM zakupki')
+    wait_finished(job)
+    assert job.status == 'done' and job.result['rowcount'] == 2
+    assert job.to_dict()['rowcount'] == 2
+
+    with app.app_context():
+        history = db.session.get(SQLQueryHistory, job.history_id)
+        assert history.status == 'done' and history.rowcount == 2 and history.has_more
+        assert history.duration_ms is not None and history.finished_at is not None
+    print("✓ Результат и история запроса")
+
+
+def test_cancel_kills_session():
+    """Отмена выполняющегося запроса - KILL его сессии, статус canceled"""
+    app = make_app()
+    console = FakeConsole()
+    manager = SQLJobManager(console)
+
+    with app.app_context():
+        job = manager.submit(app, 1, 'WAITFOR DELAY \'01:00:00\'')
+    for _ in range(200):
+        if job.spid is not None:
+            break
+        time.sleep(0.01)
+
+    assert manager.cancel(job.id)
+    wait_finished(job)
+    assert console.mssql.killed == ['KILL 57']
+    assert job.status == 'canceled'
+    assert not manager.cancel(job.id)
+
+    with app.app_context():
+        assert db.session.get(SQLQueryHistory, job.history_id).status == 'canceled'
+    print("✓ Отмена через KILL")
+
+
+def test_cancel_before_spid():
+    """Отмена до получения номера сессии - запрос не выполняется, KILL не нужен"""
+    app = make_app()
+    console = FakeConsole()
+    console.before_spid = threading.Event()
+    manager = SQLJobManager(console)
+
+    with app.app_context():
+        job = manager.submit(app, 1, 'UPDATE zakupki SET customer = NULL')
+    for _ in range(200):
+        if job.status == 'running':
+            break
+        time.sleep(0.01)
+
+    assert job.spid is None
+    assert manager.cancel(job.id)
+    console.before_spid.set()
+    wait_finished(job)
+    assert job.status == 'canceled' and console.executed == []
+    assert console.mssql.killed == []
+    print("✓ Отмена до получения номера сессии")
+
+
+def test_cancel_after_statement_completed():
+    """Отмена опоздала: выполненный запрос записывается с настоящим результатом"""
+    app = make_app()
+    console = FakeConsole()
+    manager = SQLJobManager(console)
+    holder = {}
+    console.after_execute = lambda: manager.cancel(holder['job'].id)
+
+    from app.result_cache import result_cache
+    result_cache._cache.set('page', {'data': []})
+    with app.app_context():
+        console.before_spid = threading.Event()
+        holder['job'] = job = manager.submit(app, 1, 'UPDATE zakupki SET customer = NULL')
+        console.before_spid.set()
+    wait_finished(job)
+    assert job.cancel_requested and job.status == 'done' and job.result['rowcount'] == 3
+    assert result_cache._cache.get('page') is None
+
+    with app.app_context():
+        history = db.session.get(SQLQueryHistory, job.history_id)
+        assert history.status == 'done' and history.rowcount == 3
+    print("✓ Опоздавшая отмена не скрывает выполненный запрос")
+
+
+def test_queue_limit():
+    """Незавершенных запросов не больше max_pending"""
+    app = make_app()
+    console = FakeConsole()
+    manager = SQLJobManager(console, workers=1, max_pending=1)
+
+    with app.app_context():
+        job = manager.submit(app, 1, 'WAITFOR DELAY \'01:00:00\'')
+        try:
+            manager.submit(app, 1, 'SELECT 1')
+            assert False, "ожидалась SQLJobQueueFull"
+        except SQLJobQueueFull:
+            pass
+    console.mssql.release.set()
+    wait_finished(job)
+    assert manager.get_stats()['failed'] == 1
+    print("✓ Ограничение очереди")
+
+
+if __name__ == '__main__':
+    print("=== Тесты фоновых запросов консоли SQL ===\n")
+
+    try:
+        test_job_result_and_history()
+        test_cancel_kills_session()
+        test_cancel_before_spid()
+        test_cancel_after_statement_completed()
+        test_queue_limit()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)
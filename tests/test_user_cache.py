@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Тесты кэша пользователей (user_loader) на SQLite в памяти
+"""
+import sys
+import os
+
+# Добавляем корневую директорию в PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import event
+
+from app.models import db, User
+from app.user_cache import UserCache
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='ivan', email='ivan@example.com', balance=100, role='user')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def count_selects(app):
+    selects = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+    return selects
+
+
+def test_cached_load_without_select():
+    """Повторная загрузка пользователя не выполняет SELECT"""
+    app = make_app()
+    cache = UserCache(ttl=60)
+    selects = count_selects(app)
+
+    with app.app_context():
+        user = cache.load(1)
+        assert user.username == 'ivan'
+    first = len(selects)
+    assert first >= 1
+
+    with app.app_context():
+        user = cache.load(1)
+        assert user.username == 'ivan' and float(user.balance) == 100
+        assert user.has_positive_balance() and not user.is_admin()
+    assert len(selects) == first
+    print("✓ Пользователь из кэша без SELECT")
+
+
+def test_changes_of_restored_user_are_saved():
+    """Изменения восстановленного из кэша пользователя сохраняются commit()"""
+    app = make_app()
+    cache = UserCache(ttl=60)
+
+    with app.app_context():
+        cache.load(1)
+    with app.app_context():
+        user = cache.load(1)
+        user.role = 'admin'
+        db.session.commit()
+        cache.invalidate(user.id)
+
+    with app.app_context():
+        assert User.query.get(1).role == 'admin'
+        assert cache.load(1).is_admin()
+    print("✓ Изменения сохраняются, сброс перечитывает пользователя")
+
+
+def test_stale_until_invalidated_and_disabled_mode():
+    """Без сброса кэш отдает снимок; при ttl=0 пользователь читается из базы"""
+    app = make_app()
+    cache = UserCache(ttl=60)
+
+    with app.app_context():
+        cache.load(1)
+        User.query.get(1).balance = 0
+        db.session.commit()
+    with app.app_context():
+        assert float(cache.load(1).balance) == 100
+        cache.invalidate(1)
+        assert float(cache.load(1).balance) == 0
+
+    disabled = UserCache(ttl=0)
+    with app.app_context():
+        assert not disabled.enabled
+        assert disabled.load(1).username == 'ivan'
+        assert disabled.load(42) is None
+    print("✓ Сброс и выключенный кэш")
+
+
+if __name__ == '__main__':
+    print("=== Тесты кэша пользователей ===\n")
+
+    try:
+        test_cached_load_without_select()
+        test_changes_of_restored_user_are_saved()
+        test_stale_until_invalidated_and_disabled_mode()
+        print("\n✓ Все тесты пройдены!")
+    except Exception as e:
+        print(f"\n✗ Тесты провалены: {e}")
+        sys.exit(1)